@@ -185,13 +185,15 @@ for i in range(1, 5):
 
 """ Определяю функции для отрисовки подзаголовков таблицы
 """
+# шапка подзаголовка создается один раз: при первом выводе она компилируется, и дальше
+# выводится готовым шаблоном
+colheaders = [ THC("р. {0:d}".format(i)) for i in range(1, 5) ]
+my_subtitle_header = XLSTableHeader( columns=[
+        THC('Составной подзаголовок модели', struct=colheaders)],
+        row_height=16 )
+
 def my_header_func(ws, row_data, cur_row, first_col):
     # в функции подзаголовка можно рисовать как обычно, и в том числе вызывать методы report
-    colheaders = [ THC("р. {0:d}".format(i)) for i in range(1, 5) ]
-    my_subtitle_header = XLSTableHeader( columns=[
-            THC('Составной подзаголовок модели', struct=colheaders)],
-            row_height=16 )
-
     cur_row = rep.print_tableheader(my_subtitle_header, first_row=cur_row, first_col=first_col + 3)
     return cur_row
 
@@ -228,6 +230,8 @@ table6.hierarchy_append('ArticleGlobalCode', merging=True, subtitle=my_header_fu
         subtotal=['Sum1', 'Sum2', 'Sum3', 'Sum4'])
 table6.hierarchy_append('OItemColorName',
         subtotal=['Sum1', 'Sum2', 'Sum3', 'Sum4'])
+# строка общего итога в конце таблицы
+table6.set_grand_total(['Sum1', 'Sum2', 'Sum3', 'Sum4'])
 
 cur_row += 1
 cur_row = rep.print_label(XLSLabel('Таблица всё вместе', LabelHeading.h3),
@@ -0,0 +1,77 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Группировка и агрегаты (XLSTable.group_by_data): векторный расчет через numpy и расчет по
+значениям Python дают одинаковые итоги на датах, NaN и None
+"""
+
+import datetime
+import unittest
+
+try:
+    import numpy as np
+except ImportError:
+    np = None # module numpy doesn't exists
+
+from xlsreport.xlstable import XLSTableField as TF
+from xlsreport.xlsreport import XLSReport, XLSTable
+
+INFO = (TF('branch'), TF('day', 'date'), TF('price', '3digit'), TF('qty', 'int'))
+TOTALS = (TF('branch'), TF('first_day', 'date'), TF('last_day', 'date'),
+          TF('price', '3digit'), TF('price_count', 'int'), TF('price_max', '3digit'), TF('qty', 'int'))
+AGGREGATES = {'first_day': ('min', 'day'), 'last_day': ('max', 'day'), 'price': 'sum',
+              'price_count': ('count', 'price'), 'price_max': ('max', 'price'), 'qty': 'sum'}
+
+EXPECTED = [('a', datetime.date(2024, 1, 5), datetime.date(2024, 1, 10), 1.5, 1, 1.5, 1),
+            ('b', datetime.date(2024, 2, 1), datetime.date(2024, 2, 1), 6.0, 2, 4.0, 3)]
+
+@unittest.skipIf(np is None, "нет модуля numpy")
+class GroupByDataTest(unittest.TestCase):
+    def columns(self):
+        return dict(branch=np.array(['a', 'a', 'b', 'b']),
+                    day=np.array(['2024-01-10', '2024-01-05', '2024-02-01', 'NaT'], dtype='datetime64[D]'),
+                    price=np.array([1.5, np.nan, 2.0, 4.0]),
+                    qty=np.array([1, None, 3, None], dtype=object))
+
+    def rows(self):
+        return [['a', datetime.date(2024, 1, 10), 1.5, 1], ['a', datetime.date(2024, 1, 5), float('nan'), None],
+                ['b', datetime.date(2024, 2, 1), 2.0, 3], ['b', None, 4.0, None]]
+
+    def test_columnar_vectorized_and_python(self):
+        for vectorized in (True, False):
+            table = XLSTable(INFO, self.columns())
+            result = table.group_by_data(TOTALS, ['branch'], aggregates=AGGREGATES, vectorized=vectorized)
+            self.assertEqual(result, EXPECTED, vectorized)
+            self.assertIs(type(result[0][1]), datetime.date)
+
+    def test_rows_vectorized_and_python(self):
+        for vectorized in (True, False):
+            table = XLSTable(INFO, self.rows())
+            result = table.group_by_data(TOTALS, ['branch'], aggregates=AGGREGATES, vectorized=vectorized)
+            self.assertEqual(result, EXPECTED, vectorized)
+
+    def test_date_totals_render(self):
+        table = XLSTable(INFO, self.columns())
+        totals = XLSTable(TOTALS, table.group_by_data(TOTALS, ['branch'], aggregates=AGGREGATES))
+        rep = XLSReport('S')
+        rep.print_table(totals, 1)
+        self.assertEqual(rep._ws.cell(row=1, column=3).value, datetime.date(2024, 1, 10))
+
+    def test_nan_is_null_for_hide_conditions(self):
+        """условие 'null' одинаково по статистике колонки и по значениям строк
+        """
+        for data in ({'price': np.array([np.nan, np.nan]), 'qty': np.array([1, 2])},
+                     [[float('nan'), 1], [None, 2]]):
+            table = XLSTable((TF('price', '3digit'), TF('qty', 'int')), data)
+            table.add_hide_column_condition('price', 'null')
+            table.set_calculating(lambda row: None) # условия проверяются по ходу вывода
+            rep = XLSReport('S')
+            rep.print_table(table, 1)
+            self.assertTrue(rep._ws.column_dimensions['A'].hidden)
+
+            table = XLSTable((TF('price', '3digit'), TF('qty', 'int')), data)
+            table.add_hide_column_condition('price', 'null')
+            self.assertTrue(table.column_stats(['price'])['price'].all_null)
+
+if __name__ == '__main__':
+    unittest.main()
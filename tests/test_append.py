@@ -0,0 +1,122 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Дозапись строк в таблицу сохраненного отчета (xlsappend): отчет, выведенный частями с дозаписью,
+совпадает с отчетом, выведенным целиком
+"""
+
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from openpyxl import Workbook, load_workbook
+import openpyxl.reader.excel as excel_reader
+
+from xlsreport.xlstable import XLSTableField as TF
+from xlsreport.xlsreport import XLSReport, XLSTable
+from xlsreport.xlsappend import *
+
+INFO = (TF('Art'), TF('Color', col_count=2), TF('Sum1', 'int'), TF('Sum2', 'int'), TF('Sum3', 'int'),
+        TF('', 'string'))
+ROWS = [['A1', 'black', 50, 0, 150, 'x'], ['A1', 'black', 50, 0, 150, 'y'], ['A1', 'white', 1, 0, 2, 'z'],
+        ['A2', 'white', 0, 0, 150, 'd'], ['A3', 'white', 0, 0, 150, 'q'], ['A3', 'black', 0, 0, 150, 'w'],
+        ['A3', 'black', 0, 7, 150, 'e'], ['A3', 'red', 50, 0, 150, 'r'], ['A4', 'yellow', 5, 0, 1, 't']]
+
+def _table(rows, subtotal_mode):
+    table = XLSTable(INFO, [list(row) for row in rows], row_height=20, subtotal_mode=subtotal_mode)
+    table.hierarchy_append('Art', merging=True, subtotal=['Sum1', 'Sum2', 'Sum3'])
+    table.hierarchy_append('Color', merging=True, subtotal=['Sum1', 'Sum3'])
+    table.set_grand_total(['Sum1', 'Sum2', 'Sum3'])
+    return table
+
+def _snapshot(path):
+    """значения, объединения, уровни группировки и действующие высоты строк листа
+    """
+    ws = load_workbook(path).active
+    default = ws.sheet_format.defaultRowHeight
+    rows = dict()
+    for r in range(1, ws.max_row + 1):
+        dim = ws.row_dimensions.get(r)
+        rows[r] = ((dim.height if (dim is not None) and (dim.height is not None) else default),
+                   (dim.outlineLevel if dim is not None else 0))
+    values = {c.coordinate: c.value for row in ws.iter_rows() for c in row if c.value is not None}
+    return dict(values=values, merges=sorted(str(m) for m in ws.merged_cells.ranges), rows=rows)
+
+class AppendTableTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def render(self, parts, subtotal_mode):
+        """выводит ROWS частями parts (первая - print_table, остальные - append_table после
+        сохранения и открытия отчета); возвращает снимок листа
+        """
+        path = os.path.join(self.directory, 'r.xlsx')
+        rep = XLSReport('S')
+        rep.print_table(_table(parts[0], subtotal_mode), 2, name='t')
+        rep.save(path)
+        for part in parts[1:]:
+            rep = XLSReport.open(path)
+            rep.append_table(_table(part, subtotal_mode), 't')
+            rep.save(path)
+        return _snapshot(path)
+
+    def test_append_matches_full_render(self):
+        """дозапись после первой строки, внутри открытой группы и на границе групп первого уровня
+        """
+        for subtotal_mode in ('formula', 'cached', 'static'):
+            full = self.render([ROWS], subtotal_mode)
+            for cut in (1, 2, 5, 7):
+                with self.subTest(subtotal_mode=subtotal_mode, cut=cut):
+                    self.assertEqual(self.render([ROWS[:cut], ROWS[cut:]], subtotal_mode), full)
+
+    def test_several_appends(self):
+        full = self.render([ROWS], 'cached')
+        self.assertEqual(self.render([ROWS[:1], ROWS[1:4], ROWS[4:6], ROWS[6:]], 'cached'), full)
+
+    def test_table_state(self):
+        path = os.path.join(self.directory, 'r.xlsx')
+        rep = XLSReport('S')
+        rep.print_table(_table(ROWS[:5], 'cached'), 2, name='t')
+        rep.save(path)
+
+        wb = load_report(path)
+        self.assertEqual(table_names(wb), ['t'])
+        state = load_table_state(wb, 't')
+        self.assertEqual(state['rows'], 5)
+        self.assertEqual([value for _, value, _ in state['open']], ['A3', 'white'])
+        self.assertGreater(frozen_row(wb.active), 1)
+
+    def test_reader_is_not_shared(self):
+        """разбор листов отчета не подменяет разбор листов в load_workbook других потоков
+        """
+        path = os.path.join(self.directory, 'r.xlsx')
+        rep = XLSReport('S')
+        rep.print_table(_table(ROWS, 'cached'), 2, name='t')
+        rep.save(path)
+        other = os.path.join(self.directory, 'other.xlsx')
+        wb = Workbook()
+        wb.active.title = 'S'
+        for r in range(1, 30):
+            wb.active.cell(row=r, column=1).value = r
+        wb.save(other)
+
+        reader = excel_reader.WorksheetReader
+        frozen = []
+        def _load_other():
+            for _ in range(20):
+                frozen.append(getattr(load_workbook(other).active, '_frozen_rows', None))
+        thread = threading.Thread(target=_load_other)
+        thread.start()
+        for _ in range(20):
+            load_report(path)
+        thread.join()
+        self.assertEqual(frozen, [None] * 20)
+        self.assertIs(excel_reader.WorksheetReader, reader)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Функции раскраски и расчета таблицы: строка как XLSRowView, пакетные функции по порциям строк,
+запоминание результатов по полям depends_on
+"""
+
+import unittest
+
+from xlsreport.xlstable import XLSTableField as TF
+from xlsreport.xlsreport import XLSReport, XLSTable
+from xlsreport.xlscolor import Color
+
+INFO = (TF('group'), TF('qty', 'int'), TF('price', 'currency'))
+ROWS = [['a', 1, 10.0], ['a', 2, 20.0], ['b', 3, 30.0], ['b', 4, 40.0], ['a', 5, 50.0]]
+
+def _fill(rep, row, col):
+    return rep._ws.cell(row=row, column=col).fill.fgColor.rgb[-6:]
+
+class CallbacksTest(unittest.TestCase):
+    def test_memoized_per_apply(self):
+        """результат запоминается по значениям depends_on в пределах одного вывода таблицы
+        """
+        palette = {'a': Color.RED, 'b': Color.GREEN}
+        calls = []
+        def _color(row):
+            calls.append(row['group'])
+            return palette[row['group']]
+
+        table = XLSTable(INFO, [list(row) for row in ROWS])
+        table.add_coloring('qty', _color, depends_on=['group'])
+        rep = XLSReport('S')
+        rep.print_table(table, 1)
+        self.assertEqual(calls, ['a', 'b'])
+        self.assertEqual([_fill(rep, r, 2) for r in (1, 3, 5)], ['FDBDC1', 'A8F1CC', 'FDBDC1'])
+
+        # второй вывод той же таблицы не получает цвета, рассчитанные первым
+        palette['a'] = Color.BLUE
+        rep = XLSReport('S')
+        rep.print_table(table, 1)
+        self.assertEqual(calls, ['a', 'b', 'a', 'b'])
+        self.assertEqual(_fill(rep, 1, 2), 'B7CAF7')
+
+    def test_unknown_depends_on(self):
+        table = XLSTable(INFO, ROWS)
+        with self.assertRaisesRegex(AssertionError, "нет поля 'color'"):
+            table.add_coloring('qty', lambda row: Color.RED, depends_on=['color'])
+
+    def test_row_view_and_batch_calculation(self):
+        """пакетный расчет видит всю порцию строк, построчный - изменения пакетного
+        """
+        def _batch(rows):
+            total = sum(rows.column('qty'))
+            for row in rows:
+                row['price'] = row['qty'] * 100 / total
+
+        def _row(row):
+            row['qty'] = row['qty'] * 10
+            self.assertEqual(dict(row)['group'], row['group'])
+
+        table = XLSTable(INFO, [list(row) for row in ROWS])
+        table.set_calculating_batch(_batch)
+        table.set_calculating(_row)
+        rep = XLSReport('S')
+        rep.print_table(table, 1)
+        ws = rep._ws
+        self.assertEqual([ws.cell(row=r, column=2).value for r in range(1, 6)], [10, 20, 30, 40, 50])
+        self.assertAlmostEqual(sum(ws.cell(row=r, column=3).value for r in range(1, 6)), 100.0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,109 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Колоночные данные таблицы (xlscolumnar): словарь массивов NumPy, структурированный массив,
+файл .npy и таблица pyarrow выводятся так же, как те же данные списком строк
+"""
+
+import os
+import datetime
+import tempfile
+import unittest
+
+try:
+    import numpy as np
+except ImportError:
+    np = None # module numpy doesn't exists
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+except ImportError:
+    pa = None # module pyarrow doesn't exists
+
+from xlsreport.xlstable import XLSTableField as TF
+from xlsreport.xlsreport import XLSReport, XLSTable
+from xlsreport.xlscolumnar import *
+
+INFO = (TF('group'), TF('name', col_count=2), TF('__note', default_value='-'), TF('qty', 'int'),
+        TF('price', 'currency'), TF('day', 'date'))
+ROWS = [['a', 'x', '-', 1, 1.5, datetime.date(2024, 1, 1)], ['a', 'y', '-', 2, 2.5, datetime.date(2024, 1, 2)],
+        ['b', 'z', '-', 3, 3.0, datetime.date(2024, 1, 3)], ['b', 'w', '-', 4, 4.25, datetime.date(2024, 1, 4)],
+        ['c', 'v', '-', 5, 0.5, datetime.date(2024, 1, 5)]]
+
+def _columns():
+    return dict(group=np.array([row[0] for row in ROWS]), name=np.array([row[1] for row in ROWS]),
+                qty=np.array([row[3] for row in ROWS]), price=np.array([row[4] for row in ROWS]),
+                day=np.array([row[5] for row in ROWS], dtype='datetime64[D]'))
+
+def _structured():
+    columns = _columns()
+    data = np.zeros(len(ROWS), dtype=[(name, col.dtype) for name, col in columns.items()])
+    for name, col in columns.items():
+        data[name] = col
+    return data
+
+def _render(data):
+    table = XLSTable(INFO, data)
+    table.hierarchy_append('group', merging=True, subtotal=['qty', 'price'])
+    table.set_grand_total(['qty', 'price'])
+    rep = XLSReport('S')
+    rep.print_table(table, 1)
+    ws = rep._ws
+    return ([[cl.value for cl in row] for row in ws.iter_rows()],
+            sorted(str(m) for m in ws.merged_cells.ranges))
+
+@unittest.skipIf(np is None, "нет модуля numpy")
+class ColumnarDataTest(unittest.TestCase):
+    def test_same_as_rows(self):
+        expected = _render([list(row) for row in ROWS])
+        sources = {'dict': _columns(), 'structured': _structured(),
+                   'chunks': XLSColumnarData(_columns(), chunk_size=2)}
+        for name, data in sources.items():
+            with self.subTest(source=name):
+                self.assertEqual(_render(data), expected)
+
+    def test_npy_file(self):
+        expected = _render([list(row) for row in ROWS])
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'data.npy')
+            np.save(filename, _structured())
+            data = XLSColumnarData(filename)
+            # колонка - срез отображенного в память файла, а не копия
+            self.assertFalse(data.column('qty').flags.owndata)
+            self.assertEqual(_render(filename), expected)
+            del data
+
+    @unittest.skipIf(pa is None, "нет модуля pyarrow")
+    def test_arrow(self):
+        expected = _render([list(row) for row in ROWS])
+        table = pa.table({name: list(col.tolist()) for name, col in _columns().items()})
+        self.assertEqual(_render(table), expected)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'data.arrow')
+            with pa.ipc.new_file(filename, table.schema) as writer:
+                writer.write_table(table)
+            self.assertEqual(_render(filename), expected)
+
+    def test_values(self):
+        data = XLSColumnarData(_columns())
+        self.assertEqual(len(data), 5)
+        self.assertEqual(data.values('day', 1, 3), [datetime.date(2024, 1, 2), datetime.date(2024, 1, 3)])
+        self.assertEqual(data.values('qty', 3), [4, 5])
+        self.assertIs(type(data.values('qty')[0]), int)
+        self.assertEqual(python_values(np.array(['2024-01-01T10:00', 'NaT'], dtype='datetime64[ns]')),
+                         [datetime.datetime(2024, 1, 1, 10, 0), None])
+
+    def test_wrong_columns(self):
+        columns = _columns()
+        del columns['price']
+        with self.assertRaisesRegex(AssertionError, "нет колонки 'price'"):
+            XLSTable(INFO, columns)
+
+        columns = _columns()
+        columns['qty'] = columns['qty'][:3]
+        with self.assertRaisesRegex(AssertionError, "колонка 'qty' имеет длину 3"):
+            XLSTable(INFO, columns)
+
+if __name__ == '__main__':
+    unittest.main()
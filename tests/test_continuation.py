@@ -0,0 +1,85 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Перенос таблицы на листы продолжения: не больше max_rows строк на листе, шапка на каждом
+листе, перенос на границах групп, общий итог по всем листам
+"""
+
+import io
+import unittest
+
+from openpyxl import load_workbook
+
+from xlsreport.xlstable import XLSTableField as TF
+from xlsreport.xlstableheader import XLSTableHeader, XLSTableHeaderColumn as THC
+from xlsreport.xlsreport import XLSReport, XLSTable
+
+INFO = (TF('group'), TF('name'), TF('qty', 'int'))
+ROWS = [[group, 'n{0:d}'.format(i), i] for i, group in enumerate('aaabbccccdddddde')]
+HEADER = XLSTableHeader(columns=[THC('Группа', widths=[12]), THC('Имя', widths=[9]), THC('Кол-во', widths=[7])])
+
+def _render(sheet_name='Данные', max_rows=10, rows=ROWS, **kwargs):
+    table = XLSTable(INFO, [list(row) for row in rows])
+    table.hierarchy_append('group', merging=True, subtotal=['qty'])
+    table.set_grand_total(['qty'])
+    rep = XLSReport(sheet_name, **kwargs)
+    first_row = rep.print_tableheader(HEADER, rep.start_row)
+    next_row = rep.print_table(table, first_row, tableheader=HEADER, max_rows=max_rows)
+    out = io.BytesIO()
+    rep.save(out)
+    return next_row, load_workbook(out), load_workbook(out, data_only=True)
+
+class ContinuationSheetsTest(unittest.TestCase):
+    def test_split_on_groups(self):
+        for mode in ('memory', 'streaming', 'direct'):
+            with self.subTest(mode=mode):
+                next_row, wb, values = _render(streaming=(mode == 'streaming'), direct=(mode == 'direct'))
+                self.assertEqual(wb.sheetnames, ['Данные', 'Данные (2)', 'Данные (3)'])
+                self.assertEqual(next_row, 11)
+
+                data = []
+                for ws in wb.worksheets:
+                    self.assertLessEqual(ws.max_row, 10)
+                    self.assertEqual([cl.value for cl in ws[1]], ['Группа', 'Имя', 'Кол-во'])
+                    self.assertEqual(ws.column_dimensions['B'].width, wb.worksheets[0].column_dimensions['B'].width)
+                    rows = list(ws.iter_rows(min_row=2, values_only=True))
+                    data.extend(row[1:] for row in rows if row[1] is not None)
+
+                    # группа целиком на одном листе: подитог сразу после ее строк
+                    groups = [row[0] for row in rows if (row[0] is not None) and not row[0].startswith(('Σ', 'Итого'))]
+                    subtotals = [row[0] for row in rows if (row[0] or '').startswith('Σ')]
+                    self.assertEqual(["Σ '{0:s}'".format(g) for g in groups if g != 'e'], subtotals)
+                self.assertEqual(data, [(row[1], row[2] or None) for row in ROWS])
+
+                # общий итог на последнем листе складывает строки всех листов
+                last = wb.worksheets[-1]
+                self.assertEqual(last.cell(row=last.max_row, column=1).value, 'Итого')
+                self.assertEqual(last.cell(row=last.max_row, column=3).value,
+                                 "=SUBTOTAL(9,'Данные'!C2:C8,'Данные (2)'!C2:C6,C2:C9)")
+                self.assertEqual(values.worksheets[-1].cell(row=last.max_row, column=3).value, sum(range(16)))
+
+    def test_group_larger_than_sheet(self):
+        """группа, которая не помещается на лист, переносится внутри группы
+        """
+        rows = [['a', 'n{0:d}'.format(i), i] for i in range(1, 21)]
+        _, wb, values = _render(max_rows=8, rows=rows)
+        self.assertGreater(len(wb.sheetnames), 2)
+        names = [row[1] for ws in wb.worksheets for row in ws.iter_rows(min_row=2, values_only=True)
+                 if (row[1] is not None)]
+        self.assertEqual(names, [row[1] for row in rows])
+        for ws in wb.worksheets:
+            self.assertLessEqual(ws.max_row, 8)
+        last = values.worksheets[-1]
+        self.assertEqual(last.cell(row=last.max_row, column=3).value, sum(range(1, 21)))
+
+    def test_long_sheet_name(self):
+        _, wb, _ = _render(sheet_name='Ежемесячный отчет по продажам1')
+        self.assertEqual(wb.sheetnames[1], 'Ежемесячный отчет по продаж (2)')
+        self.assertTrue(all(len(name) <= 31 for name in wb.sheetnames))
+
+    def test_fits_on_sheet(self):
+        _, wb, _ = _render(max_rows=100)
+        self.assertEqual(wb.sheetnames, ['Данные'])
+
+if __name__ == '__main__':
+    unittest.main()
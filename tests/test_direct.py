@@ -0,0 +1,114 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Прямая запись XML листов (xlsdirect): книга, выведенная в режиме direct, после открытия
+совпадает с книгой обычного режима, в том числе с шаблоном
+"""
+
+import io
+import datetime
+import unittest
+
+from openpyxl import Workbook, load_workbook
+from openpyxl.styles import Font
+
+from xlsreport.xlstable import XLSTableField as TF
+from xlsreport.xlstableheader import XLSTableHeader, XLSTableHeaderColumn as THC
+from xlsreport.xlsreport import XLSReport, XLSTable
+from xlsreport.xlstemplate import XLSTemplate
+from xlsreport.xlscolor import Color
+
+INFO = (TF('group'), TF('name', col_count=2), TF('qty', 'int'), TF('price', 'currency'), TF('day', 'date'))
+ROWS = [['a', 'x', 1, 1.5, datetime.date(2024, 1, 1)], ['a', 'y', 0, 2.5, datetime.date(2024, 1, 2)],
+        ['b', 'z', 3, 3.0, None], ['b', 'w & <q>', 4, 4.25, datetime.date(2024, 1, 4)]]
+HEADER = XLSTableHeader(columns=[THC('Группа', widths=[10]), THC('Товар', widths=[10, 10]),
+                                 THC('Итоги', struct=[THC('Кол-во', widths=[8]), THC('Цена', widths=[8])]),
+                                 THC('День', widths=[12])])
+
+def _table():
+    table = XLSTable(INFO, [list(row) for row in ROWS], row_height=20)
+    table.hierarchy_append('group', merging=True, subtotal=['qty', 'price'])
+    table.set_grand_total(['qty', 'price'])
+    table.add_coloring('price', lambda row: Color.YELLOW if row['price'] > 3 else Color.GREEN)
+    return table
+
+def _render(template=None, **kwargs):
+    rep = XLSReport('S', template=template, **kwargs)
+    row = rep.print_tableheader(HEADER, rep.start_row)
+    rep.print_table(_table(), row)
+    out = io.BytesIO()
+    rep.save(out)
+    return rep, out
+
+def _snapshot(out, data_only=False):
+    """значения и стили ячеек, объединения, высоты и уровни группировки строк, ширины колонок.
+    Высота строки сравнивается итоговая: обычный режим делает самую частую высоту высотой листа
+    по умолчанию (coalesce_row_heights), прямая запись пишет высоту каждой строки
+    """
+    ws = load_workbook(out, data_only=data_only).active
+    cells = dict()
+    for row in ws.iter_rows():
+        for cl in row:
+            if (cl.value is None) and not cl.has_style:
+                continue
+            border = cl.border
+            cells[cl.coordinate] = (cl.value, cl.number_format, cl.font.b, cl.alignment.horizontal,
+                                    cl.fill.fill_type, cl.fill.fgColor.rgb if cl.fill.fill_type else None,
+                                    tuple(getattr(border, side).style for side in ('left', 'right', 'top', 'bottom')))
+    default = ws.sheet_format.defaultRowHeight
+    rows = dict()
+    for r in range(1, ws.max_row + 1):
+        dim = ws.row_dimensions[r]
+        rows[r] = (dim.height if dim.height is not None else default, dim.outlineLevel)
+    cols = {k: (dim.width, dim.hidden) for k, dim in ws.column_dimensions.items()}
+    return dict(cells=cells, merges=sorted(str(m) for m in ws.merged_cells.ranges), rows=rows, cols=cols)
+
+class DirectWriterTest(unittest.TestCase):
+    def test_same_as_in_memory(self):
+        _, memory = _render()
+        _, direct = _render(direct=True)
+        self.assertEqual(_snapshot(direct), _snapshot(memory))
+        self.assertEqual(_snapshot(direct, data_only=True), _snapshot(memory, data_only=True))
+
+        # подитоги и общий итог - формулы вместе со значениями
+        values = load_workbook(direct, data_only=True).active
+        grand = values.max_row
+        self.assertEqual([values.cell(row=grand, column=c).value for c in (4, 5)], [8, 11.25])
+        self.assertEqual(values.cell(row=grand, column=1).value, 'Итого')
+
+    def template(self):
+        wb = Workbook()
+        ws = wb.active
+        ws['A1'] = 'Шапка шаблона'
+        ws['A1'].font = Font(bold=True)
+        ws.merge_cells('A1:C1')
+        ws.column_dimensions['B'].width = 25
+        out = io.BytesIO()
+        wb.save(out)
+        out.seek(0)
+        return XLSTemplate(out)
+
+    def test_template(self):
+        template = self.template()
+        _, memory = _render(template)
+        rep, direct = _render(template, direct=True)
+        self.assertEqual(_snapshot(direct), _snapshot(memory))
+
+        ws = load_workbook(direct).active
+        self.assertEqual(ws['A1'].value, 'Шапка шаблона')
+        self.assertTrue(ws['A1'].font.b)
+        self.assertIn('A1:C1', [str(m) for m in ws.merged_cells.ranges])
+        self.assertEqual(ws.column_dimensions['B'].width, 25)
+
+        # копия шаблона остается книгой openpyxl, запись прямых листов задается ей самой
+        self.assertIs(type(rep._wb), Workbook)
+        self.assertFalse(hasattr(template.clone(), 'writer_class'))
+
+    def test_save_twice(self):
+        rep, first = _render(direct=True)
+        second = io.BytesIO()
+        rep.save(second)
+        self.assertEqual(_snapshot(second), _snapshot(first))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Пакетный вывод отчетов в пуле процессов (xlsfarm)
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from openpyxl import load_workbook
+
+from xlsreport.xlstable import XLSTableField as TF
+from xlsreport.xlsreport import XLSTable
+from xlsreport.xlsfarm import *
+
+INFO = (TF('art'), TF('qty', 'int'))
+
+def _fail(rep, params, shared):
+    raise ValueError('задание {0:d}'.format(params))
+
+def _build(rep, params, shared):
+    """отчет из строк shared; задание с crash=True завершает процесс пула аварийно
+    """
+    if params['crash']:
+        os._exit(1)
+    rep.print_table(XLSTable(INFO, [list(row) for row in shared['rows']]), 1)
+
+class XLSReportFarmTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_many_jobs(self):
+        """пакет из тысяч заданий выполняется до конца; ошибки заданий возвращаются в результатах
+        """
+        count = 4000
+        with XLSReportFarm(max_workers=2) as farm:
+            results = farm.render(_fail, range(count), os.path.join(self.directory, '{index}.xlsx'))
+        self.assertEqual([r.index for r in results], list(range(count)))
+        self.assertTrue(all('ValueError: задание {0:d}'.format(r.index) in r.error for r in results))
+        self.assertEqual(batch_summary(results)['errors'], count)
+
+    def test_crash_and_retry(self):
+        """ошибкой отмечается только задание, при котором процесс пула завершился аварийно,
+        остальные выполняются и после пересоздания пула
+        """
+        params = [dict(n=n, crash=(n == 3)) for n in range(8)]
+        output = os.path.join(self.directory, 'r{n}.xlsx')
+        with XLSReportFarm(max_workers=2, shared=dict(rows=[('a', 1), ('b', 2)])) as farm:
+            results = farm.render(_build, params, output)
+            again = farm.render(_build, [dict(n=10, crash=False)], output)
+
+        self.assertEqual([r.index for r in results], list(range(8)))
+        self.assertIn('аварийно', results[3].error)
+        for r in results[:3] + results[4:] + again:
+            self.assertIsNone(r.error)
+            ws = load_workbook(r.output).active
+            self.assertEqual([ws['A1'].value, ws['B2'].value], ['a', 2])
+        self.assertFalse(os.path.exists(os.path.join(self.directory, 'r3.xlsx')))
+
+if __name__ == '__main__':
+    unittest.main()
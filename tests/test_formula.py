@@ -0,0 +1,74 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Подитоги с рассчитанными значениями (xlsformula): сохраненная книга содержит формулы вместе
+со значениями <v>, а книги, которые сохраняет openpyxl без записи отчета, - нет
+"""
+
+import io
+import unittest
+from zipfile import ZipFile
+
+from openpyxl import Workbook, load_workbook
+
+from xlsreport.xlstable import XLSTableField as TF, SUBTOTAL_MODES
+from xlsreport.xlsreport import XLSReport, XLSTable
+from xlsreport.xlsformula import *
+
+INFO = (TF('group'), TF('qty', 'int'), TF('price', 'currency'))
+ROWS = [['a', 1, 1.5], ['a', 2, 2.5], ['b', 3, 3.0], ['b', 4, 4.25]]
+
+def _report(subtotal_mode, streaming=False):
+    table = XLSTable(INFO, [list(row) for row in ROWS], subtotal_mode=subtotal_mode)
+    table.hierarchy_append('group', subtotal=['qty', 'price'])
+    table.set_grand_total(['qty', 'price'])
+    rep = XLSReport('S', streaming=streaming)
+    rep.print_table(table, 1)
+    out = io.BytesIO()
+    rep.save(out)
+    return out
+
+class CachedFormulaTest(unittest.TestCase):
+    def test_round_trip(self):
+        """строки 3 и 6 - подитоги групп, 7 - общий итог
+        """
+        expected = {3: (3, 4.0), 6: (7, 7.25), 7: (10, 11.25)}
+        for streaming in (False, True):
+            for subtotal_mode in SUBTOTAL_MODES:
+                with self.subTest(subtotal_mode=subtotal_mode, streaming=streaming):
+                    out = _report(subtotal_mode, streaming)
+                    formulas = load_workbook(out).active
+                    values = load_workbook(out, data_only=True).active
+                    for row, (qty, price) in expected.items():
+                        cl = formulas.cell(row=row, column=2)
+                        if subtotal_mode == 'static':
+                            self.assertEqual(cl.value, qty)
+                        else:
+                            self.assertTrue(cl.value.startswith('=SUBTOTAL(9,B'), cl.value)
+                        cached = [values.cell(row=row, column=c).value for c in (2, 3)]
+                        self.assertEqual(cached, [None, None] if subtotal_mode == 'formula' else [qty, price])
+
+                        # стиль ячейки итога
+                        self.assertEqual(cl.fill.fgColor.rgb[-6:], 'DFDFDF')
+                        self.assertEqual(cl.alignment.horizontal, 'right')
+                    self.assertEqual(formulas['A3'].value, "Σ 'a'")
+                    self.assertTrue(formulas['A3'].font.b)
+
+    def test_cached_value_xml(self):
+        sheet = ZipFile(_report('cached')).read('xl/worksheets/sheet1.xml').decode()
+        self.assertIn('<c r="B7" s="', sheet)
+        self.assertRegex(sheet, r'<c r="B7"[^>]*><f>SUBTOTAL\(9,B1:B6\)</f><v>10</v></c>')
+
+    def test_plain_openpyxl_save(self):
+        """книга, которую сохраняет openpyxl, пишет формулу без значения
+        """
+        wb = Workbook()
+        set_formula(wb.active['A1'], '=1+1', 2)
+        out = io.BytesIO()
+        wb.save(out)
+        sheet = ZipFile(out).read('xl/worksheets/sheet1.xml').decode()
+        self.assertIn('<f>1+1</f>', sheet)
+        self.assertNotIn('<v>2</v>', sheet)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Строки таблицы из итератора неизвестной длины: вывод совпадает с выводом списка строк,
+структура проверяется по первой строке, ход выполнения сообщается количеством строк
+"""
+
+import io
+import csv
+import unittest
+
+from openpyxl import load_workbook
+
+from xlsreport.xlstable import XLSTableField as TF
+from xlsreport.xlsreport import XLSReport, XLSTable
+from xlsreport.xlsinstrument import XLSInstrumentation, XLSConsoleProgress
+
+INFO = (TF('group'), TF('name'), TF('qty', 'int'), TF('empty', 'int'))
+ROWS = [['a', 'x', 1, 0], ['a', 'y', 2, 0], ['b', 'z', 3, 0], ['b', 'w', 4, 0], ['c', 'v', 5, 0]]
+
+class _Progress(XLSInstrumentation):
+    progress_rows = 1
+    progress_interval = None
+
+    def __init__(self):
+        self.calls = []
+
+    def on_progress(self, task, done, total, elapsed):
+        self.calls.append((task, done, total))
+
+def _table(data, **kwargs):
+    table = XLSTable(INFO, data, **kwargs)
+    table.hierarchy_append('group', merging=True, subtotal=['qty'])
+    table.set_grand_total(['qty'])
+    table.add_hide_column_condition('empty', 'zero')
+    return table
+
+def _render(table, **kwargs):
+    rep = XLSReport('S', **kwargs)
+    rep.print_table(table, 1)
+    out = io.BytesIO()
+    rep.save(out)
+    ws = load_workbook(out).active
+    return ([[cl.value for cl in row] for row in ws.iter_rows()],
+            sorted(str(m) for m in ws.merged_cells.ranges),
+            sorted(k for k, dim in ws.column_dimensions.items() if dim.hidden))
+
+class IteratorSourceTest(unittest.TestCase):
+    def test_same_as_list(self):
+        for streaming in (False, True):
+            with self.subTest(streaming=streaming):
+                expected = _render(_table([list(row) for row in ROWS]), streaming=streaming)
+                self.assertEqual(expected[2], ['D'])
+                rows = (list(row) for row in ROWS)
+                self.assertEqual(_render(_table(rows), streaming=streaming), expected)
+
+    def test_csv_reader(self):
+        text = io.StringIO(''.join('{0},{1},{2},{3}\n'.format(*row) for row in ROWS))
+        table = XLSTable((TF('group'), TF('name'), TF('qty'), TF('empty')), csv.reader(text))
+        values, _, _ = _render(table)
+        self.assertEqual(values[0], ['a', 'x', '1', '0'])
+        self.assertEqual(len(values), len(ROWS))
+
+    def test_checked_on_first_row(self):
+        consumed = []
+        def _rows():
+            for row in [['a', 'x', 1]] + ROWS:
+                consumed.append(row)
+                yield row
+
+        table = XLSTable(INFO, _rows())
+        self.assertEqual(consumed, [])
+        with self.assertRaisesRegex(AssertionError, "количество полей"):
+            XLSReport('S').print_table(table, 1)
+        self.assertEqual(len(consumed), 1)
+
+    def test_progress_without_total(self):
+        progress = _Progress()
+        XLSReport('S', instrumentation=progress).print_table(XLSTable(INFO, iter(ROWS)), 1)
+        self.assertEqual(progress.calls[-1], ('table', 5, None))
+        self.assertEqual({total for _, _, total in progress.calls}, {None})
+
+        progress = _Progress()
+        XLSReport('S', instrumentation=progress).print_table(XLSTable(INFO, ROWS), 1)
+        self.assertEqual(progress.calls[-1], ('table', 5, 5))
+
+        stream = io.StringIO()
+        XLSReport('S', instrumentation=XLSConsoleProgress(stream)).print_table(XLSTable(INFO, iter(ROWS)), 1)
+        self.assertRegex(stream.getvalue(), r'5 строк, \d+ строк/с')
+
+    def test_group_by_data(self):
+        totals = (TF('group'), TF('qty', 'int'))
+        result = XLSTable(INFO, iter(ROWS)).group_by_data(totals, ['group'], sums=['qty'])
+        self.assertEqual(result, [('a', 3), ('b', 7), ('c', 5)])
+
+if __name__ == '__main__':
+    unittest.main()
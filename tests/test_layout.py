@@ -0,0 +1,119 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Отложенная раскладка листа (xlslayout): объединения, уровни группировки и высоты строк,
+примененные одним проходом, совпадают с раскладкой, которая делается на каждой строке
+"""
+
+import io
+import unittest
+
+from openpyxl import Workbook, load_workbook
+
+from xlsreport.xlstable import XLSTableField as TF
+from xlsreport.xlsreport import XLSReport, XLSTable
+from xlsreport.xlsutils_apply import set_borders
+from xlsreport.xlslayout import *
+
+INFO = (TF('art'), TF('color'), TF('name', col_count=2), TF('qty', 'int'))
+ROWS = [['A', 'red', 'x', 1], ['A', 'red', 'y', 2], ['A', 'blue', 'z', 3],
+        ['B', 'red', 'w', 4], ['B', 'red', 'v', 5], ['B', 'green', 'u', 6]]
+
+def _borders(ws):
+    return {cl.coordinate: tuple(getattr(cl.border, side).style for side in ('left', 'right', 'top', 'bottom'))
+            for row in ws.iter_rows() for cl in row}
+
+def _effective_rows(ws):
+    default = ws.sheet_format.defaultRowHeight
+    rows = dict()
+    for r in range(1, ws.max_row + 1):
+        dim = ws.row_dimensions[r]
+        rows[r] = (dim.height if dim.height is not None else default, dim.outlineLevel)
+    return rows
+
+class LayoutTest(unittest.TestCase):
+    def test_merge_ranges(self):
+        """merge_ranges дает те же объединения и рамки, что и Worksheet.merge_cells, если после
+        объединения задается рамка диапазона
+        """
+        ranges = [(1, 1, 1, 3), (2, 1, 4, 1), (2, 2, 3, 3)]
+        sheets = []
+        for bulk in (False, True):
+            ws = Workbook().active
+            for r in range(1, 5):
+                for c in range(1, 4):
+                    ws.cell(row=r, column=c, value=r * 10 + c)
+            set_borders(ws, 1, 1, 4, 3, 'thin')
+            if bulk:
+                merge_ranges(ws, ranges)
+            else:
+                for r1, c1, r2, c2 in ranges:
+                    ws.merge_cells(start_row=r1, start_column=c1, end_row=r2, end_column=c2)
+            # рамка объединенного диапазона, как XLSLayout.merge с border_style
+            for (r1, c1, r2, c2), border_style in zip(ranges, ('thin', 'medium', 'thin')):
+                set_borders(ws, r1, c1, r2, c2, border_style)
+            sheets.append(ws)
+        old, new = sheets
+        self.assertEqual(sorted(str(m) for m in new.merged_cells.ranges), sorted(str(m) for m in old.merged_cells.ranges))
+        self.assertEqual(_borders(new), _borders(old))
+        self.assertEqual(new['A4'].border.bottom.style, 'medium')
+        self.assertEqual(new['C3'].border.right.style, 'thin')
+
+    def test_plan(self):
+        ws = Workbook().active
+        layout = XLSLayout()
+        for r in range(1, 7):
+            ws.cell(row=r, column=1, value=r)
+            layout.height(r, 20 if r != 4 else 30)
+        layout.outline(1, 5)
+        layout.outline(2, 3)
+        layout.outline(5, 4) # пустой диапазон
+        layout.merge(1, 1, 2, 1, 'thin')
+        layout.merge(6, 1, 6, 1, 'thin') # одна ячейка не объединяется
+        layout.merge(5, 1, 6, 1)
+
+        layout.apply(ws, upto_row=4)
+        self.assertEqual([str(m) for m in ws.merged_cells.ranges], ['A1:A2'])
+        self.assertEqual([ws.row_dimensions[r].outlineLevel for r in range(1, 7)], [1, 2, 2, 0, 0, 0])
+        self.assertIsNone(ws.row_dimensions[4].height)
+        with self.assertRaisesRegex(AssertionError, "уже применен"):
+            layout.outline(3, 5)
+
+        layout.apply(ws)
+        self.assertEqual(sorted(str(m) for m in ws.merged_cells.ranges), ['A1:A2', 'A5:A6'])
+        self.assertEqual([ws.row_dimensions[r].outlineLevel for r in range(1, 7)], [1, 2, 2, 1, 1, 0])
+        self.assertEqual([ws.row_dimensions[r].height for r in range(1, 7)], [20, 20, 20, 30, 20, 20])
+        self.assertEqual(ws['A6'].border.left.style, 'thin')
+
+        coalesce_row_heights(ws)
+        self.assertEqual(ws.sheet_format.defaultRowHeight, 20)
+        self.assertEqual([r for r, dim in ws.row_dimensions.items() if dim.height is not None], [4])
+
+    def test_table(self):
+        """объединения, уровни группировки и высоты строк таблицы одинаковы во всех режимах вывода
+        """
+        snapshots = dict()
+        for mode in ('memory', 'streaming', 'direct'):
+            table = XLSTable(INFO, [list(row) for row in ROWS], row_height=24)
+            table.hierarchy_append('art', merging=True, subtotal=['qty'])
+            table.hierarchy_append('color', merging=True, subtotal=['qty'])
+            table.set_grand_total(['qty'])
+            rep = XLSReport('S', streaming=(mode == 'streaming'), direct=(mode == 'direct'))
+            rep.print_table(table, 1)
+            out = io.BytesIO()
+            rep.save(out)
+            ws = load_workbook(out).active
+            snapshots[mode] = (sorted(str(m) for m in ws.merged_cells.ranges), _effective_rows(ws), _borders(ws))
+
+        # строки 3 и 8 - подитоги цвета, 5 и 10 - артикула, 11 - общий итог
+        merges, rows, _ = snapshots['memory']
+        self.assertEqual(merges, ['A1:A4', 'A6:A9', 'B1:B2', 'B6:B7', 'C1:D1', 'C2:D2', 'C4:D4',
+                                  'C6:D6', 'C7:D7', 'C9:D9'])
+        self.assertEqual([rows[r] for r in range(1, 12)],
+                         [(24, 2), (24, 2), (18, 1), (24, 1), (18, 0),
+                          (24, 2), (24, 2), (18, 1), (24, 1), (18, 0), (18, 0)])
+        self.assertEqual(snapshots['streaming'], snapshots['memory'])
+        self.assertEqual(snapshots['direct'], snapshots['memory'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Отложенная загрузка модулей пакета: подмодуль импортируется без остальных модулей,
+модуль, который не удалось загрузить, повторно не импортируется
+"""
+
+import os
+import sys
+import unittest
+import subprocess
+from unittest import mock
+
+import xlsreport
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def _loaded_after(statement):
+    """модули, загруженные в отдельном процессе после выполнения statement
+    """
+    code = "import sys\n{0:s}\nprint(' '.join(sorted(sys.modules)))".format(statement)
+    out = subprocess.run([sys.executable, '-c', code], cwd=ROOT, check=True,
+                         stdout=subprocess.PIPE, universal_newlines=True).stdout
+    return set(out.split())
+
+class LazyImportTest(unittest.TestCase):
+    def test_submodule_only(self):
+        loaded = _loaded_after('from xlsreport import xlscli')
+        self.assertIn('xlsreport.xlscli', loaded)
+        for name in ('openpyxl', 'xlsreport.xlsreport', 'xlsreport.xlsparallel', 'xlsreport.xlsfarm'):
+            self.assertNotIn(name, loaded)
+
+    def test_package_names(self):
+        loaded = _loaded_after('from xlsreport import XLSReport')
+        self.assertIn('openpyxl', loaded)
+        self.assertIs(xlsreport.XLSTable, xlsreport.xlsreport.XLSTable)
+
+    def test_failed_module_cached(self):
+        calls = []
+        def _import(name, package=None):
+            calls.append(name)
+            raise ImportError(name)
+
+        with mock.patch.object(xlsreport, '_FAILED', set()), \
+             mock.patch.object(xlsreport.importlib, 'import_module', _import):
+            self.assertIsNone(xlsreport._load('.sqltabledata'))
+            self.assertIsNone(xlsreport._load('.sqltabledata'))
+            with self.assertRaises(ImportError):
+                xlsreport._load('.xlsfarm')
+        self.assertEqual(calls, ['.sqltabledata', '.xlsfarm'])
+
+if __name__ == '__main__':
+    unittest.main()
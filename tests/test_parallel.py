@@ -0,0 +1,97 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Вывод листов в пуле процессов (xlsparallel): каждый лист собранной книги совпадает с книгой,
+в которой этот лист выведен отдельно, включая стили, параметры печати и защиту листа
+"""
+
+import io
+import unittest
+
+from openpyxl import load_workbook
+
+from xlsreport.xlstable import XLSTableField as TF
+from xlsreport.xlsreport import XLSReport, XLSTable
+from xlsreport.xlslabel import XLSLabel, LabelHeading
+from xlsreport.xlsparallel import *
+from xlsreport.xlscolor import Color
+
+INFO = (TF('group'), TF('name', col_count=2), TF('qty', 'int'), TF('price', 'currency'))
+
+def _build(rep, title, rows, color):
+    """лист отчета: надпись, таблица с группировкой, раскраской и общим итогом; лист выбран
+    """
+    rep._ws.sheet_view.tabSelected = True
+    rep.print_label(XLSLabel(title, LabelHeading.h1), 1, 1, 5)
+    table = XLSTable(INFO, [list(row) for row in rows])
+    table.hierarchy_append('group', merging=True, subtotal=['qty', 'price'])
+    table.set_grand_total(['qty', 'price'])
+    table.add_coloring('price', lambda row: color if row['price'] > 2 else Color.GREEN)
+    rep.print_table(table, 3)
+
+TASKS = [XLSSheetTask('Январь', _build, ('Январь', [['a', 'x', 1, 1.5], ['a', 'y', 2, 2.5], ['b', ' z ', 3, 3.0]],
+                                         Color.RED)),
+         XLSSheetTask('Февраль', _build, ('Февраль', [['c', 'x', 4, 0.5], ['c', 'w & <q>', 5, 4.25]], Color.BLUE),
+                      print_setup=PrintSetup.PortraitW1, protection=True, streaming=True),
+         XLSSheetTask('Март', _build, ('Март', [['d', 'x', 6, 6.0]], Color.YELLOW),
+                      print_setup=PrintSetup.LandscapeW2, direct=True)]
+
+def _standalone(task):
+    out = io.BytesIO()
+    render_sheet_part(task, out)
+    out.seek(0)
+    return load_workbook(out).active
+
+def _snapshot(ws):
+    cells = dict()
+    for row in ws.iter_rows():
+        for cl in row:
+            if (cl.value is None) and not cl.has_style:
+                continue
+            cells[cl.coordinate] = (cl.value, cl.number_format, cl.font.b, cl.font.sz, cl.alignment.horizontal,
+                                    cl.fill.fill_type, cl.fill.fgColor.rgb if cl.fill.fill_type else None,
+                                    tuple(getattr(cl.border, side).style for side in ('left', 'right', 'top', 'bottom')))
+    return dict(cells=cells, merges=sorted(str(m) for m in ws.merged_cells.ranges),
+                rows={r: (dim.height, dim.outlineLevel) for r, dim in ws.row_dimensions.items()},
+                cols={k: dim.width for k, dim in ws.column_dimensions.items()},
+                print_setup=(ws.page_setup.orientation, ws.page_setup.fitToWidth,
+                             ws.sheet_properties.pageSetUpPr.fitToPage, ws.print_options.horizontalCentered),
+                protection=ws.protection.sheet, default_height=ws.sheet_format.defaultRowHeight)
+
+class ParallelSheetsTest(unittest.TestCase):
+    def test_same_as_standalone(self):
+        out = io.BytesIO()
+        render_workbook_parallel(TASKS, out, max_workers=2)
+        out.seek(0)
+        wb = load_workbook(out)
+        self.assertEqual(wb.sheetnames, ['Январь', 'Февраль', 'Март'])
+        for ws, task in zip(wb.worksheets, TASKS):
+            with self.subTest(sheet=task.sheet_name):
+                self.assertEqual(_snapshot(ws), _snapshot(_standalone(task)))
+
+        self.assertEqual(wb['Февраль']['B4'].value, 'w & <q>')
+        self.assertEqual(wb['Январь']['B6'].value, ' z ')
+        self.assertTrue(wb['Февраль'].protection.sheet)
+        self.assertFalse(wb['Январь'].protection.sheet)
+        # выбранным остается не больше одного листа, иначе Excel откроет листы сгруппированными
+        self.assertEqual([ws.sheet_view.tabSelected for ws in wb.worksheets], [True, None, None])
+
+    def test_merge_parts(self):
+        """части собираются и из потоков, стили повторяющихся листов в книге не дублируются
+        """
+        parts = []
+        for task in TASKS[:1] * 2:
+            part = io.BytesIO()
+            render_sheet_part(task, part)
+            part.seek(0)
+            parts.append(part)
+
+        out = io.BytesIO()
+        merge_sheet_parts(parts, out, compression='fast')
+        out.seek(0)
+        wb = load_workbook(out)
+        self.assertEqual(_snapshot(wb.worksheets[1]), _snapshot(wb.worksheets[0]))
+        self.assertEqual(len(wb._cell_styles), len(_standalone(TASKS[0]).parent._cell_styles))
+
+if __name__ == '__main__':
+    unittest.main()
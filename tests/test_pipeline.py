@@ -0,0 +1,122 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Конвейер чтения данных (xlspipeline.XLSPrefetchRows) с источником sqlite3, который отвечает
+с задержкой
+"""
+
+import time
+import sqlite3
+import threading
+import unittest
+
+from xlsreport.xlstable import XLSTableField as TF
+from xlsreport.xlsreport import XLSReport, XLSTable
+from xlsreport.sqlpool import SQLConnectionPool, SQLQueryExecutor
+from xlsreport.xlspipeline import *
+
+INFO = (TF('art'), TF('qty', 'int'))
+
+class _Source:
+    """Порции строк из sqlite3 по batch_size строк с задержкой delay на порцию; помнит, сколько
+    порций прочитано и закрыт ли генератор
+    """
+    def __init__(self, rows=100, batch_size=10, delay=0.0, fail_after=None):
+        self.conn = sqlite3.connect(':memory:', check_same_thread=False)
+        self.conn.execute('create table goods (art text, qty integer)')
+        self.conn.executemany('insert into goods values (?, ?)', [('a{0:d}'.format(i), i) for i in range(rows)])
+        self.batch_size = batch_size
+        self.delay = delay
+        self.fail_after = fail_after
+        self.produced = 0
+        self.closed = threading.Event()
+
+    def batches(self):
+        cursor = self.conn.execute('select art, qty from goods order by qty')
+        try:
+            while True:
+                if self.produced == self.fail_after:
+                    self.conn.execute('select * from no_such_table')
+                time.sleep(self.delay)
+                batch = cursor.fetchmany(self.batch_size)
+                if not batch:
+                    break
+                self.produced += 1
+                yield [list(row) for row in batch]
+        finally:
+            self.closed.set()
+
+class XLSPrefetchRowsTest(unittest.TestCase):
+    def test_rows_in_order(self):
+        source = _Source(rows=95, delay=0.005)
+        rows = list(XLSPrefetchRows(source.batches(), max_batches=2))
+        self.assertEqual(len(rows), 95)
+        self.assertEqual(rows[-1], ['a94', 94])
+        self.assertTrue(source.closed.is_set())
+
+    def test_bounded_queue_holds_producer(self):
+        """пока основной поток не читает, читается не больше max_batches порций вперед
+        """
+        source = _Source(rows=200)
+        rows = XLSPrefetchRows(source.batches(), max_batches=2)
+        it = iter(rows)
+        self.assertEqual(next(it), ['a0', 0])
+        time.sleep(0.3)
+        # порция, которую читает основной поток, порции в очереди и одна, ожидающая места
+        self.assertLessEqual(source.produced, 1 + 2 + 1)
+
+        self.assertEqual(len(list(it)), 199)
+        self.assertEqual(source.produced, 20)
+
+    def test_producer_error_in_rendering_thread(self):
+        source = _Source(delay=0.005, fail_after=2)
+        rows = XLSPrefetchRows(source.batches(), max_batches=2)
+        rep = XLSReport('S')
+        with self.assertRaisesRegex(sqlite3.OperationalError, 'no_such_table'):
+            rep.print_table(XLSTable(INFO, rows), 1)
+        self.assertFalse(rows._thread.is_alive())
+        self.assertTrue(source.closed.is_set())
+
+    def test_consumer_error_stops_producer(self):
+        source = _Source(rows=10000, delay=0.01)
+        start = time.perf_counter()
+        with self.assertRaises(ZeroDivisionError):
+            with XLSPrefetchRows(source.batches(), max_batches=2) as rows:
+                for row in rows:
+                    if row[1] == 15:
+                        1 / 0
+        self.assertLess(time.perf_counter() - start, 2.0)
+        self.assertFalse(rows._thread.is_alive())
+        self.assertTrue(source.closed.is_set())
+        self.assertLess(source.produced, 10)
+
+    def test_early_close(self):
+        source = _Source(rows=10000, delay=0.01)
+        rows = XLSPrefetchRows(source.batches(), max_batches=1).start()
+        time.sleep(0.05)
+        rows.close()
+        self.assertFalse(rows._thread.is_alive())
+        self.assertTrue(source.closed.is_set())
+
+        # закрытие до запуска потока
+        XLSPrefetchRows(_Source().batches()).close()
+
+    def test_query_executor_returns_connection(self):
+        """ошибка вывода останавливает чтение запроса, и соединение возвращается в пул
+        """
+        conn = sqlite3.connect(':memory:', check_same_thread=False)
+        conn.execute('create table goods (art text, qty integer)')
+        conn.executemany('insert into goods values (?, ?)', [('a{0:d}'.format(i), i) for i in range(500)])
+        pool = SQLConnectionPool(lambda: conn, max_connections=1)
+        with SQLQueryExecutor(pool) as executor:
+            with self.assertRaises(ZeroDivisionError):
+                with executor.prefetch_table_data('select art, qty from goods order by qty', INFO,
+                                                  batch_size=10, max_batches=2) as rows:
+                    for row in rows:
+                        1 / 0
+            with pool.connection(timeout=1) as again:
+                self.assertIs(again, conn)
+        pool.close()
+
+if __name__ == '__main__':
+    unittest.main()
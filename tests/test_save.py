@@ -0,0 +1,107 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Сохранение отчета (XLSReport.save): путь, дескриптор файла, поток с произвольным доступом и без
+него, уровни сжатия ZIP
+"""
+
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from zipfile import ZipFile, ZIP_STORED, ZIP_DEFLATED
+
+from openpyxl import load_workbook
+
+from xlsreport.xlstable import XLSTableField as TF
+from xlsreport.xlsreport import XLSReport, XLSTable
+
+INFO = (TF('name'), TF('qty', 'int'))
+
+class _Pipe(io.RawIOBase):
+    """поток записи без произвольного доступа и без tell(), как канал или ответ HTTP
+    """
+    def __init__(self):
+        self.chunks = []
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def getvalue(self):
+        return b''.join(self.chunks)
+
+def _report(streaming=False):
+    rep = XLSReport('S', streaming=streaming)
+    rep.print_table(XLSTable(INFO, [['строка {0:d}'.format(i % 50), i] for i in range(2000)]), 1)
+    return rep
+
+def _values(source):
+    ws = load_workbook(source).active
+    return [row for row in ws.iter_rows(values_only=True)]
+
+class SaveTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_targets(self):
+        expected = _values(self.save_to_path(_report()))
+        for streaming in (False, True):
+            with self.subTest(streaming=streaming):
+                path = os.path.join(self.directory, 'fd.xlsx')
+                fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
+                try:
+                    result = _report(streaming).save(fd)
+                    # дескриптор не закрывается
+                    os.write(fd, b'')
+                finally:
+                    os.close(fd)
+                self.assertEqual(result.bytes_written, os.path.getsize(path))
+                self.assertEqual(_values(path), expected)
+
+                pipe = _Pipe()
+                result = _report(streaming).save(pipe)
+                self.assertEqual(result.bytes_written, len(pipe.getvalue()))
+                self.assertEqual(_values(io.BytesIO(pipe.getvalue())), expected)
+
+                stream = io.BytesIO(b'prefix')
+                stream.seek(0, io.SEEK_END)
+                result = _report(streaming).save(stream)
+                self.assertEqual(result.bytes_written, len(stream.getvalue()) - len('prefix'))
+                self.assertGreaterEqual(result.seconds, 0)
+
+    def save_to_path(self, rep, compression='default'):
+        path = os.path.join(self.directory, 'report_{0!s}.xlsx'.format(compression))
+        result = rep.save(path, compression)
+        self.assertEqual(result.bytes_written, os.path.getsize(path))
+        return path
+
+    def test_compression(self):
+        sizes = dict()
+        for compression in ('stored', 'fast', 'default', 'best', 0, 1, 9):
+            with self.subTest(compression=compression):
+                path = self.save_to_path(_report(), compression)
+                with ZipFile(path) as archive:
+                    methods = {info.compress_type for info in archive.infolist()}
+                self.assertEqual(methods, {ZIP_STORED} if compression in ('stored', 0) else {ZIP_DEFLATED})
+                self.assertEqual(len(_values(path)), 2000)
+                sizes[compression] = os.path.getsize(path)
+        self.assertGreater(sizes['stored'], sizes['fast'])
+        self.assertGreaterEqual(sizes['fast'], sizes['best'])
+        self.assertEqual(sizes[0], sizes['stored'])
+
+    def test_unknown_compression(self):
+        rep = _report()
+        for compression in ('zip', 10, True):
+            with self.assertRaises(AssertionError):
+                rep.save(io.BytesIO(), compression)
+
+if __name__ == '__main__':
+    unittest.main()
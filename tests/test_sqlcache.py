@@ -0,0 +1,84 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Кэш результатов запросов (sqlcache): формат файлов и вытеснение с диска
+"""
+
+import os
+import uuid
+import pickle
+import shutil
+import decimal
+import datetime
+import tempfile
+import unittest
+
+from xlsreport.sqlcache import *
+
+class _Payload:
+    """объект, pickle которого при чтении вызывает функцию
+    """
+    def __reduce__(self):
+        return (os.getpid, ())
+
+class SQLResultCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_values_round_trip(self):
+        rows = [['a', 1, 2.5, None, True, decimal.Decimal('1.10'), datetime.date(2026, 10, 1),
+                 datetime.datetime(2026, 10, 1, 12, 30), datetime.time(8, 15), uuid.UUID(int=7), b'\x00\xff']]
+        cache = SQLResultCache(directory=self.directory)
+        key = cache.make_key('select 1')
+        cache.put(key, rows, sqlquery='select 1')
+
+        fresh = SQLResultCache(directory=self.directory)
+        self.assertEqual(fresh.get(key), rows)
+        self.assertEqual(fresh.stats()['disk_hits'], 1)
+        self.assertEqual(cache.get(key), rows)
+
+    def test_files_are_not_unpickled(self):
+        """файл в каталоге кэша с данными pickle не читается как результат запроса
+        """
+        cache = SQLResultCache(directory=self.directory)
+        key = cache.make_key('select 1')
+        with open(os.path.join(self.directory, key + '.xrc'), 'wb') as f:
+            f.write(b'XRC1' + pickle.dumps(_Payload()))
+        self.assertIsNone(SQLResultCache(directory=self.directory).get(key))
+
+    def test_disk_eviction_is_lru(self):
+        cache = SQLResultCache(directory=self.directory, max_entries=1)
+        keys = [cache.make_key('select {0:d}'.format(i)) for i in range(3)]
+        for i, key in enumerate(keys[:2]):
+            cache.put(key, [[i] * 100], sqlquery='select {0:d}'.format(i))
+        size = cache.stats()['disk_bytes'] // 2
+
+        # запись 0 прочитана с диска позже записи 1, поэтому вытесняется запись 1
+        self.assertEqual(cache.get(keys[0]), [[0] * 100])
+        cache.max_disk_bytes = size * 2 + size // 2
+        cache.put(keys[2], [[2] * 100], sqlquery='select 2')
+
+        names = set(os.listdir(self.directory))
+        self.assertIn(keys[0] + '.xrc', names)
+        self.assertNotIn(keys[1] + '.xrc', names)
+        self.assertIn(keys[2] + '.xrc', names)
+        self.assertEqual(cache.stats()['disk_entries'], 2)
+
+        # индекс нового объекта восстанавливает порядок по времени изменения файлов
+        fresh = SQLResultCache(directory=self.directory, max_disk_bytes=size * 2 + size // 2)
+        self.assertEqual(fresh.get(keys[0]), [[0] * 100])
+        fresh.put(keys[1], [[1] * 100], sqlquery='select 1')
+        self.assertEqual(sorted(os.listdir(self.directory)), sorted([keys[0] + '.xrc', keys[1] + '.xrc']))
+
+    def test_invalidate(self):
+        cache = SQLResultCache(directory=self.directory)
+        cache.cached(lambda: [[1]], 'select  1 from t')
+        cache.invalidate('select 1 from t')
+        self.assertEqual(os.listdir(self.directory), [])
+        self.assertEqual(cache.stats()['disk_bytes'], 0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,199 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Пул соединений и параллельные запросы (sqlpool) на базе файла sqlite3
+"""
+
+import os
+import time
+import sqlite3
+import tempfile
+import threading
+import unittest
+
+from xlsreport.xlstable import XLSTableField as TF
+from xlsreport.sqlpool import *
+
+class _Cursor(sqlite3.Cursor):
+    """Курсор sqlite3, который помнит, что его закрыли
+    """
+    closed = False
+
+    def close(self):
+        self.closed = True
+        super().close()
+
+class _Connection(sqlite3.Connection):
+    """Соединение sqlite3, которое помнит, что его закрыли, и курсоры, которые оно выдало
+    """
+    closed = False
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.cursors = []
+
+    def cursor(self, factory=_Cursor):
+        cursor = super().cursor(factory)
+        self.cursors.append(cursor)
+        return cursor
+
+    def close(self):
+        self.closed = True
+        super().close()
+
+class PoolTestCase(unittest.TestCase):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp(suffix='.sqlite')
+        os.close(fd)
+        conn = sqlite3.connect(self.path)
+        conn.execute('create table goods (art text, qty integer)')
+        conn.executemany('insert into goods values (?, ?)', [('a{0:d}'.format(i), i) for i in range(10)])
+        conn.commit()
+        conn.close()
+
+        self.opened = []
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+
+    def tearDown(self):
+        for conn in self.opened:
+            conn.close()
+        os.remove(self.path)
+
+    def _pause(self, seconds):
+        """функция SQL pause(секунды): задержка запроса и подсчет одновременно выполняемых
+        """
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(seconds)
+        with self.lock:
+            self.active -= 1
+        return 0
+
+    def connect(self):
+        conn = sqlite3.connect(self.path, factory=_Connection, check_same_thread=False)
+        conn.create_function('pause', 1, self._pause)
+        self.opened.append(conn)
+        return conn
+
+class SQLConnectionPoolTest(PoolTestCase):
+    def test_reuse_up_to_max_connections(self):
+        pool = SQLConnectionPool(self.connect, max_connections=2)
+        for _ in range(3):
+            with pool.connection() as conn:
+                conn.execute('select 1')
+        self.assertEqual(len(self.opened), 1)
+
+        with pool.connection() as c1, pool.connection() as c2:
+            self.assertIsNot(c1, c2)
+            with self.assertRaises(TimeoutError):
+                pool.acquire(timeout=0.05)
+        self.assertEqual(len(self.opened), 2)
+
+        with pool.connection() as conn:
+            self.assertIn(conn, self.opened)
+        self.assertEqual(len(self.opened), 2)
+        pool.close()
+
+    def test_pool_timeout(self):
+        pool = SQLConnectionPool(self.connect, max_connections=1, timeout=0.05)
+        conn = pool.acquire()
+        with self.assertRaises(TimeoutError):
+            with pool.connection():
+                pass
+        pool.release(conn)
+        with pool.connection() as again:
+            self.assertIs(again, conn)
+        pool.close()
+
+    def test_error_closes_connection(self):
+        pool = SQLConnectionPool(self.connect, max_connections=1)
+        with self.assertRaises(sqlite3.OperationalError):
+            with pool.connection() as conn:
+                conn.execute('select * from no_such_table')
+        self.assertTrue(conn.closed)
+
+        # место в пуле освободилось, и выдается новое соединение
+        with pool.connection(timeout=1) as conn2:
+            self.assertIsNot(conn2, conn)
+            self.assertFalse(conn2.closed)
+        pool.close()
+
+    def test_closed_generator_returns_connection(self):
+        executor = SQLQueryExecutor(SQLConnectionPool(self.connect, max_connections=1))
+        batches = executor.table_batches('select art, qty from goods order by qty', (TF('art'), TF('qty')),
+                                         batch_size=3)
+        self.assertEqual(next(batches), [['a0', 0], ['a1', 1], ['a2', 2]])
+        batches.close()
+
+        conn = self.opened[0]
+        self.assertFalse(conn.closed)
+        with executor.pool.connection(timeout=1) as again:
+            self.assertIs(again, conn)
+        executor.shutdown()
+        executor.pool.close()
+
+    def test_close(self):
+        pool = SQLConnectionPool(self.connect, max_connections=2)
+        busy = pool.acquire()
+        with pool.connection() as idle:
+            pass
+        pool.close()
+        self.assertTrue(idle.closed)
+        self.assertFalse(busy.closed)
+
+        pool.release(busy)
+        self.assertTrue(busy.closed)
+        with self.assertRaises(AssertionError):
+            pool.acquire()
+
+class SQLQueryExecutorTest(PoolTestCase):
+    def test_submitted_queries_overlap(self):
+        pool = SQLConnectionPool(self.connect, max_connections=3)
+        info = (TF('art'), TF('qty'))
+        with SQLQueryExecutor(pool) as executor:
+            futures = [executor.submit_table_data('select art, qty from goods where pause(0.02) = 0 '
+                                                  'and qty < ? order by qty', info, params=(n,))
+                       for n in (2, 3)]
+            futures.append(executor.submit_dict_data('select art from goods where pause(0.02) = 0 and qty = 9'))
+
+            self.assertEqual(futures[0].result(), [['a0', 0], ['a1', 1]])
+            self.assertEqual(len(futures[1].result()), 3)
+            self.assertEqual(futures[2].result(), [{'art': 'a9'}])
+        self.assertGreaterEqual(self.max_active, 2)
+        self.assertLessEqual(len(self.opened), 3)
+        pool.close()
+
+    def test_cursors_closed(self):
+        """курсор закрывается до возврата соединения в пул: после результата, ошибки и закрытия генератора
+        """
+        pool = SQLConnectionPool(self.connect, max_connections=1)
+        info = (TF('art'), TF('qty'))
+        with SQLQueryExecutor(pool) as executor:
+            self.assertEqual(len(executor.submit_table_data('select art, qty from goods', info).result()), 10)
+            self.assertEqual(executor.dict_data('select count(*) n from goods'), [{'n': 10}])
+            batches = executor.table_batches('select art, qty from goods', info, batch_size=3)
+            next(batches)
+            batches.close()
+            with self.assertRaises(sqlite3.OperationalError):
+                executor.dict_data('select * from no_such_table')
+
+        cursors = [cursor for conn in self.opened for cursor in conn.cursors]
+        self.assertEqual(len(cursors), 4)
+        self.assertTrue(all(cursor.closed for cursor in cursors))
+        pool.close()
+
+    def test_failed_query_future(self):
+        pool = SQLConnectionPool(self.connect, max_connections=1)
+        with SQLQueryExecutor(pool) as executor:
+            future = executor.submit_dict_data('select * from no_such_table')
+            with self.assertRaises(sqlite3.OperationalError):
+                future.result()
+            self.assertEqual(executor.submit_dict_data('select count(*) n from goods').result(), [{'n': 10}])
+        self.assertTrue(self.opened[0].closed)
+        pool.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Получение табличных данных через DB-API курсор (sqlutils) на базе sqlite3 в памяти
+"""
+
+import sqlite3
+import unittest
+
+from xlsreport.xlstable import XLSTableField as TF
+from xlsreport.sqlutils import *
+
+class FetchTableTest(unittest.TestCase):
+    def setUp(self):
+        self.conn = sqlite3.connect(':memory:')
+        self.conn.execute('create table goods (art text, qty integer, price real)')
+        self.conn.executemany('insert into goods values (?, ?, ?)',
+                              [('a{0:d}'.format(i), i, i * 0.5) for i in range(7)])
+
+    def tearDown(self):
+        self.conn.close()
+
+    def cursor(self, sqlquery='select art, qty, price from goods order by qty'):
+        return self.conn.execute(sqlquery)
+
+    def test_batch_boundaries(self):
+        """порции по batch_size строк, последняя неполная; число строк не кратно batch_size
+        """
+        info = (TF('art'), TF('qty', 'int'))
+        batches = list(fetch_table_batches(self.cursor(), info, batch_size=3))
+        self.assertEqual([len(b) for b in batches], [3, 3, 1])
+        self.assertEqual(batches[2], [['a6', 6]])
+
+        batches = list(fetch_table_batches(self.cursor(), info, batch_size=7))
+        self.assertEqual([len(b) for b in batches], [7])
+
+    def test_empty_result(self):
+        info = (TF('art'), TF('qty', 'int'))
+        cursor = self.cursor('select art, qty, price from goods where qty < 0')
+        self.assertEqual(list(fetch_table_batches(cursor, info, batch_size=3)), [])
+        cursor = self.cursor('select art, qty, price from goods where qty < 0')
+        self.assertEqual(fetch_table_data(cursor, info), [])
+
+    def test_column_order_from_description(self):
+        """значения идут в порядке полей table_info, а не колонок запроса
+        """
+        info = (TF('price', 'float'), TF('art'), TF('qty', 'int'))
+        cursor = self.cursor('select qty, art, price from goods order by qty')
+        self.assertEqual(column_positions(cursor, info), [2, 1, 0])
+        rows = fetch_table_data(cursor, info, batch_size=2)
+        self.assertEqual(rows[:2], [[0.0, 'a0', 0], [0.5, 'a1', 1]])
+        self.assertEqual(len(rows), 7)
+
+    def test_default_value_columns(self):
+        """поля без колонки в запросе ('' и '__...') заполняются default_value во всех порциях
+        """
+        info = (TF('art'), TF('', default_value='-'), TF('__flag', 'int', default_value=0), TF('qty', 'int'))
+        batches = list(fetch_table_batches(self.cursor(), info, batch_size=4))
+        self.assertEqual(batches[0][0], ['a0', '-', 0, 0])
+        self.assertEqual(batches[1][-1], ['a6', '-', 0, 6])
+        for batch in batches:
+            self.assertTrue(all(row[1] == '-' and row[2] == 0 for row in batch))
+            self.assertTrue(all(isinstance(row, list) for row in batch))
+
+    def test_missing_field(self):
+        info = (TF('art'), TF('amount', 'float'))
+        with self.assertRaisesRegex(KeyError, "нет поля 'amount'"):
+            fetch_table_data(self.cursor(), info)
+
+    def test_dict_data(self):
+        rows = fetch_dict_data(self.cursor('select art, qty from goods where qty < 2 order by qty'))
+        self.assertEqual(rows, [{'art': 'a0', 'qty': 0}, {'art': 'a1', 'qty': 1}])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,121 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Статистика колонок (xlsstats) и условия скрытия колонок: условия, проверенные заранее по
+статистике, скрывают те же колонки, что и проверка по ходу вывода, а скрываемые колонки
+выводятся без стилей
+"""
+
+import datetime
+import unittest
+
+try:
+    import numpy as np
+except ImportError:
+    np = None # module numpy doesn't exists
+
+from openpyxl.utils import get_column_letter
+
+from xlsreport.xlstable import XLSTableField as TF
+from xlsreport.xlstableheader import XLSTableHeader, XLSTableHeaderColumn as THC
+from xlsreport.xlsreport import XLSReport, XLSTable
+from xlsreport.xlsstats import *
+
+INFO = (TF('name', col_count=2), TF('zero', 'int'), TF('null', 'currency'), TF('empty', '1digit'),
+        TF('odd', 'int'), TF('qty', 'int'))
+ROWS = [['длинное название', 0, None, 0, 1, 1000], ['x', 0, None, None, 3, 2],
+        ['y', 0, float('nan'), 0.0, 5, 30], ['z', 0, None, 0, 7, 4]]
+CONDITIONS = {'zero': 'zero', 'null': 'null', 'empty': 'empty', 'odd': lambda v: v % 2 == 1, 'qty': 'zero'}
+
+def _stats_tuple(st):
+    return (st.count, st.null_count, st.zero_count, st.min, st.max, st.max_len)
+
+def _render(calculating):
+    table = XLSTable(INFO, [list(row) for row in ROWS])
+    for fname, cond in CONDITIONS.items():
+        table.add_hide_column_condition(fname, cond)
+    if calculating:
+        # функция расчета может менять значения, и условия проверяются по ходу вывода
+        table.set_calculating(lambda row: None)
+    rep = XLSReport('S')
+    rep.print_table(table, 1)
+    return rep._ws
+
+class ColumnStatsTest(unittest.TestCase):
+    def test_column_stats(self):
+        st = column_stats([3, None, 0, float('nan'), 1250.5], 'currency')
+        self.assertEqual(_stats_tuple(st), (5, 2, 1, 0, 1250.5, len('1,250.50')))
+        self.assertFalse(st.all_null)
+        self.assertTrue(column_stats([None, 0, 0.0], 'int').all_empty)
+        self.assertTrue(column_stats([], 'int').all_zero)
+
+        st = column_stats(['ab', 'a\nabc', None, datetime.date(2024, 1, 1)])
+        self.assertEqual((st.min, st.max, st.max_len), (None, None, 10))
+
+        # статистика порций складывается в статистику всей колонки
+        st = column_stats([1, 2], 'int')
+        st.update(column_stats([None, -5], 'int'))
+        self.assertEqual(_stats_tuple(st), (4, 1, 0, -5, 2, 2))
+
+    @unittest.skipIf(np is None, "нет модуля numpy")
+    def test_numpy_same_as_values(self):
+        for values, format in (([1.5, float('nan'), 0.0, -20.25], 'currency'), ([0, 7, 123456], 'int'),
+                               ([True, False], 'string')):
+            with self.subTest(values=values):
+                self.assertEqual(_stats_tuple(column_stats(np.array(values), format)),
+                                 _stats_tuple(column_stats(values, format)))
+
+    def test_table_stats(self):
+        stats = XLSTable(INFO, ROWS).column_stats()
+        self.assertTrue(stats['zero'].all_zero)
+        self.assertTrue(stats['null'].all_null)
+        self.assertTrue(stats['empty'].all_empty)
+        self.assertFalse(stats['qty'].all_empty)
+        self.assertEqual((stats['qty'].min, stats['qty'].max, stats['qty'].max_len), (2, 1000, 5))
+
+class HideConditionsTest(unittest.TestCase):
+    def test_same_as_checked_per_row(self):
+        """колонки A-B - название, C - zero, D - null, E - empty, F - odd, G - qty
+        """
+        hidden = dict()
+        for calculating in (False, True):
+            ws = _render(calculating)
+            hidden[calculating] = sorted(k for k, dim in ws.column_dimensions.items() if dim.hidden)
+            self.assertEqual([ws.cell(row=r, column=7).value for r in range(1, 5)], [1000, 2, 30, 4])
+        self.assertEqual(hidden[False], ['C', 'D', 'E', 'F'])
+        self.assertEqual(hidden[True], hidden[False])
+
+    def test_pruned_columns_unstyled(self):
+        """у скрываемых колонок нет формата, выравнивания и рамок ячеек, остается только рамка
+        вокруг таблицы на первой и последней строке
+        """
+        ws = _render(calculating=False)
+        for col in range(1, 8):
+            letter = get_column_letter(col)
+            cells = [ws.cell(row=r, column=col) for r in range(1, 5)]
+            with self.subTest(column=letter):
+                if letter in ('C', 'D', 'E', 'F'):
+                    self.assertEqual([cl.has_style for cl in cells[1:3]], [False, False])
+                    self.assertEqual({cl.alignment.horizontal for cl in cells}, {None})
+                    self.assertEqual({cl.number_format for cl in cells}, {'General'})
+                    self.assertEqual((cells[0].border.top.style, cells[3].border.bottom.style), ('medium', 'medium'))
+                else:
+                    self.assertEqual({cl.border.left.style is not None for cl in cells}, {True})
+        self.assertEqual(ws['G2'].number_format, '# ### ### ###')
+
+    def test_auto_widths(self):
+        table = XLSTable(INFO, ROWS)
+        widths = table.column_widths(min_width=6, max_width=60, padding=2)
+        self.assertEqual(widths[0], widths[1])
+        self.assertEqual(widths[0], (len('длинное название') + 2) / 2)
+        self.assertEqual(widths[6], 7)
+
+        header = XLSTableHeader(columns=[THC('Название', widths=[20, 20])] +
+                                        [THC(ci.fname) for ci in INFO[1:]])
+        rep = XLSReport('S')
+        header.apply_widths(rep._ws, 2, widths)
+        self.assertEqual(rep._ws.column_dimensions['B'].width, 20)
+        self.assertEqual(rep._ws.column_dimensions['H'].width, 7)
+
+if __name__ == '__main__':
+    unittest.main()
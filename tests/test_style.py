@@ -0,0 +1,123 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Реестр стилей (xlsstyle): индексы стилей, которые set_* функции присваивают ячейкам,
+дают в сохраненной книге те же стили, что и назначение объектов openpyxl каждой ячейке
+"""
+
+import io
+import unittest
+from copy import copy
+
+from openpyxl import Workbook, load_workbook
+from openpyxl.styles.borders import Border, Side
+from openpyxl.styles import Font, Alignment, PatternFill
+
+from xlsreport.xlsutils_apply import *
+
+def _cell_style(cl):
+    # copy() снимает с объекта стиля StyleProxy, которые не сравниваются между собой
+    return (copy(cl.font), copy(cl.fill), copy(cl.border), cl.number_format, copy(cl.alignment))
+
+def _styled_ids(ws):
+    """пример отчета через set_* функции: строки 1-2 - шапка, 3-4 - данные
+    """
+    set_borders(ws, 1, 1, 4, 3)
+    set_font(ws, 1, 1, 2, 3, bold=True, color='FF0000FF')
+    set_alignment(ws, 1, 1, 2, 3)
+    set_fill(ws, 1, 1, 2, 3, color='DFDFDF')
+    set_alignment(ws, 3, 1, 4, 3, horizontal='right')
+    set_format(ws, 3, 2, 4, 2, format='int')
+    set_format(ws, 3, 3, 4, 3, format='date')
+    set_pattern_fill(ws, 4, 1, 4, 1, bg_color='FFFF00', fg_color='FF0000', pattern_type='gray125')
+    set_outline(ws, 1, 1, 4, 3, border_style='medium')
+
+def _cells(ws, start_row, start_col, end_row, end_col):
+    for r in range(start_row, end_row + 1):
+        for c in range(start_col, end_col + 1):
+            yield ws.cell(row=r, column=c)
+
+def _styled_objects(ws):
+    """тот же пример, стили назначаются каждой ячейке объектами openpyxl, как set_* функции
+    делали до реестра стилей
+    """
+    side = Side(style='thin')
+    for cl in _cells(ws, 1, 1, 4, 3):
+        cl.border = Border(left=side, right=side, top=side, bottom=side)
+    for cl in _cells(ws, 1, 1, 2, 3):
+        cl.font = Font(name='Calibri', size=11, bold=True, italic=False, underline='none',
+                       vertAlign='baseline', strike=False, color='FF0000FF')
+        cl.alignment = Alignment(horizontal='center', vertical='center', textRotation=0,
+                                 wrapText=True, shrinkToFit=True)
+        cl.fill = PatternFill(start_color='DFDFDF', end_color='DFDFDF', fill_type='solid')
+    for cl in _cells(ws, 3, 1, 4, 3):
+        cl.alignment = Alignment(horizontal='right', vertical='center', textRotation=0,
+                                 wrapText=True, shrinkToFit=True)
+    for cl in _cells(ws, 3, 2, 4, 2):
+        cl.number_format = '# ### ### ###'
+    for cl in _cells(ws, 3, 3, 4, 3):
+        cl.number_format = 'DD.MM.YYYY'
+    ws['A4'].fill = PatternFill(bgColor='FFFF00', fgColor='FF0000', patternType='gray125')
+
+    def _outline(cl, side_name):
+        new_border = copy(cl.border)
+        getattr(new_border, side_name).border_style = 'medium'
+        cl.border = new_border
+
+    for r in range(1, 5):
+        _outline(ws.cell(row=r, column=1), 'left')
+        _outline(ws.cell(row=r, column=3), 'right')
+    for c in range(1, 4):
+        _outline(ws.cell(row=1, column=c), 'top')
+        _outline(ws.cell(row=4, column=c), 'bottom')
+
+def _saved(style_fn):
+    wb = Workbook()
+    ws = wb.active
+    for r in range(1, 5):
+        for c in range(1, 4):
+            ws.cell(row=r, column=c, value=r * 10 + c)
+    style_fn(ws)
+    out = io.BytesIO()
+    wb.save(out)
+    return load_workbook(out).active
+
+class StyleRegistryTest(unittest.TestCase):
+    def test_same_as_cell_objects(self):
+        by_ids = _saved(_styled_ids)
+        by_objects = _saved(_styled_objects)
+        for r in range(1, 5):
+            for c in range(1, 4):
+                with self.subTest(row=r, column=c):
+                    self.assertEqual(_cell_style(by_ids.cell(row=r, column=c)),
+                                     _cell_style(by_objects.cell(row=r, column=c)))
+
+    def test_interned(self):
+        """объекты стилей создаются один раз на процесс, индексы - один раз на книгу
+        """
+        self.assertIs(style_font(bold=True), style_font(bold=True))
+        self.assertIs(style_border('thin'), style_border('thin'))
+        self.assertIsNot(style_fill('DFDFDF'), style_fill('FFFFFF'))
+
+        wb = Workbook()
+        ids = style_ids(wb, font=style_font(bold=True), number_format=style_number_format('int'))
+        self.assertIs(style_ids(wb, font=style_font(bold=True), number_format=style_number_format('int')), ids)
+        fonts = len(wb._fonts)
+
+        ws = wb.active
+        set_font(ws, 1, 1, 50, 5, bold=True)
+        set_format(ws, 1, 1, 50, 5, format='int')
+        self.assertEqual(len(wb._fonts), fonts)
+        self.assertEqual(len({id(ws.cell(row=r, column=1)._style) for r in range(1, 51)}), 50)
+        self.assertEqual({ws.cell(row=r, column=c).font.b for r in range(1, 51) for c in range(1, 6)}, {True})
+
+    def test_unknown_format(self):
+        """неизвестный формат поля не меняет числовой формат ячейки
+        """
+        ws = Workbook().active
+        set_format(ws, 1, 1, 1, 1, format='int')
+        set_format(ws, 1, 1, 1, 1, format='str')
+        self.assertEqual(ws['A1'].number_format, '# ### ### ###')
+
+if __name__ == '__main__':
+    unittest.main()
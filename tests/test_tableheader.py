@@ -0,0 +1,117 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Шапка таблицы (XLSTableHeader): откомпилированная шапка (XLSHeaderStamp) выводится так же,
+как шапка, которая строится обходом дерева столбцов с объединением и стилями по ячейкам
+"""
+
+import io
+import pickle
+import unittest
+from copy import copy
+
+from openpyxl import Workbook, load_workbook
+
+from xlsreport.xlstable import XLSTableField as TF
+from xlsreport.xlstableheader import XLSTableHeader, XLSTableHeaderColumn as THC
+from xlsreport.xlsreport import XLSReport, XLSTable
+from xlsreport.xlsutils_apply import *
+
+HEADER = XLSTableHeader(columns=[THC('Артикул', widths=[12]),
+                                 THC('Продажи', struct=[THC('Кол-во', widths=[8]),
+                                                        THC('Сумма', struct=[THC('Опт'), THC('Розница')])]),
+                                 THC('Примечание', widths=[10, 10])])
+SINGLE = XLSTableHeader(columns=[THC('Кол-во'), THC('Сумма', widths=[8, 8])], bgcolor='B7CAF7')
+
+def _apply_per_cell(header, ws, first_row, first_col):
+    """шапка обходом дерева столбцов, как XLSTableHeader.apply до компиляции шапки
+    """
+    def _traverse(colinfo, cur_col, cur_height):
+        start_row = first_row + cur_height
+        end_row = start_row if colinfo.tree_height > 1 else first_row + header.row_count - 1
+        end_col = cur_col + colinfo.column_count - 1
+        apply_range(ws, start_row, cur_col, end_row, end_col, set_merge)
+        ws.cell(row=start_row, column=cur_col).value = colinfo.title
+        for coli in colinfo.struct:
+            _traverse(coli, cur_col, cur_height + 1)
+            cur_col += coli.column_count
+
+    if header.row_count == 1:
+        ws.row_dimensions[first_row].height = header.first_row_height
+    else:
+        for i in range(header.row_count):
+            ws.row_dimensions[first_row + i].height = header.default_row_height
+
+    cur_col = first_col
+    for colinfo in header._columns:
+        _traverse(colinfo, cur_col, 0)
+        cur_col += colinfo.column_count
+
+    clr = get_xlrange(first_row, first_col, first_row + header.row_count - 1, cur_col - 1)
+    apply_xlrange(ws, clr, set_style, border=style_border(), font=style_font(bold=True),
+                  alignment=style_alignment(), fill=style_fill(color=header._bgcolor))
+    apply_xlrange(ws, clr, set_outline, border_style='medium')
+    return first_row + header.row_count
+
+def _snapshot(ws):
+    cells = {cl.coordinate: (cl.value, copy(cl.font), copy(cl.fill), copy(cl.border), copy(cl.alignment))
+             for row in ws.iter_rows() for cl in row if cl.has_style or (cl.value is not None)}
+    return dict(cells=cells, merges=sorted(str(m) for m in ws.merged_cells.ranges),
+                heights=[ws.row_dimensions[r].height or ws.sheet_format.defaultRowHeight
+                         for r in range(1, ws.max_row + 1)])
+
+def _saved(apply_fn):
+    wb = Workbook()
+    ws = wb.active
+    row = apply_fn(HEADER, ws, 2, 3)
+    row = apply_fn(SINGLE, ws, row + 1, 1)
+    apply_fn(HEADER, ws, row, 1)
+    out = io.BytesIO()
+    wb.save(out)
+    return load_workbook(out).active
+
+class HeaderStampTest(unittest.TestCase):
+    def test_same_as_per_cell(self):
+        stamped = _saved(lambda header, ws, row, col: header.apply(ws, row, col))
+        self.assertEqual(_snapshot(stamped), _snapshot(_saved(_apply_per_cell)))
+        self.assertEqual(stamped['C2'].value, 'Артикул')
+        self.assertIn('C2:C4', [str(m) for m in stamped.merged_cells.ranges])
+
+    def test_compiled_once_per_workbook(self):
+        header = XLSTableHeader(columns=[THC('a'), THC('b')])
+        wb = Workbook()
+        stamp = header.compile(wb)
+        self.assertIs(header.compile(wb), stamp)
+        self.assertIsNot(header.compile(Workbook()), stamp)
+
+        # оттиски привязаны к книгам процесса и через pickle не передаются
+        clone = pickle.loads(pickle.dumps(header))
+        self.assertIsNot(clone.compile(wb), stamp)
+        self.assertEqual(clone.compile(wb).merges, stamp.merges)
+
+    def test_subtitle_callback(self):
+        """шапка в функции подзаголовка выводится при каждой группе во всех режимах вывода
+        """
+        info = (TF('group'), TF('qty', 'int'), TF('price', 'currency'))
+        rows = [['a', 1, 1.5], ['a', 2, 2.5], ['b', 3, 3.0], ['c', 4, 4.25]]
+        snapshots = dict()
+        for mode in ('memory', 'streaming', 'direct'):
+            rep = XLSReport('S', streaming=(mode == 'streaming'), direct=(mode == 'direct'))
+            def _subtitle(ws, row_data, cur_row, first_col):
+                return rep.print_tableheader(SINGLE, cur_row, first_col + 1)
+
+            table = XLSTable(info, [list(row) for row in rows])
+            table.hierarchy_append('group', subtitle=_subtitle)
+            rep.print_table(table, 1)
+            out = io.BytesIO()
+            rep.save(out)
+            ws = load_workbook(out).active
+            snapshots[mode] = (_snapshot(ws), [row for row in ws.iter_rows(values_only=True)])
+
+        values = snapshots['memory'][1]
+        self.assertEqual(sum(1 for row in values if row[1] == 'Кол-во'), 3)
+        self.assertEqual(snapshots['streaming'][1], values)
+        self.assertEqual(snapshots['direct'], snapshots['memory'])
+
+if __name__ == '__main__':
+    unittest.main()
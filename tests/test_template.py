@@ -0,0 +1,122 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Шаблоны отчетов (xlstemplate): копии шаблона независимы друг от друга и от шаблона, сохраняют
+параметры печати, ширины колонок, шапку и именованные стили; разобранный шаблон кэшируется
+"""
+
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from openpyxl import Workbook, load_workbook
+from openpyxl.styles import Font, NamedStyle
+
+from xlsreport.xlstable import XLSTableField as TF
+from xlsreport.xlsreport import XLSReport, XLSTable, PrintSetup
+from xlsreport.xlstemplate import *
+
+INFO = (TF('name'), TF('qty', 'int'))
+
+def _write_template(path, title='Шапка шаблона'):
+    wb = Workbook()
+    ws = wb.active
+    ws.title = 'Шаблон'
+    ws['A1'] = title
+    ws['A1'].font = Font(bold=True, size=14)
+    ws.merge_cells('A1:B1')
+    ws.row_dimensions[1].height = 40
+    ws.column_dimensions['A'].width = 30
+    ws.page_setup.orientation = 'portrait'
+    ws.page_setup.fitToWidth = 2
+    wb.add_named_style(NamedStyle(name='Итог', font=Font(italic=True)))
+    wb.save(path)
+
+def _render(template, rows, **kwargs):
+    rep = XLSReport('Отчет', template=template, print_setup=PrintSetup.LandscapeW1, **kwargs)
+    rep.print_table(XLSTable(INFO, rows), rep.start_row + 1)
+    out = io.BytesIO()
+    rep.save(out)
+    return rep, load_workbook(out)
+
+class TemplateTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'template.xlsx')
+        _write_template(self.path)
+        clear_template_cache()
+
+    def tearDown(self):
+        clear_template_cache()
+        shutil.rmtree(self.directory)
+
+    def test_report_from_template(self):
+        for direct in (False, True):
+            with self.subTest(direct=direct):
+                rep, wb = _render(self.path, [['a', 1], ['b', 2]], direct=direct)
+                self.assertEqual(rep.start_row, 2)
+                ws = wb.active
+                self.assertEqual(wb.sheetnames, ['Отчет'])
+                self.assertEqual((ws['A1'].value, ws['A1'].font.b, ws['A1'].font.sz), ('Шапка шаблона', True, 14))
+                self.assertEqual([str(m) for m in ws.merged_cells.ranges], ['A1:B1'])
+                self.assertEqual(ws.row_dimensions[1].height, 40)
+                self.assertEqual(ws.column_dimensions['A'].width, 30)
+                self.assertEqual((ws.page_setup.orientation, ws.page_setup.fitToWidth), ('portrait', 2))
+                self.assertIn('Итог', wb.named_styles)
+                self.assertEqual([(ws.cell(row=r, column=1).value, ws.cell(row=r, column=2).value) for r in (3, 4)],
+                                 [('a', 1), ('b', 2)])
+
+    def test_clones_independent(self):
+        template = XLSTemplate(self.path)
+        first = template.clone()
+        ws = first.active
+        ws['A1'] = 'изменено'
+        ws['C5'] = 'новая ячейка'
+        ws.column_dimensions['A'].width = 5
+        ws.row_dimensions[7].height = 50 # строки создаются и в копии шаблона
+        ws.unmerge_cells('A1:B1')
+        first.add_named_style(NamedStyle(name='Другой'))
+
+        second = template.clone()
+        ws2 = second.active
+        self.assertEqual(ws2['A1'].value, 'Шапка шаблона')
+        self.assertIsNone(ws2['C5'].value)
+        self.assertEqual(ws2.column_dimensions['A'].width, 30)
+        self.assertEqual([str(m) for m in ws2.merged_cells.ranges], ['A1:B1'])
+        self.assertNotIn('Другой', second.named_styles)
+        self.assertIsNot(ws2.row_dimensions, ws.row_dimensions)
+        self.assertIs(ws2.row_dimensions.worksheet, ws2)
+
+        out = io.BytesIO()
+        first.save(out)
+        self.assertEqual(load_workbook(out).active.row_dimensions[7].height, 50)
+
+        # отчеты по одному шаблону не видят строк друг друга
+        _, wb1 = _render(template, [['a', 1]])
+        _, wb2 = _render(template, [['b', 2], ['c', 3]])
+        self.assertEqual(wb1.active.max_row, 3)
+        self.assertEqual([wb2.active.cell(row=r, column=1).value for r in (3, 4)], ['b', 'c'])
+
+    def test_cache(self):
+        template = load_template(self.path)
+        self.assertIs(load_template(os.path.join(self.directory, '.', 'template.xlsx')), template)
+
+        # измененный файл разбирается заново
+        _write_template(self.path, 'Новая шапка шаблона')
+        st = os.stat(self.path)
+        os.utime(self.path, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+        changed = load_template(self.path)
+        self.assertIsNot(changed, template)
+        self.assertEqual(changed.clone().active['A1'].value, 'Новая шапка шаблона')
+
+        clear_template_cache()
+        self.assertIsNot(load_template(self.path), changed)
+
+    def test_streaming_not_supported(self):
+        with self.assertRaisesRegex(AssertionError, "direct=True"):
+            XLSReport('S', streaming=True, template=self.path)
+
+if __name__ == '__main__':
+    unittest.main()
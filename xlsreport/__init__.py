@@ -1,10 +1,65 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
 
-from .xlsreport import *
+"""Модули пакета загружаются при первом обращении к их именам (xlsreport.XLSReport и т.п.),
+поэтому import xlsreport не импортирует openpyxl и остальные зависимости. from xlsreport import *
+загружает все модули, как и раньше. Запуск отчета по описанию: python -m xlsreport (см. xlscli)
+"""
 
+import sys
+import pkgutil
+import importlib
+
+# модули, имена которых доступны из пакета, в порядке поиска имени
+_MODULES = ['.xlsreport', '.xlsparallel', '.xlsfarm']
 if sys.platform.startswith('win'):
+    _MODULES.append('.sqltabledata') # нужны модули pymssql и config
+
+# подмодули пакета: from xlsreport import xlscli загружает только xlscli
+_SUBMODULES = frozenset(info.name for info in pkgutil.iter_modules(__path__))
+
+# модули, которые не удалось загрузить: повторный импорт при каждом имени не нужен
+_FAILED = set()
+
+def _load(modname):
+    if modname in _FAILED:
+        return None
     try:
-        from .sqltabledata import *
-    except ImportError as e:
-        pass # module pymssql doesn't exists
+        return importlib.import_module(modname, __name__)
+    except ImportError:
+        if modname == '.sqltabledata':
+            _FAILED.add(modname)
+            return None # module pymssql doesn't exists
+        raise
+
+def _public_names(module):
+    names = getattr(module, '__all__', None)
+    if names is None:
+        names = [name for name in vars(module) if not name.startswith('_')]
+    return names
+
+def __getattr__(name):
+    if name == '__all__':
+        names = []
+        for modname in _MODULES:
+            module = _load(modname)
+            if module is not None:
+                names.extend(n for n in _public_names(module) if n not in names)
+        return names
+
+    if name in _SUBMODULES:
+        return importlib.import_module('.' + name, __name__)
+
+    if not name.startswith('__'):
+        for modname in _MODULES:
+            module = _load(modname)
+            if (module is not None) and hasattr(module, name):
+                value = getattr(module, name)
+                globals()[name] = value
+                return value
+        if name in globals():
+            return globals()[name] # подмодуль, загруженный вместе с модулями выше
+    raise AttributeError("module '{0:s}' has no attribute '{1:s}'".format(__name__, name))
+
+def __dir__():
+    return sorted(set(globals()) | set(__getattr__('__all__')))
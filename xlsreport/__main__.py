@@ -0,0 +1,11 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""python -m xlsreport report.json - вывод отчета по описанию, см. xlscli
+"""
+
+import sys
+
+from .xlscli import main
+
+sys.exit(main())
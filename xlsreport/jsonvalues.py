@@ -0,0 +1,52 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""JSON со значениями, которых в JSON нет: даты и время, Decimal, UUID, bytes, скаляры NumPy.
+Такое значение записывается объектом с одним ключом-тегом, например {"$date": "2026-10-01"}.
+Разбор JSON, в отличие от pickle, не выполняет кода, поэтому так хранятся данные, которые
+читаются из-за пределов процесса: состояние таблиц в свойствах книги и файлы кэша запросов
+"""
+
+import json
+import uuid
+import base64
+import decimal
+import datetime
+
+def _encode(value):
+    if isinstance(value, datetime.datetime):
+        return {'$datetime': value.isoformat()}
+    if isinstance(value, datetime.date):
+        return {'$date': value.isoformat()}
+    if isinstance(value, datetime.time):
+        return {'$time': value.isoformat()}
+    if isinstance(value, decimal.Decimal):
+        return {'$decimal': str(value)}
+    if isinstance(value, uuid.UUID):
+        return {'$uuid': str(value)}
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return {'$bytes': base64.b64encode(value).decode('ascii')}
+    if hasattr(value, 'item'):
+        return value.item()
+    raise TypeError("значение {0!r} не записывается в JSON".format(value))
+
+_DECODERS = {'$datetime': datetime.datetime.fromisoformat, '$date': datetime.date.fromisoformat,
+             '$time': datetime.time.fromisoformat, '$decimal': decimal.Decimal,
+             '$uuid': uuid.UUID, '$bytes': base64.b64decode}
+
+def _decode(obj):
+    if len(obj) == 1:
+        key, value = next(iter(obj.items()))
+        if key in _DECODERS:
+            return _DECODERS[key](value)
+    return obj
+
+def dumps_values(obj):
+    """Текст JSON объекта obj со значениями-тегами; кортежи записываются списками
+    """
+    return json.dumps(obj, ensure_ascii=False, separators=(',', ':'), default=_encode)
+
+def loads_values(text):
+    """Объект из текста dumps_values
+    """
+    return json.loads(text, object_hook=_decode)
@@ -0,0 +1,242 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Кэш результатов запросов: LRU в памяти и файлы на диске, время жизни на каждую запись
+"""
+
+import os
+import re
+import time
+import zlib
+import struct
+import hashlib
+import threading
+from collections import OrderedDict
+
+from .jsonvalues import dumps_values, loads_values
+
+_QUOTED = re.compile(r"('(?:[^']|'')*'|\"(?:[^\"]|\"\")*\"|\[[^\]]*\])")
+
+_FILE_MAGIC = b'XRC2' # XRC1 - прежний формат с pickle, такие файлы не читаются
+_FILE_HEADER = struct.Struct('<4sdI') # magic, время истечения, длина текста запроса
+_FILE_SUFFIX = '.xrc'
+
+def normalize_query(sqlquery):
+    """Приводит текст запроса к каноническому виду: пробельные символы вне строковых
+    литералов и идентификаторов в кавычках схлопываются в один пробел
+    """
+    parts = _QUOTED.split(sqlquery)
+    for i in range(0, len(parts), 2):
+        parts[i] = ' '.join(parts[i].split())
+    return ''.join(parts).strip()
+
+class SQLResultCache:
+    """Кэш результатов запросов. Ключ - нормализованный текст запроса, параметры и список полей
+    table_info. Первый уровень - LRU в памяти (не более max_entries записей и max_memory_bytes байт),
+    второй - файлы в каталоге directory (сжатый JSON, не более max_disk_bytes байт, вытесняются
+    дольше всего не читавшиеся). ttl - время жизни записи в секундах по умолчанию, ttl=0 - запрос
+    не кэшируется. Результаты хранятся сериализованными (jsonvalues), поэтому каждое чтение из кэша
+    возвращает новую копию: строки и кортежи - списками, значения - типов JSON, даты и время,
+    Decimal, UUID и bytes. Чтение файла кэша не выполняет кода, но подмененный файл подменяет
+    результат запроса, поэтому каталог кэша не должен быть доступен для записи другим пользователям.
+    Размер каталога учитывается по индексу в памяти: файлы, найденные при создании кэша, и
+    записи, сохраненные им; время последнего чтения записи - время изменения ее файла
+    """
+    def __init__(self, ttl=3600, max_entries=256, max_memory_bytes=64 * 2**20,
+                 directory=None, max_disk_bytes=512 * 2**20):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_memory_bytes = max_memory_bytes
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+
+        self._memory = OrderedDict() # key -> (expires, query, payload)
+        self._memory_bytes = 0
+        self._disk = OrderedDict()   # key -> размер файла, от дольше всего не читавшихся
+        self._disk_bytes = 0
+        self._lock = threading.RLock()
+
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+
+        if directory is not None:
+            os.makedirs(directory, mode=0o700, exist_ok=True)
+            self._disk_scan()
+
+    @staticmethod
+    def make_key(sqlquery, params=None, fields=None):
+        raw = repr((normalize_query(sqlquery),
+                    tuple(params) if isinstance(params, list) else params,
+                    tuple(fields) if fields is not None else None))
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    def _file_name(self, key):
+        return os.path.join(self.directory, key + _FILE_SUFFIX)
+
+    def _read_file(self, filename, with_payload=True):
+        """Возвращает (время истечения, текст запроса, payload) записи на диске или None
+        """
+        try:
+            with open(filename, 'rb') as f:
+                header = f.read(_FILE_HEADER.size)
+                magic, expires, qlen = _FILE_HEADER.unpack(header)
+                if magic != _FILE_MAGIC:
+                    return None
+                query = f.read(qlen).decode('utf-8')
+                payload = zlib.decompress(f.read()) if with_payload else None
+        except (OSError, struct.error, zlib.error, UnicodeDecodeError):
+            return None
+        return (expires, query, payload)
+
+    def _remove_file(self, filename):
+        try:
+            os.remove(filename)
+        except OSError:
+            pass
+
+    def _disk_scan(self):
+        """Индекс файлов каталога по времени последнего чтения или записи
+        """
+        files = []
+        for de in os.scandir(self.directory):
+            if de.name.endswith(_FILE_SUFFIX):
+                st = de.stat()
+                files.append((st.st_mtime, de.name[:-len(_FILE_SUFFIX)], st.st_size))
+        for _, key, size in sorted(files):
+            self._disk[key] = size
+            self._disk_bytes += size
+
+    def _disk_remove(self, key):
+        self._remove_file(self._file_name(key))
+        self._disk_bytes -= self._disk.pop(key, 0)
+
+    def _disk_touch(self, key):
+        """Прочитанная запись становится последней в очереди вытеснения
+        """
+        if key in self._disk:
+            self._disk.move_to_end(key)
+        try:
+            os.utime(self._file_name(key))
+        except OSError:
+            pass
+
+    def _memory_put(self, key, entry):
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_bytes -= len(old[2])
+        self._memory[key] = entry
+        self._memory_bytes += len(entry[2])
+
+        while self._memory and ((len(self._memory) > self.max_entries) or
+                                (self._memory_bytes > self.max_memory_bytes)):
+            _, (_, _, payload) = self._memory.popitem(last=False)
+            self._memory_bytes -= len(payload)
+
+    def _memory_remove(self, key):
+        entry = self._memory.pop(key, None)
+        if entry is not None:
+            self._memory_bytes -= len(entry[2])
+
+    def _disk_put(self, key, entry):
+        expires, query, payload = entry
+        qbytes = query.encode('utf-8')
+        filename = self._file_name(key)
+        tmpname = '{0:s}.{1:d}.{2:d}.tmp'.format(filename, os.getpid(), threading.get_ident())
+        with open(tmpname, 'wb') as f:
+            f.write(_FILE_HEADER.pack(_FILE_MAGIC, expires, len(qbytes)))
+            f.write(qbytes)
+            f.write(zlib.compress(payload, 1))
+            size = f.tell()
+        os.replace(tmpname, filename)
+
+        self._disk_bytes += size - self._disk.pop(key, 0)
+        self._disk[key] = size
+        while self._disk and (self._disk_bytes > self.max_disk_bytes):
+            self._disk_remove(next(iter(self._disk)))
+
+    def get(self, key):
+        """Возвращает сохраненный результат или None, если записи нет или ее время жизни истекло
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return loads_values(entry[2])
+                self._memory_remove(key)
+
+            if self.directory is not None:
+                filename = self._file_name(key)
+                entry = self._read_file(filename)
+                if entry is not None:
+                    if entry[0] > now:
+                        self._memory_put(key, entry)
+                        self._disk_touch(key)
+                        self.hits += 1
+                        self.disk_hits += 1
+                        return loads_values(entry[2])
+                    self._disk_remove(key)
+
+            self.misses += 1
+            return None
+
+    def put(self, key, value, ttl=None, sqlquery=''):
+        if ttl is None: ttl = self.ttl
+        if ttl <= 0:
+            return
+
+        entry = (time.time() + ttl, normalize_query(sqlquery), dumps_values(value).encode('utf-8'))
+        with self._lock:
+            self._memory_put(key, entry)
+            if self.directory is not None:
+                self._disk_put(key, entry)
+
+    def cached(self, loader, sqlquery, params=None, fields=None, ttl=None):
+        """Возвращает результат из кэша, а при его отсутствии вызывает loader() и сохраняет результат
+        """
+        if ttl is None: ttl = self.ttl
+        if ttl <= 0:
+            return loader()
+
+        key = self.make_key(sqlquery, params, fields)
+        value = self.get(key)
+        if value is None:
+            value = loader()
+            self.put(key, value, ttl, sqlquery)
+        return value
+
+    def invalidate(self, sqlquery, params=None, fields=None):
+        """Удаляет результат конкретного запроса
+        """
+        key = self.make_key(sqlquery, params, fields)
+        with self._lock:
+            self._memory_remove(key)
+            if self.directory is not None:
+                self._disk_remove(key)
+
+    def invalidate_where(self, predicate):
+        """Удаляет все записи, для нормализованного текста запроса которых predicate(query) истинно,
+        например все запросы по еще не закрытому периоду
+        """
+        with self._lock:
+            for key in [k for k, e in self._memory.items() if predicate(e[1])]:
+                self._memory_remove(key)
+
+            if self.directory is not None:
+                for de in os.scandir(self.directory):
+                    if de.name.endswith(_FILE_SUFFIX):
+                        entry = self._read_file(de.path, with_payload=False)
+                        if (entry is None) or predicate(entry[1]):
+                            self._disk_remove(de.name[:-len(_FILE_SUFFIX)])
+
+    def clear(self):
+        self.invalidate_where(lambda query: True)
+
+    def stats(self):
+        with self._lock:
+            return dict(hits=self.hits, misses=self.misses, disk_hits=self.disk_hits,
+                        entries=len(self._memory), memory_bytes=self._memory_bytes,
+                        disk_entries=len(self._disk), disk_bytes=self._disk_bytes)
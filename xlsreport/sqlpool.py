@@ -0,0 +1,172 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Пул соединений и параллельное выполнение запросов для любого DB-API модуля
+"""
+
+import queue
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+from .sqlutils import *
+from .xlspipeline import XLSPrefetchRows
+
+class SQLConnectionPool:
+    """Пул соединений DB-API. connect - функция без параметров, открывающая новое соединение,
+    например lambda: pymssql.connect(...) или lambda: sqlite3.connect(path, check_same_thread=False).
+    Соединения открываются по мере надобности, но не более max_connections одновременно,
+    и возвращаются в пул после использования. timeout - сколько секунд ждать свободного
+    соединения (None - без ограничения)
+    """
+    def __init__(self, connect, max_connections=4, timeout=None):
+        self._connect = connect
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(max_connections)
+        self._closed = False
+
+    def acquire(self, timeout=None):
+        """Берет соединение из пула, открывая новое, если свободных нет. Если все max_connections
+        соединений заняты дольше timeout секунд (по умолчанию - timeout пула), вызывает
+        TimeoutError. Соединение возвращается в пул вызовом release
+        """
+        assert not self._closed, "пул соединений закрыт"
+
+        timeout = self.timeout if timeout is None else timeout
+        if not self._slots.acquire(timeout=timeout):
+            raise TimeoutError("все {0:d} соединений пула заняты дольше {1} с".format(
+                self.max_connections, timeout))
+        try:
+            try:
+                return self._idle.get_nowait()
+            except queue.Empty:
+                return self._connect()
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def release(self, conn, broken=False):
+        """Возвращает соединение в пул; соединение после ошибки (broken) и соединения
+        закрытого пула закрываются
+        """
+        try:
+            if broken or self._closed:
+                conn.close()
+            else:
+                self._idle.put(conn)
+        finally:
+            self._slots.release()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """Выдает соединение из пула на время блока with (см. acquire). Если в блоке произошла
+        ошибка, соединение закрывается, а не возвращается в пул. Закрытие генератора, который
+        держит соединение (например, table_batches, прочитанный не до конца), ошибкой не считается
+        """
+        conn = self.acquire(timeout)
+        try:
+            yield conn
+        except GeneratorExit:
+            self.release(conn)
+            raise
+        except BaseException:
+            self.release(conn, broken=True)
+            raise
+        else:
+            self.release(conn)
+
+    def close(self):
+        """Закрывает все свободные соединения, занятые закрываются при возврате в пул
+        """
+        self._closed = True
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class SQLQueryExecutor:
+    """Выполняет запросы в пуле потоков через соединения из SQLConnectionPool и возвращает
+    concurrent.futures.Future. Независимые запросы выполняются одновременно, пока
+    уже полученные таблицы выводятся в отчет
+    """
+    def __init__(self, pool, max_workers=None, cache=None):
+        """cache - необязательный SQLResultCache для результатов запросов
+        """
+        self.pool = pool
+        self.cache = cache
+        self._executor = ThreadPoolExecutor(max_workers=max_workers or pool.max_connections)
+
+    def _execute(self, sqlquery, params, fetch):
+        """Выполняет запрос и возвращает fetch(cursor); курсор закрывается до возврата соединения в пул
+        """
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(sqlquery, *([params] if params is not None else []))
+                return fetch(cursor)
+            finally:
+                cursor.close()
+
+    def table_data(self, sqlquery, table_info, batch_size=1000, params=None, cache_ttl=None):
+        loader = lambda: self._execute(sqlquery, params,
+                                       lambda cursor: fetch_table_data(cursor, table_info, batch_size))
+        if self.cache is None:
+            return loader()
+        return self.cache.cached(loader, sqlquery, params, table_info_key(table_info), cache_ttl)
+
+    def dict_data(self, sqlquery, params=None, cache_ttl=None):
+        loader = lambda: self._execute(sqlquery, params, fetch_dict_data)
+        if self.cache is None:
+            return loader()
+        return self.cache.cached(loader, sqlquery, params, None, cache_ttl)
+
+    def table_batches(self, sqlquery, table_info, batch_size=1000, params=None):
+        """Генератор порций строк результата запроса (в порядке полей table_info); соединение
+        занято, пока генератор не исчерпан или не закрыт. Курсор закрывается и при закрытии
+        генератора до конца результата, и соединение возвращается в пул
+        """
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(sqlquery, *([params] if params is not None else []))
+                yield from fetch_table_batches(cursor, table_info, batch_size)
+            finally:
+                cursor.close()
+
+    def prefetch_table_data(self, sqlquery, table_info, batch_size=1000, params=None,
+                            max_batches=4, instrumentation=None):
+        """XLSPrefetchRows со строками результата запроса: запрос выполняется и читается в фоновом
+        потоке не больше чем на max_batches порций вперед, пока таблица выводится. Кэш результатов
+        не используется
+        """
+        return XLSPrefetchRows(self.table_batches(sqlquery, table_info, batch_size, params),
+                               max_batches, instrumentation)
+
+    def submit_table_data(self, sqlquery, table_info, batch_size=1000, params=None, cache_ttl=None):
+        """Future со списком строк результата запроса (в порядке полей table_info)
+        """
+        return self._executor.submit(self.table_data, sqlquery, table_info, batch_size, params, cache_ttl)
+
+    def submit_dict_data(self, sqlquery, params=None, cache_ttl=None):
+        """Future со списком словарей результата запроса
+        """
+        return self._executor.submit(self.dict_data, sqlquery, params, cache_ttl)
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.shutdown()
@@ -2,6 +2,9 @@
 # -*- coding: utf-8 -*-
 
 from .xlstable import *
+from .sqlutils import *
+from .sqlpool import *
+from .sqlcache import *
 import re
 import datetime
 import sys
@@ -30,51 +33,104 @@ class MSSql():
     def __init__(self, server=config.mssql_server,
                        user=config.db_login,
                        password=config.db_password,
-                       database=config.db_catalog):
-        self.conn = pymssql.connect(server=server,
-                                    user=user,
-                                    password=password,
-                                    database=database,
-                                    autocommit=True)
+                       database=config.db_catalog,
+                       max_connections=4,
+                       cache=None,
+                       instrumentation=None):
+        """Соединения открываются по мере надобности, не более max_connections одновременно:
+        столько запросов может выполняться параллельно через submit_table_data/submit_dict_data.
+        cache - необязательный SQLResultCache: get_table_data/get_dict_data и submit_* берут
+        результаты из него, параметр cache_ttl задает время жизни для запроса (0 - не кэшировать).
+        instrumentation - XLSInstrumentation для сообщений и замера времени выполнения запросов
+        """
+        self.cache = cache
+        self.instrumentation = instrumentation if instrumentation is not None else default_instrumentation()
+        self.pool = SQLConnectionPool(lambda: pymssql.connect(server=server,
+                                                               user=user,
+                                                               password=password,
+                                                               database=database,
+                                                               autocommit=True),
+                                      max_connections)
+        self._executor = None
 
     def __del__(self):
-        self.conn.close
+        if hasattr(self, 'pool'):
+            self.close()
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        self.pool.close()
 
-    def get_table_data(self, sqlquery, table_info):
+    @property
+    def executor(self):
+        if self._executor is None:
+            self._executor = SQLQueryExecutor(self.pool, cache=self.cache)
+        return self._executor
+
+    def get_table_batches(self, sqlquery, table_info, batch_size=1000):
+        """Генератор порций результатов запроса: списков строк не длиннее batch_size,
+        каждая строка - список значений в порядке полей из table_info. Курсор закрывается до
+        возврата соединения в пул: непрочитанный результат pymssql заблокировал бы следующий запрос
+        """
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                self.instrumentation.message("Выполняется запрос: '{0:s}'".format(sqlquery))
+                with self.instrumentation.phase('query'):
+                    cursor.execute(sqlquery)
+
+                yield from fetch_table_batches(cursor, table_info, batch_size)
+            finally:
+                cursor.close()
+
+    def get_table_data(self, sqlquery, table_info, batch_size=1000, cache_ttl=None):
         """Возвращает все поля из результатов запроса в формате списка значений (в порядке полей из table_info)
         """
-        cursor = self.conn.cursor(as_dict=True)
-
-        print("Выполняется запрос: '{0:s}'".format(sqlquery))
-        cursor.execute(sqlquery)
-        table_data = []
-
-        for row in cursor:
-#            row_data = ()
-            row_data = []
-            for ti in table_info:
-#                row_data += (row[ti.fname],) if (ti.fname != '') and (not ti.fname.startswith('__')) else ('',)
-                if (ti.fname != '') and (not ti.fname.startswith('__')):
-                    row_data.append(row[ti.fname])
-                else:
-                    row_data.append(ti.default_value)
-            table_data.append(row_data)
-
-        return table_data
-
-    def get_dict_data(self, sqlquery):
+        def _load():
+            table_data = []
+            for batch in self.get_table_batches(sqlquery, table_info, batch_size):
+                table_data.extend(batch)
+            return table_data
+
+        if self.cache is None:
+            return _load()
+        return self.cache.cached(_load, sqlquery, None, table_info_key(table_info), cache_ttl)
+
+    def prefetch_table_data(self, sqlquery, table_info, batch_size=1000, max_batches=4):
+        """Строки результатов запроса (XLSPrefetchRows) для вывода таблицы одновременно с чтением:
+        запрос выполняется и читается в фоновом потоке не больше чем на max_batches порций вперед.
+        Кэш не используется
+        """
+        return XLSPrefetchRows(self.get_table_batches(sqlquery, table_info, batch_size),
+                               max_batches, self.instrumentation)
+
+    def get_dict_data(self, sqlquery, cache_ttl=None):
         """Возвращает все поля из результатов запроса в формате списка словарей
         """
-        cursor = self.conn.cursor(as_dict=True)
+        def _load():
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+
+                self.instrumentation.message("Выполняется запрос: '{0:s}'".format(sqlquery))
+                with self.instrumentation.phase('query'):
+                    cursor.execute(sqlquery)
 
-        print("Выполняется запрос: '{0:s}'".format(sqlquery))
-        cursor.execute(sqlquery)
-        dict_data = []
+                return fetch_dict_data(cursor)
 
-        for row in cursor:
-#            one_dict = dict()
-#            for fld in row.keys():
-#                one_dict[fld] = row[fld]
-            dict_data.append(copy(row))
+        if self.cache is None:
+            return _load()
+        return self.cache.cached(_load, sqlquery, None, None, cache_ttl)
 
-        return dict_data
+    def submit_table_data(self, sqlquery, table_info, batch_size=1000, cache_ttl=None):
+        """Отправляет запрос в пул потоков, возвращает Future с результатом get_table_data
+        """
+        self.instrumentation.message("Запрос поставлен в очередь: '{0:s}'".format(sqlquery))
+        return self.executor.submit_table_data(sqlquery, table_info, batch_size, cache_ttl=cache_ttl)
+
+    def submit_dict_data(self, sqlquery, cache_ttl=None):
+        """Отправляет запрос в пул потоков, возвращает Future с результатом get_dict_data
+        """
+        self.instrumentation.message("Запрос поставлен в очередь: '{0:s}'".format(sqlquery))
+        return self.executor.submit_dict_data(sqlquery, cache_ttl=cache_ttl)
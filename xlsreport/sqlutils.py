@@ -0,0 +1,59 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Функции получения табличных данных через любой DB-API курсор (pymssql, sqlite3, ...)
+"""
+
+from .xlscolumnar import is_default_field
+
+def column_positions(cursor, table_info):
+    """По cursor.description возвращает для каждого поля table_info номер колонки
+    в результатах запроса, None - для полей со значением по умолчанию
+    """
+    names = {d[0]: i for i, d in enumerate(cursor.description)}
+    positions = []
+    for ti in table_info:
+        if is_default_field(ti.fname):
+            positions.append(None)
+        elif ti.fname in names:
+            positions.append(names[ti.fname])
+        else:
+            raise KeyError("в результатах запроса нет поля '{0:s}'".format(ti.fname))
+    return positions
+
+def fetch_table_batches(cursor, table_info, batch_size=1000):
+    """Генератор порций строк из выполненного запроса: каждая порция - список строк (списков
+    значений в порядке полей table_info) длиной не более batch_size
+    """
+    positions = column_positions(cursor, table_info)
+    defaults = [ti.default_value for ti in table_info]
+
+    while True:
+        batch = cursor.fetchmany(batch_size)
+        if not batch:
+            break
+
+        # порция обрабатывается по колонкам: колонки значений по умолчанию создаются целиком
+        columns = list(zip(*batch))
+        out_columns = [columns[pos] if pos is not None else [default] * len(batch)
+                       for pos, default in zip(positions, defaults)]
+        yield [list(row) for row in zip(*out_columns)]
+
+def fetch_table_data(cursor, table_info, batch_size=1000):
+    """Все строки выполненного запроса одним списком (в порядке полей table_info)
+    """
+    table_data = []
+    for batch in fetch_table_batches(cursor, table_info, batch_size):
+        table_data.extend(batch)
+    return table_data
+
+def fetch_dict_data(cursor):
+    """Все строки выполненного запроса списком словарей {имя колонки: значение}
+    """
+    names = [d[0] for d in cursor.description]
+    return [dict(zip(names, row)) for row in cursor.fetchall()]
+
+def table_info_key(table_info):
+    """Список полей table_info для ключа кэша результатов запроса
+    """
+    return tuple((ti.fname, repr(ti.default_value)) for ti in table_info)
@@ -3,6 +3,7 @@
 
 import os
 import sys
+import getpass
 import tempfile
 
 def is_exists_and_locked(filepath):
@@ -43,3 +44,12 @@ def open_file(filename):
         opener = 'open' if sys.platform == 'darwin' else 'xdg-open'
         os.system("{0:s} {1:s} &".format(opener, filename))
 
+
+def current_user():
+    """Возвращает имя пользователя, под которым выполняется отчет. У процессов без управляющего
+    терминала (cron, службы) os.getlogin() не работает, тогда имя берется из окружения (getpass)
+    """
+    try:
+        return os.getlogin()
+    except OSError:
+        return getpass.getuser()
@@ -0,0 +1,158 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Группировка данных таблицы с вычислением агрегатов за один проход по хеш-таблице групп.
+Упорядочиваются только итоговые группы, исходные данные не копируются и не сортируются
+"""
+
+try:
+    import numpy as np
+except ImportError:
+    np = None # module numpy doesn't exists
+
+from .xlscolumnar import python_values
+
+AGGREGATES = ('sum', 'count', 'min', 'max', 'mean', 'distinct')
+
+def group_sort_key(key):
+    """Порядок групп: по значениям ключа, пустые (None) значения - в конце
+    """
+    return tuple((v is None, v) for v in key)
+
+def _result(func, acc):
+    if func == 'mean':
+        return acc[0] / acc[1] if acc[1] else None
+    if func == 'distinct':
+        return len(acc)
+    return acc
+
+def _init(func):
+    if func in ('sum', 'count'): return 0
+    if func == 'mean': return [0, 0]
+    if func == 'distinct': return set()
+    return None
+
+def aggregate_rows(rows, key_indexes, specs):
+    """Один проход по строкам: словарь {ключ группы: список значений агрегатов}.
+    specs - список пар (агрегат, индекс поля в строке). Пустые значения (None и NaN) пропускаются
+    """
+    def _sum(acc, j, v): acc[j] += v
+    def _count(acc, j, v): acc[j] += 1
+    def _min(acc, j, v):
+        if (acc[j] is None) or (v < acc[j]): acc[j] = v
+    def _max(acc, j, v):
+        if (acc[j] is None) or (v > acc[j]): acc[j] = v
+    def _mean(acc, j, v):
+        acc[j][0] += v
+        acc[j][1] += 1
+    def _distinct(acc, j, v): acc[j].add(v)
+
+    updaters = dict(sum=_sum, count=_count, min=_min, max=_max, mean=_mean, distinct=_distinct)
+    plan = [(j, idx, updaters[func]) for j, (func, idx) in enumerate(specs)]
+
+    groups = dict()
+    for row in rows:
+        key = tuple([row[i] for i in key_indexes])
+        acc = groups.get(key)
+        if acc is None:
+            acc = groups[key] = [_init(func) for func, _ in specs]
+        for j, idx, update in plan:
+            v = row[idx]
+            # пустые значения (None и NaN, которое не равно самому себе) пропускаются
+            if (v is not None) and (v == v):
+                update(acc, j, v)
+
+    return {key: [_result(func, a) for (func, _), a in zip(specs, acc)] for key, acc in groups.items()}
+
+def group_codes(key_columns):
+    """Номера групп для каждой строки по колонкам ключа: (список ключей групп, номера групп строк)
+    """
+    groups = dict()
+    codes = [groups.setdefault(key, len(groups)) for key in zip(*key_columns)]
+    return list(groups.keys()), codes
+
+def _python_reduce(func, codes, ngroups, values):
+    acc = [_init(func) for _ in range(ngroups)]
+    for code, v in zip(codes, values):
+        if (v is None) or (v != v): continue
+        if func == 'sum': acc[code] += v
+        elif func == 'count': acc[code] += 1
+        elif func == 'min':
+            if (acc[code] is None) or (v < acc[code]): acc[code] = v
+        elif func == 'max':
+            if (acc[code] is None) or (v > acc[code]): acc[code] = v
+        elif func == 'mean':
+            acc[code][0] += v
+            acc[code][1] += 1
+        else:
+            acc[code].add(v)
+    return [_result(func, a) for a in acc]
+
+def _numpy_reduce(func, codes, ngroups, values):
+    """Векторизованный расчет агрегата по числовой колонке, None - колонка не числовая
+    """
+    col = np.asarray(values)
+    if col.dtype.kind not in 'iufb':
+        return None
+
+    if col.dtype.kind == 'f':
+        valid = ~np.isnan(col)
+        codes, col = codes[valid], col[valid]
+
+    counts = np.bincount(codes, minlength=ngroups)
+    if func == 'count':
+        return counts.tolist()
+
+    if func in ('sum', 'mean'):
+        if col.dtype.kind == 'f':
+            sums = np.bincount(codes, weights=col, minlength=ngroups)
+        else:
+            sums = np.zeros(ngroups, dtype=np.uint64 if col.dtype.kind == 'u' else np.int64)
+            np.add.at(sums, codes, col)
+        if func == 'sum':
+            return sums.tolist()
+        return [s / n if n else None for s, n in zip(sums.tolist(), counts.tolist())]
+
+    if func in ('min', 'max'):
+        if col.dtype.kind == 'f':
+            acc = np.full(ngroups, np.inf if func == 'min' else -np.inf)
+        elif col.dtype.kind == 'b':
+            acc = np.full(ngroups, func == 'min')
+        else:
+            info = np.iinfo(col.dtype)
+            acc = np.full(ngroups, info.max if func == 'min' else info.min, dtype=col.dtype)
+        (np.minimum if func == 'min' else np.maximum).at(acc, codes, col)
+        return [v if n else None for v, n in zip(acc.tolist(), counts.tolist())]
+
+    # distinct: сортируем пары (группа, значение) и считаем начала новых пар
+    order = np.lexsort((col, codes))
+    c, v = codes[order], col[order]
+    first = np.ones(len(c), dtype=bool)
+    first[1:] = (c[1:] != c[:-1]) | (v[1:] != v[:-1])
+    return np.bincount(c[first], minlength=ngroups).tolist()
+
+def aggregate_columns(key_columns, value_columns, specs, vectorized=True):
+    """Группировка колоночных данных: key_columns - колонки ключа, value_columns - функция,
+    возвращающая колонку по индексу поля. Числовые колонки при наличии numpy (и vectorized=True)
+    агрегируются векторно, остальные - в цикле по номерам групп по значениям Python (даты
+    datetime64 - datetime.date/datetime, как в строках данных). Пустые значения (None и NaN)
+    пропускаются в обоих случаях
+    """
+    keys, codes = group_codes(key_columns)
+    ngroups = len(keys)
+    if vectorized and (np is not None):
+        np_codes = np.asarray(codes, dtype=np.intp)
+
+    results = []
+    for func, idx in specs:
+        values = value_columns(idx)
+        res = None
+        if vectorized and (np is not None):
+            res = _numpy_reduce(func, np_codes, ngroups, values)
+        if res is None:
+            if (np is not None) and isinstance(values, np.ndarray):
+                values = python_values(values)
+            res = _python_reduce(func, codes, ngroups, list(values))
+        results.append(res)
+
+    return {key: [res[code] for res in results] for code, key in enumerate(keys)}
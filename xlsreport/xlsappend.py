@@ -0,0 +1,365 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Дозапись строк в таблицы сохраненного отчета (например, ежедневное пополнение отчета за месяц).
+Состояние таблицы, выведенной с именем (XLSReport.print_table(..., name=...)): место на листе,
+открытые группы иерархии, суммы их подитогов и общего итога - хранится в самой книге, в свойствах
+документа xlsreport:<имя>:<N>. XLSReport.open открывает книгу, а XLSReport.append_table продолжает
+таблицу с того места, где закончился прошлый вывод.
+Строки листа выше первой строки, которую изменит дозапись (XLSTable.end_state['edit_row']), не
+разбираются при открытии: их XML хранится как есть и вставляется в лист при сохранении, поэтому
+время дозаписи почти не зависит от числа строк, выведенных раньше
+"""
+
+import itertools
+import warnings
+import re
+from io import BytesIO
+from zipfile import ZipFile
+
+from openpyxl import load_workbook
+from openpyxl.styles.borders import Border
+from openpyxl.styles.cell_style import StyleArray
+
+from .xlsformula import XLSExcelWriter, XLSWorksheetWriter
+from .jsonvalues import dumps_values, loads_values
+
+try:
+    import openpyxl.reader.excel as _excel_reader
+    from openpyxl.worksheet._reader import WorksheetReader
+    from openpyxl.worksheet.cell_range import MultiCellRange
+    from openpyxl.worksheet.merge import MergedCell, MergedCellRange
+except ImportError:
+    _excel_reader = None # openpyxl < 2.6, объединенные ячейки разбирает openpyxl
+
+try:
+    from openpyxl.packaging.custom import StringProperty, CustomPropertyList
+    from openpyxl.xml.functions import fromstring
+    from openpyxl.worksheet.dimensions import SheetDimension
+    from openpyxl.worksheet.cell_range import CellRange
+    from openpyxl.drawing.spreadsheet_drawing import SpreadsheetDrawing
+except ImportError:
+    StringProperty = None # openpyxl < 3.1, свойства документа не поддерживаются
+
+STATE_PREFIX = 'xlsreport:'
+STATE_CHUNK = 255 # длина строкового свойства документа, которую сохраняет Excel
+
+def _state_names(wb, name):
+    prefix = "{0:s}{1:s}:".format(STATE_PREFIX, name)
+    return [p.name for p in wb.custom_doc_props
+            if p.name.startswith(prefix) and p.name[len(prefix):].isdigit()]
+
+def save_table_state(wb, name, state):
+    """Сохраняет в книге wb состояние таблицы name (словарь XLSTable.end_state и параметры листа)
+    """
+    assert StringProperty is not None, "для дозаписи таблиц нужен openpyxl 3.1 или новее"
+    for prop_name in _state_names(wb, name):
+        del wb.custom_doc_props[prop_name]
+
+    text = dumps_values(state)
+    for i in range(0, len(text), STATE_CHUNK):
+        wb.custom_doc_props.append(StringProperty(
+                name="{0:s}{1:s}:{2:d}".format(STATE_PREFIX, name, i // STATE_CHUNK),
+                value=text[i:i + STATE_CHUNK]))
+
+def load_table_state(wb, name):
+    """Состояние таблицы name, сохраненное в книге wb
+    """
+    return _join_state({p.name: p.value for p in getattr(wb, 'custom_doc_props', ())}, name)
+
+def _join_state(props, name):
+    chunks = []
+    while True:
+        chunk = props.get("{0:s}{1:s}:{2:d}".format(STATE_PREFIX, name, len(chunks)))
+        if chunk is None:
+            break
+        chunks.append(chunk)
+    assert chunks, "в книге нет таблицы '{0:s}', выведенной с этим именем".format(name)
+    return loads_values(''.join(chunks))
+
+def table_names(wb):
+    """Имена таблиц книги, в которые можно дописать строки
+    """
+    names = []
+    for p in getattr(wb, 'custom_doc_props', ()):
+        if p.name.startswith(STATE_PREFIX):
+            name = p.name[len(STATE_PREFIX):].rpartition(':')[0]
+            if name not in names:
+                names.append(name)
+    return names
+
+def _edit_rows(filename):
+    """Первые строки листов, которые может изменить дозапись: по последней таблице каждого листа
+    из состояний таблиц в свойствах документа
+    """
+    if StringProperty is None:
+        return dict()
+    with ZipFile(filename) as archive:
+        if 'docProps/custom.xml' not in archive.namelist():
+            return dict()
+        props = CustomPropertyList.from_tree(fromstring(archive.read('docProps/custom.xml')))
+    props = {p.name: p.value for p in props}
+
+    last = dict() # лист -> состояние последней на нем таблицы
+    for name in {n[len(STATE_PREFIX):].rpartition(':')[0] for n in props if n.startswith(STATE_PREFIX)}:
+        state = _join_state(props, name)
+        if 'edit_row' not in state:
+            continue # состояние без первой изменяемой строки: лист разбирается целиком
+        prev = last.get(state['sheet'])
+        if (prev is None) or (prev['next_row'] < state['next_row']):
+            last[state['sheet']] = state
+    return {sheet: state['edit_row'] for sheet, state in last.items()}
+
+def load_report(filename):
+    """Открывает сохраненный отчет в памяти для дозаписи. Формулы подитогов читаются без
+    рассчитанных значений: Excel пересчитывает их при открытии книги. На листах таблиц,
+    выведенных с именем, строки выше первой изменяемой строки не разбираются (см. XLSFrozenRows).
+    Листы разбирает _WorksheetReader, который передается только читателю этой книги (_ReportReader)
+    """
+    if _excel_reader is None:
+        return load_workbook(filename)
+
+    edit_rows = _edit_rows(filename)
+    if hasattr(filename, 'seek'):
+        filename.seek(0)
+    reader = _ReportReader(filename, edit_rows)
+    reader.read()
+    wb = reader.wb
+    if any(getattr(ws, '_frozen_rows', None) is not None for ws in wb.worksheets):
+        wb.writer_class = _FrozenWriter
+    return wb
+
+def frozen_row(ws):
+    """Первая разобранная строка листа ws отчета, открытого для дозаписи (1 - лист разобран целиком)
+    """
+    frozen = getattr(ws, '_frozen_rows', None)
+    return 1 if frozen is None else frozen.first_row
+
+_SHEET_DATA = re.compile(br'<sheetData\s*/>|<sheetData>')
+_DIMENSION = re.compile(br'<dimension ref="([^"]+)"')
+_MERGE_ROWS = re.compile(br'<mergeCell ref="[A-Z]+(\d+):[A-Z]+(\d+)"')
+
+class XLSFrozenRows:
+    """Строки листа выше first_row, которые при открытии отчета не разбираются: XML (xml) между
+    <sheetData> и строкой first_row вставляется в лист при сохранении без изменений. Ячейки
+    этих строк ссылаются на стили книги по номерам, которые openpyxl сохраняет, а строки в них
+    хранятся в самих ячейках (inlineStr, как пишут openpyxl и XLSDirectSheet)
+    """
+    def __init__(self, first_row, xml, dimension):
+        self.first_row = first_row
+        self.xml = xml
+        self.dimension = dimension # занятая область листа при открытии
+
+    @classmethod
+    def split(cls, data, first_row):
+        """Делит XML листа data на XLSFrozenRows и XML листа без этих строк. None, если строки
+        нельзя оставить неразобранными: нет строки first_row, есть общие строки (лист сохранен
+        Excel) или гиперссылки, которые openpyxl привязывает к ячейкам
+        """
+        # объединенные ячейки не делятся между разобранными и неразобранными строками
+        merges = [(int(r1), int(r2)) for r1, r2 in _MERGE_ROWS.findall(data)]
+        moved = True
+        while moved:
+            moved = False
+            for r1, r2 in merges:
+                if r1 < first_row <= r2:
+                    first_row, moved = r1, True
+
+        start = data.find(b'<sheetData>')
+        row = re.compile(br'<row r="%d"[\s>/]' % first_row).search(data, start)
+        if (start < 0) or (row is None):
+            return None
+        start += len(b'<sheetData>')
+        xml = data[start:row.start()]
+        if (b' t="s"' in xml) or (b'<hyperlinks' in data) or (b'<legacyDrawing' in data):
+            return None
+        dimension = _DIMENSION.search(data, 0, start)
+        dimension = dimension.group(1).decode() if dimension is not None else None
+        return cls(first_row, xml, dimension), data[:start] + data[row.start():]
+
+    def sheet_dimension(self, ws):
+        """Занятая область листа: при открытии и после дозаписи
+        """
+        ref = ws.calculate_dimension()
+        if (self.dimension is None) or (':' not in self.dimension):
+            return ref
+        cr = CellRange(self.dimension)
+        if ws._cells:
+            cr = cr.union(CellRange(ref))
+        return cr.coord
+
+    def check(self, ws):
+        rows = [row for row, col in ws._cells] + list(ws.row_dimensions.keys())
+        assert min(rows, default=self.first_row) >= self.first_row, \
+            "дозапись изменила строку {0:d} листа '{1:s}', не разобранную при открытии".format(
+                min(rows), ws.title)
+
+if _excel_reader is not None:
+    class _FrozenSheetWriter(XLSWorksheetWriter):
+        """XML листа без неразобранных строк, с занятой областью всего листа
+        """
+        def __init__(self, ws, frozen, out):
+            self.frozen = frozen
+            super().__init__(ws, out)
+
+        def write_dimensions(self):
+            self.xf.send(SheetDimension(self.frozen.sheet_dimension(self.ws)).to_tree())
+
+    class _FrozenWriter(XLSExcelWriter):
+        """Запись книги, в листы которой вставляются строки, не разобранные при открытии
+        """
+        def write_worksheet(self, ws):
+            frozen = getattr(ws, '_frozen_rows', None)
+            if frozen is None:
+                return super().write_worksheet(ws)
+
+            frozen.check(ws)
+            ws._drawing = SpreadsheetDrawing()
+            ws._drawing.charts = ws._charts
+            ws._drawing.images = ws._images
+
+            xml = BytesIO()
+            writer = _FrozenSheetWriter(ws, frozen, xml)
+            writer.write()
+            ws._rels = writer._rels
+            head, tail = _SHEET_DATA.split(xml.getvalue(), 1)
+
+            with self._archive.open(ws.path[1:], 'w', force_zip64=True) as out:
+                out.write(head)
+                out.write(b'<sheetData>')
+                out.write(frozen.xml)
+                if not tail.startswith(b'<row'):
+                    out.write(b'</sheetData>') # <sheetData/>: строк ниже неразобранных нет
+                out.write(tail)
+            self.manifest.append(ws)
+
+if _excel_reader is not None:
+    class _WorksheetReader(WorksheetReader):
+        """Разбор листа, в котором объединенные ячейки создаются так же, как в openpyxl
+        (MergedCellRange.format: края диапазона получают рамку левой верхней ячейки, все ячейки -
+        ее защиту), но индексы новых рамок запоминаются. openpyxl ищет каждую рамку перебором
+        списка рамок книги, и открытие отчета с большими объединенными группами занимает время,
+        квадратичное от их размера. Строки выше первой изменяемой строки листа (edit_rows:
+        название листа -> строка) не разбираются (XLSFrozenRows)
+        """
+        def __init__(self, ws, xml_source, *args, edit_rows=None):
+            first_row = (edit_rows or dict()).get(ws.title)
+            if first_row is not None:
+                split = XLSFrozenRows.split(xml_source.read(), first_row)
+                if split is not None:
+                    ws._frozen_rows, data = split
+                    xml_source = BytesIO(data)
+                else:
+                    xml_source.seek(0)
+            super().__init__(ws, xml_source, *args)
+
+        def bind_merged_cells(self):
+            if not self.parser.merged_cells:
+                return
+
+            ws = self.ws
+            wb = ws.parent
+            cells = ws._cells
+            edge_ids = dict() # (рамка ячейки, сторона, рамка левой верхней ячейки) -> новая рамка
+            ranges = []
+            for cr in self.parser.merged_cells.mergeCell:
+                mcr = MergedCellRange(ws, cr.ref)
+                ranges.append(mcr)
+                if mcr.max_row < frozen_row(ws):
+                    # ячейки диапазона не разобраны и не меняются; левую верхнюю создает
+                    # MergedCellRange, ее на листе быть не должно
+                    cells.pop((mcr.min_row, mcr.min_col), None)
+                    continue
+                anchor = ws.cell(row=mcr.min_row, column=mcr.min_col)
+                anchor_sa = anchor._style if anchor.has_style else StyleArray()
+
+                for row, col in itertools.islice(mcr.cells, 1, None):
+                    mc = cells[(row, col)] = MergedCell(ws, row=row, column=col)
+                    mc._style = StyleArray()
+                    mc._style.protectionId = anchor_sa.protectionId
+
+                border = wb._borders[anchor_sa.borderId]
+                for side_name in ('top', 'left', 'right', 'bottom'):
+                    side = getattr(border, side_name)
+                    if (side is None) or (side.style is None):
+                        continue
+                    for coord in getattr(mcr, side_name):
+                        if coord == (mcr.min_row, mcr.min_col):
+                            continue
+                        sa = cells[coord]._style
+                        key = (sa.borderId, side_name, anchor_sa.borderId)
+                        idx = edge_ids.get(key)
+                        if idx is None:
+                            new_border = wb._borders[sa.borderId] + Border(**{side_name: side})
+                            idx = edge_ids[key] = wb._borders.add(new_border)
+                        sa.borderId = idx
+
+            ws.merged_cells = MultiCellRange(ranges)
+
+    class _ReportReader(_excel_reader.ExcelReader):
+        """Чтение книги отчета: листы разбирает _WorksheetReader с первыми изменяемыми строками
+        листов edit_rows. read_worksheets повторяет ExcelReader.read_worksheets openpyxl 3.1
+        (версия закреплена в requirements.txt) для книги, открытой не только для чтения
+        """
+        def __init__(self, filename, edit_rows):
+            super().__init__(filename)
+            self.edit_rows = edit_rows
+
+        def read_worksheets(self):
+            x = _excel_reader # имена, которые использует ExcelReader.read_worksheets
+            comment_warning = "Cell '{0}':{1} is part of a merged range but has a comment which " \
+                              "will be removed because merged cells cannot contain any data."
+            for sheet, rel in self.parser.find_sheets():
+                if rel.target not in self.valid_files:
+                    continue
+
+                if "chartsheet" in rel.Type:
+                    self.read_chartsheet(sheet, rel)
+                    continue
+
+                rels_path = x.get_rels_path(rel.target)
+                rels = x.RelationshipList()
+                if rels_path in self.valid_files:
+                    rels = x.get_dependents(self.archive, rels_path)
+
+                fh = self.archive.open(rel.target)
+                ws = self.wb.create_sheet(sheet.name)
+                ws._rels = rels
+                ws_parser = _WorksheetReader(ws, fh, self.shared_strings, self.data_only, self.rich_text,
+                                             edit_rows=self.edit_rows)
+                ws_parser.bind_all()
+                fh.close()
+
+                for r in rels.find(x.COMMENTS_NS):
+                    src = self.archive.read(r.target)
+                    comment_sheet = x.CommentSheet.from_tree(x.fromstring(src))
+                    for ref, comment in comment_sheet.comments:
+                        try:
+                            ws[ref].comment = comment
+                        except AttributeError:
+                            c = ws[ref]
+                            if isinstance(c, MergedCell):
+                                warnings.warn(comment_warning.format(ws.title, c.coordinate))
+
+                if self.wb.vba_archive and ws.legacy_drawing:
+                    ws.legacy_drawing = rels.get(ws.legacy_drawing).target
+                else:
+                    ws.legacy_drawing = None
+
+                for t in ws_parser.tables:
+                    ws.add_table(x.Table.from_tree(x.fromstring(self.archive.read(t))))
+
+                for drawing in rels.find(x.SpreadsheetDrawing._rel_type):
+                    charts, images = x.find_images(self.archive, drawing.target)
+                    for c in charts:
+                        ws.add_chart(c, c.anchor)
+                    for im in images:
+                        ws.add_image(im, im.anchor)
+
+                pivot_caches = self.parser.pivot_caches
+                for r in rels.find(x.TableDefinition.rel_type):
+                    pivot = x.TableDefinition.from_tree(x.fromstring(self.archive.read(r.Target)))
+                    pivot.cache = pivot_caches[pivot.cacheId]
+                    ws.add_pivot(pivot)
+
+                ws.sheet_state = sheet.state
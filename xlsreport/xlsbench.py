@@ -0,0 +1,412 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Воспроизводимые замеры производительности вывода отчета на синтетических данных: строк в секунду,
+пик памяти и размер файла для вывода таблицы с разными возможностями (объединение, подитоги,
+подзаголовки, раскраска, скрытие колонок), для group_by_data, шапки таблицы и сохранения книги,
+для вывода результатов запроса к БД sqlite3 с задержкой на каждую порцию строк - после чтения
+всех строк ('fetch') и одновременно с чтением ('pipeline'), для холодного запуска отчета по
+описанию через python -m xlsreport в новом процессе ('startup').
+
+Запуск: python -m xlsreport.xlsbench --rows 20000 --output bench.json [--compare old.json]
+Результаты в json, сравнение с результатами предыдущей версии - по строкам в секунду
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import sqlite3
+import tempfile
+import subprocess
+import argparse
+import platform
+import tracemalloc
+
+import openpyxl
+
+from .xlsreport import *
+from .xlscolor import Color
+from .sqlpool import SQLConnectionPool, SQLQueryExecutor
+
+FORMATS = ('int', 'currency', '1digit', '3digit', 'string')
+
+SCENARIOS = ('plain', 'merging', 'subtotals', 'subtitles', 'coloring', 'hide',
+             'group_by', 'header', 'save', 'fetch', 'pipeline', 'startup')
+
+STARTUP_ROWS = 100 # строк таблицы в сценарии 'startup': время определяет запуск, а не вывод
+
+class XLSBenchSpec:
+    """Параметры синтетической таблицы: rows строк, depth полей иерархии (группировки) и width
+    полей значений с форматами из formats по кругу, в группе каждого уровня - около group_size
+    подгрупп (на последнем уровне - строк). seed задает данные однозначно. В сценариях с БД
+    строки читаются порциями по batch_size, и каждая порция ждет latency секунд
+    """
+    def __init__(self, rows=10000, width=8, depth=2, group_size=5, formats=FORMATS, seed=0,
+                 streaming=False, subtotal_mode='cached', direct=False, batch_size=1000, latency=0.01,
+                 compression='default'):
+        assert depth >= 1, "нужно хотя бы одно поле иерархии"
+        self.rows = rows
+        self.width = width
+        self.depth = depth
+        self.group_size = group_size
+        self.formats = formats
+        self.seed = seed
+        self.streaming = streaming
+        self.direct = direct
+        self.subtotal_mode = subtotal_mode
+        self.batch_size = batch_size
+        self.latency = latency
+        self.compression = compression
+
+    def key_fields(self):
+        return ['Level{0:d}'.format(i + 1) for i in range(self.depth)]
+
+    def value_fields(self):
+        return ['Value{0:d}'.format(i + 1) for i in range(self.width)]
+
+    def numeric_fields(self):
+        return [fn for i, fn in enumerate(self.value_fields())
+                if self.formats[i % len(self.formats)] != 'string']
+
+    def table_info(self):
+        """Структура таблицы: поля иерархии ('string') и поля значений
+        """
+        return tuple([XLSTableField(fn, 'string') for fn in self.key_fields()] +
+                     [XLSTableField(fn, self.formats[i % len(self.formats)])
+                      for i, fn in enumerate(self.value_fields())])
+
+    def data(self):
+        """Строки таблицы, упорядоченные по полям иерархии. Последнее числовое поле нулевое во всех
+        строках (для условий скрытия колонок), в остальных числовых полях около 10% нулей
+        """
+        rnd = random.Random(self.seed)
+        formats = [self.formats[i % len(self.formats)] for i in range(self.width)]
+        numeric = [i for i, fmt in enumerate(formats) if fmt != 'string']
+        zero_col = numeric[-1] if numeric else None
+
+        rows = []
+        key = [0] * self.depth
+        for r in range(self.rows):
+            if r:
+                # следующая строка начинает новую группу на уровне level с вероятностью 1/group_size
+                level = self.depth
+                while (level > 0) and (rnd.randrange(self.group_size) == 0):
+                    level -= 1
+                if level < self.depth:
+                    key[level] += 1
+                    for i in range(level + 1, self.depth):
+                        key[i] = 0
+            row = ['группа {0:d}.{1:05d}'.format(i + 1, k) for i, k in enumerate(key)]
+            for i, fmt in enumerate(formats):
+                if fmt == 'string':
+                    row.append('текст {0:d}'.format(rnd.randrange(1000)))
+                elif (i == zero_col) or (rnd.random() < 0.1):
+                    row.append(0)
+                elif fmt == 'int':
+                    row.append(rnd.randrange(1, 100000))
+                else:
+                    row.append(round(rnd.uniform(0, 100000), 3))
+            rows.append(row)
+        return rows
+
+    def header(self):
+        """Двухуровневая шапка под структуру table_info
+        """
+        return XLSTableHeader([
+            XLSTableHeaderColumn('Группа', struct=[XLSTableHeaderColumn(fn, widths=[14])
+                                                   for fn in self.key_fields()]),
+            XLSTableHeaderColumn('Значения', struct=[XLSTableHeaderColumn(fn, widths=[12])
+                                                     for fn in self.value_fields()]),
+        ])
+
+    def as_dict(self):
+        return dict(rows=self.rows, width=self.width, depth=self.depth, group_size=self.group_size,
+                    formats=list(self.formats), seed=self.seed, streaming=self.streaming,
+                    direct=self.direct, subtotal_mode=self.subtotal_mode,
+                    batch_size=self.batch_size, latency=self.latency, compression=self.compression)
+
+def _subtitle(ws, row, cur_row, first_col):
+    ws.cell(row=cur_row, column=first_col).value = row['Level1']
+    return cur_row + 1
+
+def _color(row):
+    return Color.GREEN if row['Level1'][-1] in '02468' else Color.YELLOW
+
+def _make_table(spec, scenario, data):
+    table = XLSTable(spec.table_info(), data, row_height=15, subtotal_mode=spec.subtotal_mode)
+    keys, numeric = spec.key_fields(), spec.numeric_fields()
+    for level, fn in enumerate(keys):
+        table.hierarchy_append(fn, merging=(scenario == 'merging'),
+                               subtitle=_subtitle if (scenario == 'subtitles') and (level == 0) else None,
+                               subtotal=numeric if scenario == 'subtotals' else None)
+    if scenario == 'coloring':
+        for fn in spec.value_fields():
+            table.add_coloring(fn, _color, depends_on=[keys[0]])
+    elif scenario == 'hide':
+        for fn in numeric:
+            table.add_hide_column_condition(fn, 'empty')
+    return table
+
+def _new_report(spec):
+    return XLSReport('Замер', streaming=spec.streaming, instrumentation=XLSInstrumentation(),
+                     direct=spec.direct)
+
+def _saved_size(rep, compression):
+    """Сохраняет книгу в память, возвращает размер файла. Книгу в режиме streaming можно
+    сохранить только один раз, поэтому каждый прогон сохраняет свою книгу
+    """
+    return rep.save(io.BytesIO(), compression).bytes_written
+
+def _run_table(spec, scenario, data):
+    rep = _new_report(spec)
+    table = _make_table(spec, scenario, data)
+    start = time.perf_counter()
+    rep.print_table(table, 1)
+    return time.perf_counter() - start, spec.rows, lambda: _saved_size(rep, spec.compression)
+
+def _run_group_by(spec, data):
+    table = XLSTable(spec.table_info(), data)
+    keys = spec.key_fields()
+    colinfo = [XLSTableField(fn) for fn in keys + spec.numeric_fields()]
+    start = time.perf_counter()
+    table.group_by_data(colinfo, keys, sums=spec.numeric_fields())
+    return time.perf_counter() - start, spec.rows, lambda: None
+
+def _run_header(spec, data):
+    rep = _new_report(spec)
+    header = spec.header()
+    count = max(1, spec.rows // 100)
+    cur_row = 1
+    start = time.perf_counter()
+    for i in range(count):
+        cur_row = rep.print_tableheader(header, cur_row)
+    return time.perf_counter() - start, cur_row - 1, lambda: _saved_size(rep, spec.compression)
+
+def _run_save(spec, data):
+    rep = _new_report(spec)
+    rep.print_table(_make_table(spec, 'plain', data), 1)
+    rep._flush_sheet()
+    start = time.perf_counter()
+    result = rep.save(io.BytesIO(), spec.compression)
+    seconds = time.perf_counter() - start
+    return seconds, spec.rows, lambda: result.bytes_written
+
+def _sqlite_source(spec, data):
+    """Временная БД sqlite3 с таблицей bench из строк data, возвращает путь к файлу
+    """
+    fd, path = tempfile.mkstemp(prefix='xlsbench', suffix='.sqlite')
+    os.close(fd)
+    fields = [ti.fname for ti in spec.table_info()]
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute('CREATE TABLE bench ({0:s})'.format(', '.join(fields)))
+        conn.executemany('INSERT INTO bench VALUES ({0:s})'.format(', '.join('?' * len(fields))), data)
+        conn.commit()
+    finally:
+        conn.close()
+    return path
+
+def _slow_batches(batches, latency):
+    """Порции строк с задержкой latency секунд перед каждой - ожидание сервера БД
+    """
+    for batch in batches:
+        time.sleep(latency)
+        yield batch
+
+def _run_query(spec, scenario, data):
+    path = _sqlite_source(spec, data)
+    pool = SQLConnectionPool(lambda: sqlite3.connect(path, check_same_thread=False), 1)
+    try:
+        executor = SQLQueryExecutor(pool, max_workers=1)
+        rep = _new_report(spec)
+        start = time.perf_counter()
+        batches = _slow_batches(executor.table_batches('SELECT * FROM bench ORDER BY rowid',
+                                                       spec.table_info(), spec.batch_size), spec.latency)
+        if scenario == 'pipeline':
+            with XLSPrefetchRows(batches, instrumentation=rep.instrumentation) as rows:
+                rep.print_table(_make_table(spec, 'plain', rows), 1)
+        else:
+            rows = [row for batch in batches for row in batch]
+            rep.print_table(_make_table(spec, 'plain', rows), 1)
+        seconds = time.perf_counter() - start
+        executor.shutdown()
+    finally:
+        pool.close()
+        os.remove(path)
+    return seconds, spec.rows, lambda: _saved_size(rep, spec.compression)
+
+def _run_startup(spec, data):
+    """Отчет по описанию через python -m xlsreport в новом процессе: импорт модулей, разбор
+    описания, вывод небольшой таблицы из файла .json и сохранение
+    """
+    tmpdir = tempfile.mkdtemp(prefix='xlsbench')
+    rows = data[:STARTUP_ROWS]
+    with open(os.path.join(tmpdir, 'data.json'), 'w', encoding='utf-8') as f:
+        json.dump(rows, f, ensure_ascii=False)
+    output = os.path.join(tmpdir, 'report.xlsx')
+    mode = 'direct' if spec.direct else ('streaming' if spec.streaming else 'memory')
+    report = dict(output=output, mode=mode, compression=spec.compression, blocks=[
+            dict(label='Замер'),
+            dict(table=dict(fields=[[ti.fname, ti.format, ti.ccount] for ti in spec.table_info()],
+                            data='data.json', hierarchy=spec.key_fields(),
+                            subtotal_mode=spec.subtotal_mode))])
+    spec_file = os.path.join(tmpdir, 'report.json')
+    with open(spec_file, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False)
+
+    package_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(
+            filter(None, [package_dir, os.environ.get('PYTHONPATH')])))
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-m', 'xlsreport', spec_file, '--quiet'], env=env, check=True)
+    seconds = time.perf_counter() - start
+
+    def _save():
+        size = os.path.getsize(output)
+        shutil.rmtree(tmpdir, ignore_errors=True)
+        return size
+    return seconds, len(rows), _save
+
+def _run(spec, scenario, data):
+    """Один прогон сценария: (секунды, выведено строк, функция сохранения, возвращающая размер файла)
+    """
+    if scenario == 'group_by':
+        return _run_group_by(spec, data)
+    if scenario == 'header':
+        return _run_header(spec, data)
+    if scenario == 'save':
+        return _run_save(spec, data)
+    if scenario in ('fetch', 'pipeline'):
+        return _run_query(spec, scenario, data)
+    if scenario == 'startup':
+        return _run_startup(spec, data)
+    return _run_table(spec, scenario, data)
+
+def run_scenario(spec, scenario, data=None, repeat=3, measure_memory=True):
+    """Замер одного сценария: лучшее время из repeat прогонов, пик памяти (отдельным прогоном
+    под tracemalloc, чтобы трассировка не влияла на время) и размер сохраненного файла
+    """
+    assert scenario in SCENARIOS, "неизвестный сценарий '{0:s}'".format(scenario)
+    if data is None:
+        data = spec.data()
+
+    best, rows, file_size = None, 0, None
+    for i in range(repeat):
+        seconds, rows, save = _run(spec, scenario, data)
+        if (best is None) or (seconds < best):
+            best = seconds
+        file_size = save()
+
+    peak_memory = None
+    # память другого процесса tracemalloc не видит
+    if measure_memory and (scenario != 'startup'):
+        started = not tracemalloc.is_tracing()
+        if started:
+            tracemalloc.start()
+        tracemalloc.clear_traces()
+        base = tracemalloc.get_traced_memory()[0]
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        save = _run(spec, scenario, data)[2]
+        peak_memory = tracemalloc.get_traced_memory()[1] - base
+        if started:
+            tracemalloc.stop()
+        save()
+
+    return dict(scenario=scenario, rows=rows, seconds=round(best, 6),
+                rows_per_sec=round(rows / best, 1) if best > 0 else None,
+                peak_memory=peak_memory, file_size=file_size)
+
+def run_suite(spec, scenarios=SCENARIOS, repeat=3, measure_memory=True, log=None):
+    """Замер всех сценариев на одних и тех же данных; результат - словарь для json
+    """
+    data = spec.data()
+    results = []
+    for scenario in scenarios:
+        result = run_scenario(spec, scenario, data, repeat, measure_memory)
+        results.append(result)
+        if log is not None:
+            log(format_result(result))
+    return dict(environment=dict(python=platform.python_version(),
+                                 implementation=platform.python_implementation(),
+                                 openpyxl=openpyxl.__version__,
+                                 machine=platform.machine(),
+                                 system=platform.system()),
+                spec=spec.as_dict(), repeat=repeat, results=results)
+
+def format_result(result):
+    return "{0:<10s} {1:>8d} строк {2:>10.3f} с {3:>12.0f} строк/с {4:>10s} {5:>10s}".format(
+            result['scenario'], result['rows'], result['seconds'], result['rows_per_sec'] or 0,
+            '-' if result['peak_memory'] is None else '{0:d} Кб'.format(result['peak_memory'] // 1024),
+            '-' if result['file_size'] is None else '{0:d} Кб'.format(result['file_size'] // 1024))
+
+def compare_results(old, new, threshold=0.1):
+    """Сравнение двух результатов run_suite по строкам в секунду: список (сценарий, отношение
+    нового к старому, признак регрессии - замедление больше threshold)
+    """
+    old_results = {r['scenario']: r for r in old['results']}
+    comparison = []
+    for r in new['results']:
+        o = old_results.get(r['scenario'])
+        if (o is None) or not o['rows_per_sec'] or not r['rows_per_sec']:
+            continue
+        ratio = r['rows_per_sec'] / o['rows_per_sec']
+        comparison.append((r['scenario'], ratio, ratio < 1 - threshold))
+    return comparison
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m xlsreport.xlsbench',
+                                     description='Замеры производительности вывода отчета')
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--width', type=int, default=8, help='полей значений')
+    parser.add_argument('--depth', type=int, default=2, help='уровней иерархии')
+    parser.add_argument('--group-size', type=int, default=5)
+    parser.add_argument('--formats', default=','.join(FORMATS))
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--streaming', action='store_true')
+    parser.add_argument('--direct', action='store_true', help='прямая запись XML листа')
+    parser.add_argument('--batch-size', type=int, default=1000, help='строк в порции чтения из БД')
+    parser.add_argument('--latency', type=float, default=0.01, help='задержка БД на порцию, секунд')
+    parser.add_argument('--compression', default='default', help='сжатие ZIP при сохранении')
+    parser.add_argument('--subtotal-mode', default='cached', choices=SUBTOTAL_MODES)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+    parser.add_argument('--no-memory', action='store_true', help='не замерять пик памяти')
+    parser.add_argument('--output', help='файл json с результатами')
+    parser.add_argument('--compare', help='файл json с результатами предыдущей версии')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='допустимое замедление при сравнении (доля)')
+    args = parser.parse_args(argv)
+
+    spec = XLSBenchSpec(rows=args.rows, width=args.width, depth=args.depth,
+                        group_size=args.group_size, formats=tuple(args.formats.split(',')),
+                        seed=args.seed, streaming=args.streaming, subtotal_mode=args.subtotal_mode,
+                        direct=args.direct, batch_size=args.batch_size, latency=args.latency,
+                        compression=int(args.compression) if args.compression.isdigit() else args.compression)
+    result = run_suite(spec, args.scenarios.split(','), args.repeat, not args.no_memory,
+                       log=lambda line: print(line, file=sys.stderr))
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    else:
+        json.dump(result, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            old = json.load(f)
+        regressions = 0
+        for scenario, ratio, regression in compare_results(old, result, args.threshold):
+            print("{0:<10s} {1:>6.2f}x{2:s}".format(scenario, ratio, '  РЕГРЕССИЯ' if regression else ''),
+                  file=sys.stderr)
+            regressions += regression
+        return 1 if regressions else 0
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
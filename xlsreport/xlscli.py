@@ -0,0 +1,304 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Вывод отчета по описанию в файле JSON, без программы на python:
+
+    python -m xlsreport report.json [-o report.xlsx] [-p branch=12 ...] [--timing] [--quiet]
+
+Модули отчета (openpyxl и т.д.) импортируются только перед выводом, источники данных -
+только те, что указаны в описании: sqlite3 для запроса к sqlite, sqltabledata (pymssql) для
+запроса к MS SQL, numpy/pyarrow для файлов .npy/.arrow. Поэтому ошибки в описании и --help
+не ждут импорта openpyxl, а короткие задания из cron не платят за неиспользуемые модули.
+
+Описание отчета:
+
+    {
+      "output": "остатки_{branch}.xlsx",
+      "sheet": "Остатки", "print_setup": "LandscapeW1", "protection": false,
+      "mode": "memory", "template": "шаблон.xlsx", "compression": "default",
+      "preamble": true,
+      "blocks": [
+        {"label": "Остатки филиала {branch}", "heading": "h1"},
+        {"skip": 1},
+        {"header": {"columns": [{"title": "Модель", "widths": [20]},
+                                {"title": "Размеры", "struct": [{"title": "S"}, {"title": "M"}]}],
+                    "row_height": 40},
+         "apply_widths": true},
+        {"table": {
+           "fields": [["Code", "string"], ["Color", "string", 2], ["Qty", "int"]],
+           "query": "select Code, Color, Qty from stock where branch = :branch order by Code",
+           "database": {"sqlite": "stock.db"},
+           "hierarchy": [{"field": "Code", "merging": true, "subtotal": ["Qty"]}],
+           "grand_total": ["Qty"], "hide": {"Qty": "zero"},
+           "row_height": 20, "subtotal_mode": "cached"}}
+      ]
+    }
+
+"mode" - "memory", "streaming" или "direct" (см. XLSReport), "template" - необязательный шаблон
+книги, относительные пути - от каталога файла описания.
+Данные таблицы задаются запросом ("query" и "database", параметры запроса - "params" описания,
+"params" таблицы и -p командной строки; "database" - {"sqlite": файл} или {"mssql": параметры
+MSSql}) либо "data": список строк или путь к файлу .json
+(список строк или словарей по именам полей), .csv (первая строка - имена колонок),
+.npy или .arrow/.feather. В "output" и текстах меток подставляются параметры: {branch}.
+Таблица может иметь свою шапку "header" - она выводится перед таблицей и повторяется на листах
+продолжения, "autofit": true задает ширины колонок шапки без ширины по данным таблицы.
+Ширина меток по умолчанию - ширина последней шапки или таблицы
+"""
+
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+import importlib
+
+MODES = ('memory', 'streaming', 'direct')
+
+# форматы полей, значения которых в файлах .csv переводятся в числа
+_NUMERIC_FORMATS = ('int', 'currency', '1digit', '3digit')
+
+def load_spec(filename):
+    """Описание отчета из файла JSON
+    """
+    with open(filename, encoding='utf-8') as f:
+        spec = json.load(f)
+    assert isinstance(spec, dict), "описание отчета должно быть объектом JSON"
+    spec.setdefault('_dir', os.path.dirname(os.path.abspath(filename)))
+    return spec
+
+def _path(spec, filename):
+    """Путь к файлу из описания: относительные пути - от каталога файла описания
+    """
+    return os.path.join(spec.get('_dir', ''), filename)
+
+def _format(text, params):
+    return text.format_map(params) if params else text
+
+def _header(xls, hspec):
+    def _column(cspec):
+        if not isinstance(cspec, dict):
+            return xls.XLSTableHeaderColumn(cspec)
+        return xls.XLSTableHeaderColumn(cspec.get('title', ''), widths=cspec.get('widths', []),
+                                        struct=[_column(s) for s in cspec.get('struct', [])])
+
+    kwargs = {key: hspec[key] for key in ('row_height', 'first_row_height') if key in hspec}
+    return xls.XLSTableHeader([_column(c) for c in hspec['columns']], **kwargs)
+
+def _fields(xls, tspec):
+    fields = []
+    for fspec in tspec['fields']:
+        if isinstance(fspec, dict):
+            fields.append(xls.XLSTableField(fspec['name'], fspec.get('format', 'string'),
+                                            fspec.get('col_count', 1), hidden=fspec.get('hidden', False),
+                                            default_value=fspec.get('default')))
+        else:
+            fields.append(xls.XLSTableField(*fspec))
+    return tuple(fields)
+
+def _block_width(xls, block):
+    """Количество колонок шапки или таблицы блока, None - для остальных блоков
+    """
+    if 'header' in block:
+        return _header(xls, block['header']).column_count
+    if 'table' in block:
+        return sum(ti.ccount for ti in _fields(xls, block['table']))
+    return None
+
+def _csv_value(value, format):
+    if value == '':
+        return None
+    if format in _NUMERIC_FORMATS:
+        try:
+            return int(value)
+        except ValueError:
+            return float(value)
+    return value
+
+def _file_rows(filename, table_info):
+    """Строки таблицы из файла .json или .csv (колонки ищутся по именам полей)
+    """
+    is_default_field = importlib.import_module('.xlscolumnar', __package__).is_default_field
+
+    def _by_names(records, convert=None):
+        for record in records:
+            yield [ti.default_value if is_default_field(ti.fname) else
+                   (convert(record[ti.fname], ti.format) if convert else record[ti.fname])
+                   for ti in table_info]
+
+    if filename.lower().endswith('.csv'):
+        with open(filename, encoding='utf-8', newline='') as f:
+            return list(_by_names(csv.DictReader(f), _csv_value))
+
+    with open(filename, encoding='utf-8') as f:
+        records = json.load(f)
+    if records and isinstance(records[0], dict):
+        return list(_by_names(records))
+    return records
+
+def _query_rows(spec, tspec, table_info, params, instrumentation):
+    """Строки таблицы из запроса к БД описания; модуль БД импортируется только здесь
+    """
+    database = tspec.get('database', spec.get('database'))
+    assert database, "для запроса таблицы не задана БД ('database')"
+    sqlquery = tspec['query']
+
+    if 'sqlite' in database:
+        sqlite3 = importlib.import_module('sqlite3')
+        sqlutils = importlib.import_module('.sqlutils', __package__)
+        conn = sqlite3.connect(_path(spec, database['sqlite']))
+        try:
+            with instrumentation.phase('query'):
+                cursor = conn.execute(sqlquery, params)
+                return sqlutils.fetch_table_data(cursor, table_info)
+        finally:
+            conn.close()
+
+    if 'mssql' in database:
+        sqltabledata = importlib.import_module('.sqltabledata', __package__)
+        db = sqltabledata.MSSql(instrumentation=instrumentation, **database['mssql'])
+        try:
+            return db.executor.table_data(sqlquery, table_info, params=params or None)
+        finally:
+            db.close()
+
+    raise AssertionError("неизвестная БД '{0:s}', поддерживаются sqlite и mssql".format(
+            ', '.join(database)))
+
+def _table(xls, spec, tspec, params, instrumentation):
+    table_info = _fields(xls, tspec)
+    tparams = dict(params, **tspec.get('params', {}))
+
+    if 'query' in tspec:
+        data = _query_rows(spec, tspec, table_info, tparams, instrumentation)
+    else:
+        assert 'data' in tspec, "для таблицы не заданы данные ('data' или 'query')"
+        data = tspec['data']
+        if isinstance(data, str):
+            filename = _path(spec, data)
+            if os.path.splitext(filename)[1].lower() in ('.json', '.csv'):
+                data = _file_rows(filename, table_info)
+            else:
+                data = filename # колоночный файл .npy/.arrow читает XLSTable
+
+    kwargs = {key: tspec[key] for key in ('row_height', 'subtotal_mode') if key in tspec}
+    table = xls.XLSTable(table_info, data, **kwargs)
+    for hspec in tspec.get('hierarchy', []):
+        if isinstance(hspec, str):
+            hspec = dict(field=hspec)
+        table.hierarchy_append(hspec['field'], merging=hspec.get('merging', False),
+                               subtotal=hspec.get('subtotal'))
+    for fieldname, condition in tspec.get('hide', {}).items():
+        table.add_hide_column_condition(fieldname, condition)
+    if 'grand_total' in tspec:
+        table.set_grand_total(tspec['grand_total'], tspec.get('grand_total_label', 'Итого'))
+    return table
+
+def render_spec(spec, output=None, params=None, instrumentation=None):
+    """Выводит отчет по описанию spec (словарь, см. load_spec) и сохраняет его в output
+    (по умолчанию - "output" описания). params дополняют "params" описания.
+    Возвращает (имя файла, SaveResult)
+    """
+    params = dict(spec.get('params', {}), **(params or {}))
+    mode = spec.get('mode', 'memory')
+    assert mode in MODES, "неизвестный режим '{0:s}', возможные: {1:s}".format(mode, ', '.join(MODES))
+    output = output or spec.get('output')
+    assert output, "не задан файл отчета ('output' или -o)"
+    output = _format(output, params)
+
+    # модули отчета импортируются только здесь: до этого разбор описания не ждет openpyxl
+    start = time.perf_counter()
+    xls = importlib.import_module('.xlsreport', __package__)
+    if instrumentation is None:
+        instrumentation = xls.default_instrumentation()
+    instrumentation.add_time('import', time.perf_counter() - start)
+
+    template = spec.get('template')
+    rep = xls.XLSReport(spec.get('sheet', 'Новый лист'),
+                        print_setup=xls.PrintSetup[spec.get('print_setup', 'LandscapeW1')],
+                        protection=spec.get('protection', False),
+                        streaming=(mode == 'streaming'), direct=(mode == 'direct'),
+                        instrumentation=instrumentation,
+                        template=_path(spec, template) if template else None)
+
+    blocks = spec.get('blocks', [])
+    width = next(filter(None, (_block_width(xls, block) for block in blocks)), None)
+
+    cur_row = rep.start_row
+    if spec.get('preamble', False) and (cur_row == 1):
+        cur_row = rep.print_preamble(width or 1)
+
+    for block in blocks:
+        first_col = block.get('first_col', 1)
+        if 'label' in block:
+            label = xls.XLSLabel(_format(block['label'], params),
+                                 xls.LabelHeading[block.get('heading', 'h1')])
+            cur_row = rep.print_label(label, cur_row, first_col, block.get('col_count', width or 1))
+        elif 'skip' in block:
+            cur_row += block['skip']
+        elif 'header' in block:
+            header = _header(xls, block['header'])
+            width = _block_width(xls, block)
+            if block.get('apply_widths', False):
+                rep.apply_column_widths(header, first_col)
+            cur_row = rep.print_tableheader(header, cur_row, first_col)
+        elif 'table' in block:
+            tspec = block['table']
+            table = _table(xls, spec, tspec, params, instrumentation)
+            width = _block_width(xls, block)
+            header = _header(xls, tspec['header']) if 'header' in tspec else None
+            if header is not None:
+                if tspec.get('autofit', False) or tspec.get('apply_widths', False):
+                    rep.apply_column_widths(header, first_col,
+                                            table if tspec.get('autofit', False) else None)
+                cur_row = rep.print_tableheader(header, cur_row, first_col)
+            cur_row = rep.print_table(table, cur_row, first_col, tableheader=header)
+        else:
+            raise AssertionError("неизвестный блок отчета: {0:s}".format(', '.join(block)))
+
+    result = rep.save(output, spec.get('compression', 'default'))
+    return output, result
+
+def _param(text):
+    name, sep, value = text.partition('=')
+    if not sep:
+        raise argparse.ArgumentTypeError("параметр задается как имя=значение: '{0:s}'".format(text))
+    # числа и литералы JSON передаются в запрос со своим типом, остальное - строкой
+    try:
+        return name, json.loads(value)
+    except ValueError:
+        return name, value
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='python -m xlsreport',
+                                     description='Вывод отчета Excel по описанию в файле JSON')
+    parser.add_argument('spec', help='файл описания отчета (JSON)')
+    parser.add_argument('-o', '--output', help='файл отчета вместо "output" описания')
+    parser.add_argument('-p', '--param', type=_param, action='append', default=[],
+                        help='параметр запросов и текстов: имя=значение (число, литерал JSON или строка)')
+    parser.add_argument('--mode', choices=MODES, help='режим вывода вместо "mode" описания')
+    parser.add_argument('--quiet', action='store_true', help='без сообщений о ходе вывода')
+    parser.add_argument('--timing', action='store_true',
+                        help='время этапов, включая импорт модулей, в stderr')
+    args = parser.parse_args(argv)
+
+    spec = load_spec(args.spec)
+    if args.mode:
+        spec['mode'] = args.mode
+
+    instrumentation = None
+    if args.timing or args.quiet:
+        xlsinstrument = importlib.import_module('.xlsinstrument', __package__)
+        progress = None if args.quiet else xlsinstrument.XLSConsoleProgress(sys.stderr)
+        instrumentation = xlsinstrument.XLSMetrics(progress) if args.timing else xlsinstrument.XLSInstrumentation()
+
+    output, result = render_spec(spec, args.output, dict(args.param), instrumentation)
+    if args.timing:
+        print(instrumentation.report(), file=sys.stderr)
+    if not args.quiet:
+        print(output)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
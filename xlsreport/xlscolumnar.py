@@ -0,0 +1,177 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+
+try:
+    import numpy as np
+except ImportError:
+    np = None # module numpy doesn't exists
+
+def _loaded_pyarrow():
+    """Модуль pyarrow, если он уже импортирован, иначе None. Импорт pyarrow заметно удлиняет
+    запуск, а таблица или массив pyarrow не могут появиться в данных без импорта модуля,
+    поэтому проверки типов его не импортируют
+    """
+    return sys.modules.get('pyarrow')
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.ipc
+        return pyarrow
+    except ImportError:
+        return None # module pyarrow doesn't exists
+
+def python_values(part):
+    """Значения массива NumPy как список объектов Python (datetime64 - datetime/date, NaT - None)
+    """
+    # datetime64 с точностью выше микросекунд tolist() превращает в целые числа
+    if (part.dtype.kind == 'M') and (np.datetime_data(part.dtype)[0] in ('ns', 'ps', 'fs', 'as')):
+        part = part.astype('datetime64[us]')
+    return part.tolist()
+
+def is_default_field(fieldname):
+    """Поле без колонки в источнике данных, заполняется значением default_value
+    """
+    return (fieldname == '') or fieldname.startswith('__')
+
+def is_columnar_data(data):
+    """Проверяет, что данные таблицы заданы по колонкам, а не списком строк
+    """
+    if isinstance(data, (XLSColumnarData, dict, str)):
+        return True
+    pa = _loaded_pyarrow()
+    if (np is not None) and isinstance(data, np.ndarray) and (data.dtype.names is not None):
+        return True
+    if (pa is not None) and isinstance(data, (pa.Table, pa.RecordBatch)):
+        return True
+    return False
+
+class XLSColumnarData:
+    """Колоночный источник данных таблицы. Принимает словарь массивов NumPy (или любых
+    последовательностей), таблицу pyarrow, структурированный массив NumPy или путь к файлу .npy
+    (структурированный массив) / Arrow IPC (.arrow, .feather), который открывается через memory map.
+    Колонки ищутся по XLSTableField.fname и читаются срезами без копирования всего массива
+    """
+    def __init__(self, source, chunk_size=4096):
+        if isinstance(source, str):
+            source = self._open_file(source)
+
+        pa = _loaded_pyarrow()
+        if (pa is not None) and isinstance(source, pa.RecordBatch):
+            source = pa.Table.from_batches([source])
+
+        if (pa is not None) and isinstance(source, pa.Table):
+            self._columns = {name: source.column(name) for name in source.column_names}
+            self._length = source.num_rows
+        elif (np is not None) and isinstance(source, np.ndarray):
+            self._columns = {name: source[name] for name in source.dtype.names}
+            self._length = len(source)
+        else:
+            self._columns = dict(source)
+            self._length = len(next(iter(self._columns.values()))) if self._columns else 0
+
+        for name, col in self._columns.items():
+            assert len(col) == self._length, "колонка '{0:s}' имеет длину {1:d} вместо {2:d}"\
+                    .format(name, len(col), self._length)
+
+        self.chunk_size = chunk_size
+
+    @staticmethod
+    def _open_file(filename):
+        ext = os.path.splitext(filename)[1].lower()
+        if ext == '.npy':
+            assert np is not None, "для чтения .npy нужен модуль numpy"
+            return np.load(filename, mmap_mode='r')
+
+        pa = _import_pyarrow()
+        assert pa is not None, "для чтения Arrow IPC нужен модуль pyarrow"
+        source = pa.memory_map(filename, 'r')
+        try:
+            return pa.ipc.open_file(source).read_all()
+        except pa.ArrowInvalid:
+            source.seek(0)
+            return pa.ipc.open_stream(source).read_all()
+
+    def __len__(self):
+        return self._length
+
+    def __contains__(self, fieldname):
+        return fieldname in self._columns
+
+    def column(self, fieldname):
+        """Возвращает колонку как массив NumPy (без копирования, если это позволяет тип колонки)
+        """
+        col = self._columns[fieldname]
+        pa = _loaded_pyarrow()
+        if (pa is not None) and isinstance(col, pa.ChunkedArray):
+            return col.to_numpy()
+        if np is not None:
+            return np.asarray(col)
+        return col
+
+    def values(self, fieldname, start=0, stop=None):
+        """Возвращает значения колонки в диапазоне строк как список объектов Python
+        """
+        if stop is None: stop = self._length
+        col = self._columns[fieldname]
+        pa = _loaded_pyarrow()
+        if (pa is not None) and isinstance(col, pa.ChunkedArray):
+            return col.slice(start, stop - start).to_pylist()
+
+        part = col[start:stop]
+        if (np is not None) and isinstance(part, np.ndarray):
+            return python_values(part)
+        return list(part)
+
+    def rows(self, colinfo):
+        """Строки в порядке полей colinfo для вывода таблицы
+        """
+        return XLSColumnarRows(self, colinfo)
+
+class XLSColumnarRows:
+    """Строки колоночного источника в порядке полей таблицы. При обходе колонки читаются
+    порциями по chunk_size строк, и в памяти одновременно находится только одна порция строк
+    """
+    def __init__(self, data, colinfo):
+        for ci in colinfo:
+            if not is_default_field(ci.fname):
+                assert ci.fname in data, "в данных нет колонки '{0:s}'".format(ci.fname)
+
+        self.data = data
+        self._colinfo = colinfo
+
+    def __len__(self):
+        return len(self.data)
+
+    def column(self, findex):
+        """Колонка поля с индексом findex как массив NumPy
+        """
+        ci = self._colinfo[findex]
+        if is_default_field(ci.fname):
+            return [ci.default_value] * len(self.data)
+        return self.data.column(ci.fname)
+
+    def values(self, findex):
+        """Все значения поля с индексом findex как список объектов Python
+        """
+        ci = self._colinfo[findex]
+        if is_default_field(ci.fname):
+            return [ci.default_value] * len(self.data)
+        return self.data.values(ci.fname)
+
+    def __iter__(self):
+        length, chunk_size = len(self.data), self.data.chunk_size
+        for start in range(0, length, chunk_size):
+            stop = min(start + chunk_size, length)
+            columns = []
+            for ci in self._colinfo:
+                if is_default_field(ci.fname):
+                    columns.append([ci.default_value] * (stop - start))
+                else:
+                    columns.append(self.data.values(ci.fname, start, stop))
+
+            for row in zip(*columns):
+                yield list(row)
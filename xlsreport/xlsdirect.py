@@ -0,0 +1,373 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Прямая запись XML листов. Строки листа не превращаются в объекты ячеек openpyxl: при
+flush() они сразу пишутся текстом XML во временный файл листа, а в памяти остаются только
+буфер еще изменяемых строк и список объединений. Стили регистрируются в таблицах стилей книги
+openpyxl, поэтому styles.xml, параметры печати, защита, ширины колонок и имена книги
+записываются openpyxl как обычно; при сохранении между началом и концом XML листа,
+построенными openpyxl для пустого листа, вставляются накопленные строки
+"""
+
+import io
+import re
+import math
+import datetime
+import tempfile
+from copy import copy
+from numbers import Number, Integral
+from xml.sax.saxutils import escape, quoteattr
+
+from openpyxl import Workbook
+from openpyxl.cell.cell import TIME_FORMATS, ILLEGAL_CHARACTERS_RE
+from openpyxl.utils import get_column_letter
+from openpyxl.utils.datetime import to_excel
+from openpyxl.utils.exceptions import IllegalCharacterError
+from openpyxl.worksheet.cell_range import CellRange
+from openpyxl.worksheet.dimensions import SheetDimension
+from openpyxl.worksheet._writer import WorksheetWriter
+from openpyxl.worksheet.merge import MergeCell, MergeCells
+from openpyxl.drawing.spreadsheet_drawing import SpreadsheetDrawing
+from openpyxl.styles.cell_style import StyleArray
+
+from .xlsstream import XLSStreamSheet
+from .xlsstyle import style_ids
+from .xlsformula import XLSFormula, XLSExcelWriter
+from .xlsutils import workbook_save
+
+_COPY_SIZE = 2**20 # байт XML строк листа в порции при сохранении
+_SHEET_DATA = re.compile(br'<sheetData\s*/>|<sheetData>\s*</sheetData>')
+
+class XLSDirectCell:
+    """Ячейка прямой записи: значение и стиль (StyleArray), как у WriteOnlyCell, без остального
+    """
+    __slots__ = ('_value', 'data_type', '_style')
+
+    def __init__(self):
+        self._value = None
+        self.data_type = 'n'
+        self._style = None
+
+    @property
+    def value(self):
+        return self._value
+
+    @value.setter
+    def value(self, value):
+        self._value = value
+        self.data_type = 'f' if isinstance(value, str) and value.startswith('=') else 'n'
+
+    @property
+    def has_style(self):
+        return (self._style is not None) and any(self._style)
+
+class XLSDirectSheet(XLSStreamSheet):
+    """Лист прямой записи XML (обертка над пустым листом обычной книги XLSDirectWorkbook).
+    Интерфейс и ограничения - как у XLSStreamSheet: строки пишутся по порядку вызовом flush()
+    и после записи не изменяются
+    """
+    def __init__(self, ws):
+        super().__init__(ws)
+        ws._direct_sheet = self
+        self._data = tempfile.TemporaryFile()
+        self._merges = []          # объединения строками 'A1:B2'
+        self._style_attrs = dict() # tuple(StyleArray) -> ' s="номер стиля ячейки в книге"'
+        self._row_attrs = dict()   # атрибуты размеров строки -> текст атрибутов XML
+        self._letters = ['']       # номер колонки -> буквы
+        self._max_col = 0
+        self._min_col = None
+        self._max_row = 0
+        self._min_row = None
+        self._outline_level = 0
+        self._adopt_cells(ws)
+
+    def _adopt_cells(self, ws):
+        """Переносит уже заполненные ячейки и объединения листа (например, блок шапки шаблона)
+        в буфер строк: они записываются вместе с остальными строками, размеры строк остаются на листе
+        """
+        for (row, col), cl in sorted(ws._cells.items()):
+            dc = self.cell(row, col, cl.value)
+            if cl.has_style:
+                dc._style = copy(cl._style)
+        ws._cells.clear()
+        self._merges.extend(cr.coord for cr in ws.merged_cells.ranges)
+
+    def cell(self, row, column, value=None):
+        assert row >= self._next_row, "строка {0:d} уже записана на лист".format(row)
+
+        cells = self._rows.setdefault(row, dict())
+        cl = cells.get(column)
+        if cl is None:
+            cl = cells[column] = XLSDirectCell()
+        if value is not None:
+            cl.value = value
+        return cl
+
+    def merge_cells(self, range_string=None, start_row=None, start_column=None, end_row=None, end_column=None):
+        cr = CellRange(range_string=range_string, min_col=start_column, min_row=start_row,
+                       max_col=end_column, max_row=end_row)
+        assert cr.min_row >= self._next_row, "строка {0:d} уже записана на лист".format(cr.min_row)
+        self._merges.append(cr.coord)
+
+        cells = cr.cells
+        next(cells)
+        for row, col in cells:
+            cl = self._rows.get(row, {}).get(col)
+            if cl is not None:
+                cl.value = None
+
+    def _letter(self, col):
+        letters = self._letters
+        while len(letters) <= col:
+            letters.append(get_column_letter(len(letters)))
+        return letters[col]
+
+    def _date_style(self, sa, value):
+        """Стиль ячейки с датой: если формат не задан, то формат даты, как в openpyxl
+        """
+        if (sa is not None) and sa.numFmtId:
+            return sa
+        sa = copy(sa) if sa is not None else StyleArray()
+        for pos, idx in style_ids(self._ws.parent, number_format=TIME_FORMATS[type(value)]):
+            sa[pos] = idx
+        return sa
+
+    def _cell_xml(self, ref, cl):
+        value, sa = cl._value, cl._style
+
+        if value is None:
+            s = self._style_attr(sa)
+            return '<c r="{0:s}"{1:s}/>'.format(ref, s) if s else ''
+
+        if isinstance(value, (datetime.date, datetime.time, datetime.timedelta)):
+            sa = self._date_style(sa, value)
+            value = to_excel(value)
+
+        s = self._style_attr(sa)
+
+        if isinstance(value, XLSFormula):
+            cached = value.cached
+            if cached is None:
+                return '<c r="{0:s}"{1:s}><f>{2:s}</f><v></v></c>'.format(ref, s, escape(value[1:]))
+            t = ''
+            if isinstance(cached, bool):
+                t, cached = ' t="b"', int(cached)
+            elif isinstance(cached, str):
+                t, cached = ' t="str"', escape(cached)
+            elif isinstance(cached, float):
+                cached = '%.16g' % cached
+            return '<c r="{0:s}"{1:s}{2:s}><f>{3:s}</f><v>{4!s}</v></c>'.format(
+                    ref, s, t, escape(value[1:]), cached)
+
+        if isinstance(value, str):
+            if cl.data_type == 'f':
+                return '<c r="{0:s}"{1:s}><f>{2:s}</f><v></v></c>'.format(ref, s, escape(value[1:]))
+            if ILLEGAL_CHARACTERS_RE.search(value):
+                raise IllegalCharacterError("{0!r} cannot be used in worksheets.".format(value))
+            space = ' xml:space="preserve"' if value != value.strip() else ''
+            return '<c r="{0:s}"{1:s} t="inlineStr"><is><t{2:s}>{3:s}</t></is></c>'.format(
+                    ref, s, space, escape(value))
+
+        if isinstance(value, bool):
+            return '<c r="{0:s}"{1:s} t="b"><v>{2:d}</v></c>'.format(ref, s, value)
+
+        if isinstance(value, Number):
+            if isinstance(value, Integral):
+                text = str(value)
+            else:
+                # как safe_string openpyxl: NaN и бесконечность не записываются
+                value = float(value)
+                if math.isnan(value) or math.isinf(value):
+                    return '<c r="{0:s}"{1:s}/>'.format(ref, s) if s else ''
+                text = '%.16g' % value
+            return '<c r="{0:s}"{1:s}><v>{2:s}</v></c>'.format(ref, s, text)
+
+        raise ValueError("Cannot convert {0!r} to Excel".format(value))
+
+    def _style_attr(self, sa):
+        """Атрибут стиля ячейки ' s="N"' (пустая строка для ячейки без стиля)
+        """
+        if (sa is None) or (not any(sa)):
+            return ''
+        key = tuple(sa)
+        attr = self._style_attrs.get(key)
+        if attr is None:
+            idx = self._ws.parent._cell_styles.add(copy(sa))
+            attr = self._style_attrs[key] = ' s="{0:d}"'.format(idx)
+        return attr
+
+    def _row_xml(self, r, cells, dim):
+        attrs = ''
+        if dim is not None:
+            key = tuple(dim)
+            attrs = self._row_attrs.get(key)
+            if attrs is None:
+                attrs = self._row_attrs[key] = ''.join(' {0:s}={1:s}'.format(k, quoteattr(v))
+                                                       for k, v in key)
+            if dim.outlineLevel > self._outline_level:
+                self._outline_level = dim.outlineLevel
+
+        row = str(r)
+        parts = ['<row r="' + row + '"' + attrs + '>']
+        if cells:
+            cols = sorted(cells)
+            letters = self._letters
+            if len(letters) <= cols[-1]:
+                self._letter(cols[-1])
+            style_attr, illegal = self._style_attr, ILLEGAL_CHARACTERS_RE.search
+
+            # частые случаи (текст, целые и дробные числа, пустые ячейки) - без _cell_xml
+            for c in cols:
+                cl = cells[c]
+                value = cl._value
+                kind = type(value)
+                if (kind is str) and (cl.data_type != 'f') and (not illegal(value)):
+                    space = ' xml:space="preserve"' if value != value.strip() else ''
+                    parts.append('<c r="' + letters[c] + row + '"' + style_attr(cl._style) +
+                                 ' t="inlineStr"><is><t' + space + '>' + escape(value) + '</t></is></c>')
+                elif kind is int:
+                    parts.append('<c r="' + letters[c] + row + '"' + style_attr(cl._style) +
+                                 '><v>' + str(value) + '</v></c>')
+                elif (kind is float) and (not math.isnan(value)) and (not math.isinf(value)):
+                    parts.append('<c r="' + letters[c] + row + '"' + style_attr(cl._style) +
+                                 '><v>' + '%.16g' % value + '</v></c>')
+                elif value is None:
+                    s = style_attr(cl._style)
+                    if s:
+                        parts.append('<c r="' + letters[c] + row + '"' + s + '/>')
+                else:
+                    parts.append(self._cell_xml(letters[c] + row, cl))
+
+            self._max_col = max(self._max_col, cols[-1])
+            self._min_col = cols[0] if self._min_col is None else min(self._min_col, cols[0])
+        parts.append('</row>')
+
+        if self._min_row is None:
+            self._min_row = r
+        self._max_row = r
+        return ''.join(parts)
+
+    def flush(self, upto_row=None):
+        """Записывает в файл листа все строки до upto_row (не включая), по умолчанию - весь буфер
+        """
+        dims = self._ws.row_dimensions
+        if upto_row is None:
+            upto_row = max(self._rows.keys(), default=self._next_row - 1) + 1
+            upto_row = max(upto_row, max(dims.keys(), default=0) + 1)
+
+        parts = []
+        for r in range(self._next_row, upto_row):
+            cells = self._rows.pop(r, None)
+            dim = dims.pop(r, None)
+            if cells or (dim is not None):
+                parts.append(self._row_xml(r, cells, dim))
+        if parts:
+            self._data.write(''.join(parts).encode('utf-8'))
+
+        self._next_row = max(self._next_row, upto_row)
+
+    def dimension(self):
+        """Занятая область листа ('A1:A1' у пустого листа)
+        """
+        if self._min_row is None or self._min_col is None:
+            return 'A1:A1'
+        return '{0:s}{1:d}:{2:s}{3:d}'.format(self._letter(self._min_col), self._min_row,
+                                              self._letter(self._max_col), self._max_row)
+
+    def write_xml(self, out, head, tail):
+        """Пишет в out XML листа: начало head, накопленные строки и конец tail
+        """
+        out.write(head)
+        out.write(b'<sheetData>')
+        self._data.seek(0)
+        while True:
+            chunk = self._data.read(_COPY_SIZE)
+            if not chunk:
+                break
+            out.write(chunk)
+        self._data.seek(0, io.SEEK_END)
+        out.write(b'</sheetData>')
+        out.write(tail)
+
+    def close(self):
+        self._data.close()
+
+class _DirectSheetWriter(WorksheetWriter):
+    """XML пустого листа openpyxl с занятой областью, уровнем группировки строк и объединениями
+    листа прямой записи
+    """
+    def __init__(self, ws, sheet, out):
+        self.sheet = sheet
+        super().__init__(ws, out)
+
+    def write_dimensions(self):
+        self.xf.send(SheetDimension(self.sheet.dimension()).to_tree())
+
+    def write_format(self):
+        if self.sheet._outline_level:
+            self.ws.sheet_format.outlineLevelRow = self.sheet._outline_level
+        super().write_format()
+
+    def write_merged_cells(self):
+        if self.sheet._merges:
+            cells = [MergeCell(ref) for ref in self.sheet._merges]
+            self.xf.send(MergeCells(mergeCell=cells).to_tree())
+
+class _DirectWriter(XLSExcelWriter):
+    """Запись книги, в которой XML листов прямой записи собирается из файлов их строк.
+    write_worksheet повторяет ExcelWriter.write_worksheet openpyxl 3.1 (версия закреплена
+    в requirements.txt), записывая между началом и концом XML листа строки прямой записи
+    """
+    def write_worksheet(self, ws):
+        sheet = getattr(ws, '_direct_sheet', None)
+        if sheet is None:
+            return super().write_worksheet(ws)
+
+        sheet.flush()
+        ws._drawing = SpreadsheetDrawing()
+        ws._drawing.charts = ws._charts
+        ws._drawing.images = ws._images
+
+        xml = io.BytesIO()
+        writer = _DirectSheetWriter(ws, sheet, xml)
+        writer.write()
+        ws._rels = writer._rels
+        head, tail = _SHEET_DATA.split(xml.getvalue(), 1)
+
+        with self._archive.open(ws.path[1:], 'w', force_zip64=True) as out:
+            sheet.write_xml(out, head, tail)
+        self.manifest.append(ws)
+
+class XLSDirectWorkbook(Workbook):
+    """Книга для листов прямой записи XML: листы создаются как обычно, а XLSDirectSheet(ws)
+    делает лист ws листом прямой записи. В отличие от write-only книги ее можно сохранять
+    несколько раз
+    """
+    def __init__(self):
+        super().__init__()
+        for ws in self.worksheets:
+            self.remove(ws)
+
+    writer_class = _DirectWriter
+
+    @classmethod
+    def from_workbook(cls, wb):
+        """Назначает обычной книге wb (например, копии шаблона) запись листов прямой записи
+        (writer_class, см. workbook_save); ее листы остаются обычными, пока не обернуты XLSDirectSheet
+        """
+        wb.writer_class = cls.writer_class
+        return wb
+
+    def save(self, filename):
+        """Сохраняет книгу в filename (путь или поток)
+        """
+        workbook_save(self, filename)
+
+    def close(self):
+        """Удаляет временные файлы строк листов
+        """
+        for ws in self.worksheets:
+            sheet = getattr(ws, '_direct_sheet', None)
+            if sheet is not None:
+                sheet.close()
+        super().close()
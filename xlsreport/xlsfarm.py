@@ -0,0 +1,197 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Пакетный вывод однотипных отчетов (например, одного отчета по каждому филиалу) в пуле
+постоянных процессов. Процессы пула живут между заданиями и пакетами: openpyxl и модули отчета
+импортируются в процессе один раз, общие объекты (шапки таблиц, структуры полей, справочники)
+передаются в процесс один раз при его запуске, шаблоны книг разбираются один раз на процесс,
+кэши объектов стилей заполняются первым отчетом и служат остальным. Ошибка задания не
+прерывает пакет: она возвращается в результате задания вместе с замерами времени
+"""
+
+import os
+import time
+import traceback
+import multiprocessing
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+from .xlsreport import *
+
+# результат задания: номер в пакете, параметры, файл отчета, секунды вывода и сохранения в процессе
+# пула, время по этапам (XLSMetrics.metrics()['timings']), текст ошибки с трассировкой либо None,
+# номер процесса пула
+XLSJobResult = namedtuple('XLSJobResult', 'index params output seconds timings error pid')
+
+_worker_shared = None
+_worker_started = None # номера начатых заданий для поиска задания, при котором упал процесс
+
+def worker_shared():
+    """Общие объекты пула в текущем процессе (shared из XLSReportFarm)
+    """
+    return _worker_shared
+
+def _init_worker(shared, templates, warmup, started):
+    global _worker_shared, _worker_started
+    _worker_shared = shared
+    _worker_started = started
+    for path in templates:
+        load_template(path)
+    if warmup is not None:
+        warmup(shared)
+
+def _output_name(output, index, params):
+    if callable(output):
+        return output(params)
+    if isinstance(params, dict):
+        return output.format(index=index, **params)
+    return output.format(params, index=index)
+
+def _render_job(index, params, build_fn, output, report_kwargs, compression):
+    """Выводит один отчет (выполняется в процессе пула)
+    """
+    _worker_started[index] = os.getpid()
+    metrics = XLSMetrics()
+    filename = None
+    start = time.perf_counter()
+    try:
+        filename = _output_name(output, index, params)
+        kwargs = dict(report_kwargs)
+        if isinstance(params, dict) and isinstance(kwargs.get('sheet_name'), str):
+            kwargs['sheet_name'] = kwargs['sheet_name'].format(**params)
+        rep = XLSReport(instrumentation=metrics, **kwargs)
+        build_fn(rep, params, _worker_shared)
+        rep.save(filename, compression)
+        error = None
+    except Exception:
+        error = traceback.format_exc()
+    return XLSJobResult(index, params, filename, time.perf_counter() - start,
+                        metrics.metrics()['timings'], error, os.getpid())
+
+class XLSReportFarm:
+    """Пул постоянных процессов для вывода отчетов пакетами:
+
+        with XLSReportFarm(max_workers=4, shared=dict(header=header)) as farm:
+            results = farm.render(build_branch, [dict(branch=b) for b in branches],
+                                  output='out/остатки_{branch}.xlsx')
+
+    shared передается в каждый процесс один раз и доступен как третий аргумент build_fn и через
+    worker_shared(); templates - пути шаблонов книг, которые разбираются при запуске процесса;
+    warmup(shared) - необязательная подготовка процесса (например, чтение справочников).
+    build_fn, shared и параметры передаются через pickle: build_fn - функция уровня модуля
+    """
+    def __init__(self, max_workers=None, shared=None, templates=(), warmup=None):
+        self.max_workers = max_workers
+        self.shared = shared
+        self.templates = [os.path.abspath(path) for path in templates]
+        self.warmup = warmup
+        self._executor = None
+        self._manager = None
+        self._started = None
+
+    def _pool(self):
+        if self._executor is None:
+            if self._manager is None:
+                # словарь в процессе Manager: запись номера задания не блокирует процесс пула,
+                # сколько бы заданий ни было в пакете (очередь в канале заполняется и блокирует)
+                self._manager = multiprocessing.Manager()
+                self._started = self._manager.dict()
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers,
+                                                 initializer=_init_worker,
+                                                 initargs=(self.shared, self.templates, self.warmup,
+                                                           self._started))
+        return self._executor
+
+    def _started_jobs(self):
+        """Номера заданий, начатых процессами пула с прошлого вызова
+        """
+        started = set(self._started.keys())
+        self._started.clear()
+        return started
+
+    def _submit(self, jobs, job_args, on_done):
+        """Выполняет задания jobs [(номер, параметры)], передавая результаты в on_done.
+        Возвращает False, если процесс пула завершился аварийно, - тогда пул пересоздается
+        """
+        pool = self._pool()
+        self._started_jobs()
+        futures = {pool.submit(_render_job, index, params, *job_args): (index, params)
+                   for index, params in jobs}
+        crashed = False
+        for future in as_completed(futures):
+            index, params = futures[future]
+            try:
+                on_done(future.result())
+            except BrokenProcessPool:
+                crashed = True
+            except Exception:
+                on_done(XLSJobResult(index, params, None, 0.0, dict(), traceback.format_exc(), None))
+        if crashed:
+            # пул с аварийно завершившимся процессом больше не принимает задания
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        return not crashed
+
+    def render(self, build_fn, param_sets, output, report_kwargs=None, compression='default',
+               on_result=None):
+        """Выводит по отчету на каждый набор параметров из param_sets: создает XLSReport с
+        аргументами report_kwargs (в sheet_name подставляются параметры-словарь), вызывает
+        build_fn(rep, params, shared) и сохраняет книгу в output - шаблон имени файла с
+        параметрами и номером задания ({branch}, {index}) либо функцию output(params).
+        on_result(result) вызывается по мере выполнения заданий. Возвращает список XLSJobResult
+        в порядке param_sets.
+        При аварийном завершении процесса пула (например, нехватке памяти) задания, которые
+        выполнялись в этот момент, повторяются по одному, и ошибкой отмечается только то,
+        при котором авария повторилась; не начатые задания выполняются как обычно
+        """
+        job_args = (build_fn, output, report_kwargs or dict(), compression)
+        results = dict()
+
+        def _done(result):
+            results[result.index] = result
+            if on_result is not None:
+                on_result(result)
+
+        jobs = list(enumerate(param_sets))
+        while jobs:
+            if self._submit(jobs, job_args, _done):
+                break
+            jobs = [job for job in jobs if job[0] not in results]
+            started = self._started_jobs()
+            for index, params in [job for job in jobs if job[0] in started]:
+                if not self._submit([(index, params)], job_args, _done):
+                    _done(XLSJobResult(index, params, None, 0.0, dict(),
+                                       "процесс пула завершился аварийно при выводе отчета", None))
+            jobs = [job for job in jobs if job[0] not in results]
+        return [results[index] for index in sorted(results)]
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        if self._manager is not None:
+            self._manager.shutdown()
+            self._manager = None
+            self._started = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+def render_batch(build_fn, param_sets, output, max_workers=None, shared=None, templates=(),
+                 report_kwargs=None, compression='default', on_result=None):
+    """XLSReportFarm.render в пуле, который закрывается после пакета
+    """
+    with XLSReportFarm(max_workers, shared, templates) as farm:
+        return farm.render(build_fn, param_sets, output, report_kwargs, compression, on_result)
+
+def batch_summary(results):
+    """Сводка по результатам пакета: заданий, ошибок, сумма и максимум секунд заданий
+    """
+    seconds = [r.seconds for r in results]
+    return dict(jobs=len(results), errors=sum(r.error is not None for r in results),
+                seconds=round(sum(seconds), 6), max_seconds=round(max(seconds, default=0.0), 6),
+                workers=len({r.pid for r in results if r.pid is not None}))
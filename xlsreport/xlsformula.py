@@ -0,0 +1,104 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Формулы с заранее рассчитанным (кэшированным) значением. openpyxl записывает формулы без
+значения, и Excel, LibreOffice и программы, читающие файл, вынуждены пересчитывать книгу.
+Значение формулы XLSFormula записывается в файл вместе с ней. Так пишет листы только запись
+книг отчета (XLSExcelWriter, XLSWorksheetWriter): остальные книги процесса openpyxl сохраняет
+как обычно. У записи openpyxl нет точки расширения для ячейки, поэтому XLSWorksheetWriter.write_row
+и XLSExcelWriter.write_worksheet повторяют методы openpyxl 3.1 (версия закреплена в requirements.txt)
+"""
+
+from numbers import Number
+
+from openpyxl.compat import safe_string
+from openpyxl.xml.functions import Element, SubElement
+from openpyxl.cell._writer import write_cell
+from openpyxl.comments.comment_sheet import CommentRecord
+from openpyxl.worksheet._writer import WorksheetWriter
+from openpyxl.writer.excel import ExcelWriter
+from openpyxl.drawing.spreadsheet_drawing import SpreadsheetDrawing
+
+class XLSFormula(str):
+    """Текст формулы ('=SUBTOTAL(...)') и ее значение cached
+    """
+    def __new__(cls, formula, cached=None):
+        self = str.__new__(cls, formula)
+        self.cached = cached
+        return self
+
+def is_number(value):
+    """Значение, которое учитывают функции SUM/SUBTOTAL (логические значения не учитываются)
+    """
+    return isinstance(value, Number) and not isinstance(value, bool)
+
+def set_formula(cl, formula, cached=None):
+    """Записывает в ячейку формулу с кэшированным значением
+    """
+    cl._value = XLSFormula(formula, cached)
+    cl.data_type = 'f'
+
+def write_formula_cell(xf, worksheet, cell, styled=None):
+    """write_cell openpyxl, которая пишет формулу XLSFormula вместе со значением
+    """
+    value = cell._value
+    if (not isinstance(value, XLSFormula)) or (value.cached is None):
+        return write_cell(xf, worksheet, cell, styled)
+
+    attrs = {'r': cell.coordinate}
+    if styled:
+        attrs['s'] = '{0:d}'.format(cell.style_id)
+
+    cached = value.cached
+    if isinstance(cached, bool):
+        attrs['t'] = 'b'
+        cached = int(cached)
+    elif isinstance(cached, str):
+        attrs['t'] = 'str'
+
+    el = Element('c', attrs)
+    SubElement(el, 'f').text = value[1:]
+    SubElement(el, 'v').text = safe_string(cached)
+    xf.write(el)
+
+class XLSWorksheetWriter(WorksheetWriter):
+    """Запись листа (WorksheetWriter openpyxl), в которой ячейки пишет write_formula_cell
+    """
+    def write_row(self, xf, row, row_idx):
+        attrs = {'r': '{0:d}'.format(row_idx)}
+        attrs.update(self.ws.row_dimensions.get(row_idx, {}))
+
+        with xf.element('row', attrs):
+            for cell in row:
+                if cell._comment is not None:
+                    self.ws._comments.append(CommentRecord.from_cell(cell))
+                if (cell._value is None) and (not cell.has_style) and (not cell._comment):
+                    continue
+                write_formula_cell(xf, self.ws, cell, cell.has_style)
+
+class XLSExcelWriter(ExcelWriter):
+    """Запись книги отчета: листы пишет XLSWorksheetWriter. workbook_save пишет им книги без
+    своего класса записи writer_class, а классы записи книг отчета наследуют его
+    """
+    def write_worksheet(self, ws):
+        if self.workbook.write_only:
+            # строки write-only листа уже записаны XLSWorksheetWriter (stream_sheet_writer)
+            return super().write_worksheet(ws)
+
+        ws._drawing = SpreadsheetDrawing()
+        ws._drawing.charts = ws._charts
+        ws._drawing.images = ws._images
+        writer = XLSWorksheetWriter(ws)
+        writer.write()
+        ws._rels = writer._rels
+        self._archive.write(writer.out, ws.path[1:])
+        self.manifest.append(ws)
+        writer.cleanup()
+
+def stream_sheet_writer(ws):
+    """Назначает write-only листу ws запись XLSWorksheetWriter, как WriteOnlyWorksheet._get_writer
+    назначает WorksheetWriter; вызывается перед первой строкой листа
+    """
+    if ws._writer is None:
+        ws._writer = XLSWorksheetWriter(ws)
+        ws._writer.write_top()
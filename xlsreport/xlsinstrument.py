@@ -0,0 +1,257 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Инструментирование вывода отчета: ход выполнения, сообщения, время этапов и пользовательских
+функций, потребление памяти. Таблицы, отчет и запросы к БД сообщают о своей работе объекту
+XLSInstrumentation, а он решает, куда это выводить и что замерять
+"""
+
+import sys
+import json
+import time
+import threading
+import tracemalloc
+from contextlib import contextmanager
+
+# названия задач для вывода хода выполнения
+_TASK_TITLES = {
+    'table': 'Идёт форматирование таблицы',
+}
+
+class XLSProgressTracker:
+    """Ход выполнения одной задачи. update(done) вызывается на каждой строке, но сообщает
+    инструментированию не чаще, чем раз в progress_rows строк и в progress_interval секунд
+    """
+    __slots__ = ('_instr', 'task', 'total', '_start', '_last', '_next_check')
+
+    def __init__(self, instr, task, total=None):
+        self._instr = instr
+        self.task = task
+        self.total = total
+        self._start = time.perf_counter()
+        self._last = None
+        self._next_check = 0
+
+    def update(self, done):
+        if done < self._next_check:
+            return
+        instr = self._instr
+        self._next_check = done + instr.progress_rows
+
+        now = time.perf_counter()
+        if (self._last is None) or (instr.progress_interval is None) or \
+                (now - self._last >= instr.progress_interval):
+            self._last = now
+            instr.on_progress(self.task, done, self.total, now - self._start)
+
+    def finish(self, done):
+        elapsed = time.perf_counter() - self._start
+        self._instr.on_progress(self.task, done, self.total, elapsed)
+        self._instr.on_finish(self.task, done, elapsed)
+
+class XLSInstrumentation:
+    """Базовое инструментирование: ничего не выводит и не замеряет. Наследники переопределяют
+    message, on_progress, on_finish и add_time. Если timing истинно, этапы вывода таблицы и
+    пользовательские функции оборачиваются замером времени, иначе вызываются напрямую
+    """
+    timing = False
+    progress_rows = 256       # проверять, не пора ли сообщить о ходе выполнения, раз в столько строк
+    progress_interval = 0.5   # сообщать о ходе выполнения не чаще, чем раз в столько секунд
+
+    def message(self, text):
+        pass
+
+    def on_progress(self, task, done, total, elapsed):
+        pass
+
+    def on_finish(self, task, done, elapsed):
+        pass
+
+    def add_time(self, name, seconds, calls=1):
+        pass
+
+    def progress(self, task, total=None):
+        return XLSProgressTracker(self, task, total)
+
+    def timed(self, name, fn):
+        """Оборачивает fn замером времени этапа name (если timing выключен, возвращает fn)
+        """
+        if (not self.timing) or (fn is None):
+            return fn
+
+        add_time, perf_counter = self.add_time, time.perf_counter
+        def _timed(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                add_time(name, perf_counter() - start)
+        return _timed
+
+    @contextmanager
+    def phase(self, name):
+        """Блок with замеряется как этап name
+        """
+        if not self.timing:
+            yield
+            return
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, time.perf_counter() - start)
+
+class XLSConsoleProgress(XLSInstrumentation):
+    """Ход выполнения и сообщения в консоль (по умолчанию в sys.stdout)
+    """
+    def __init__(self, stream=None, progress_interval=0.5, progress_rows=256):
+        self._stream = stream
+        self.progress_interval = progress_interval
+        self.progress_rows = progress_rows
+
+    @property
+    def stream(self):
+        return self._stream if self._stream is not None else sys.stdout
+
+    def message(self, text):
+        print(text, file=self.stream)
+
+    def on_progress(self, task, done, total, elapsed):
+        title = _TASK_TITLES.get(task, task)
+        if total:
+            self.stream.write("\r{0:s} {1:0=2d}%".format(title, done * 100 // total))
+        else:
+            self.stream.write("\r{0:s}: {1:d} строк, {2:.0f} строк/с".format(
+                    title, done, done / elapsed if elapsed > 0 else 0))
+        self.stream.flush()
+
+    def on_finish(self, task, done, elapsed):
+        self.stream.write("\n")
+
+class XLSMetrics(XLSInstrumentation):
+    """Сбор метрик: время и количество вызовов по этапам вывода и пользовательским функциям,
+    при trace_memory=True - прирост и пик памяти по этапам phase() (через tracemalloc) и
+    снимки памяти snapshot(); этапы других потоков (например, чтения данных конвейером) замеряются
+    только по времени. Ход выполнения и сообщения передаются в progress (например,
+    XLSConsoleProgress), если он задан
+    """
+    timing = True
+
+    def __init__(self, progress=None, trace_memory=False, snapshot_top=10):
+        self.progress_sink = progress
+        if progress is not None:
+            self.progress_rows = progress.progress_rows
+            self.progress_interval = progress.progress_interval
+
+        self.timings = dict()    # имя этапа -> [количество вызовов, секунды]
+        self.memory = dict()     # имя этапа -> {'allocated': байт, 'peak': байт}
+        self.snapshots = dict()  # метка -> список строк с самыми большими размещениями
+        self.snapshot_top = snapshot_top
+
+        self.trace_memory = trace_memory
+        self._memory_stack = []
+        self._memory_thread = threading.get_ident()
+        self._tracemalloc_started = False
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._tracemalloc_started = True
+
+    def message(self, text):
+        if self.progress_sink is not None:
+            self.progress_sink.message(text)
+
+    def on_progress(self, task, done, total, elapsed):
+        if self.progress_sink is not None:
+            self.progress_sink.on_progress(task, done, total, elapsed)
+
+    def on_finish(self, task, done, elapsed):
+        self.add_time(task + ':rows', 0, done)
+        if self.progress_sink is not None:
+            self.progress_sink.on_finish(task, done, elapsed)
+
+    def add_time(self, name, seconds, calls=1):
+        entry = self.timings.get(name)
+        if entry is None:
+            entry = self.timings[name] = [0, 0.0]
+        entry[0] += calls
+        entry[1] += seconds
+
+    @contextmanager
+    def phase(self, name):
+        if (not self.trace_memory) or (threading.get_ident() != self._memory_thread):
+            with super().phase(name):
+                yield
+            return
+
+        # пик вложенного этапа учитывается и в пике внешнего
+        if self._memory_stack:
+            outer = self._memory_stack[-1]
+            outer[1] = max(outer[1], tracemalloc.get_traced_memory()[1])
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        frame = [tracemalloc.get_traced_memory()[0], 0]
+        self._memory_stack.append(frame)
+        try:
+            with super().phase(name):
+                yield
+        finally:
+            self._memory_stack.pop()
+            current, peak = tracemalloc.get_traced_memory()
+            peak = max(peak, frame[1])
+            if self._memory_stack:
+                outer = self._memory_stack[-1]
+                outer[1] = max(outer[1], peak)
+
+            entry = self.memory.setdefault(name, dict(allocated=0, peak=0))
+            entry['allocated'] += current - frame[0]
+            entry['peak'] = max(entry['peak'], peak - frame[0])
+
+    def snapshot(self, label):
+        """Запоминает строки кода с самыми большими размещениями памяти на текущий момент
+        """
+        if not tracemalloc.is_tracing():
+            return
+        stats = tracemalloc.take_snapshot().statistics('lineno')[:self.snapshot_top]
+        self.snapshots[label] = [str(st) for st in stats]
+
+    def metrics(self):
+        """Все собранные метрики словарем, пригодным для json
+        """
+        return dict(
+            timings={name: dict(calls=calls, seconds=round(seconds, 6))
+                     for name, (calls, seconds) in self.timings.items()},
+            memory=self.memory,
+            snapshots=self.snapshots)
+
+    def to_json(self, **kwargs):
+        return json.dumps(self.metrics(), ensure_ascii=False, **kwargs)
+
+    def report(self):
+        """Текстовая таблица этапов по убыванию затраченного времени
+        """
+        lines = ["{0:<40s} {1:>10s} {2:>12s}".format('этап', 'вызовов', 'секунд')]
+        for name, (calls, seconds) in sorted(self.timings.items(), key=lambda kv: -kv[1][1]):
+            lines.append("{0:<40s} {1:>10d} {2:>12.3f}".format(name, calls, seconds))
+        for name, mem in self.memory.items():
+            lines.append("память '{0:s}': прирост {1:d} Кб, пик {2:d} Кб".format(
+                    name, mem['allocated'] // 1024, mem['peak'] // 1024))
+        return "\n".join(lines)
+
+    def close(self):
+        if self._tracemalloc_started:
+            tracemalloc.stop()
+            self._tracemalloc_started = False
+
+_default_instrumentation = XLSConsoleProgress()
+
+def default_instrumentation():
+    """Инструментирование для объектов, которым его не передали явно
+    """
+    return _default_instrumentation
+
+def set_default_instrumentation(instr):
+    """Заменяет инструментирование по умолчанию, например XLSInstrumentation() - без вывода в консоль
+    """
+    global _default_instrumentation
+    _default_instrumentation = instr if instr is not None else XLSInstrumentation()
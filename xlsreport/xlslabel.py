@@ -33,7 +33,7 @@ class XLSLabel:
         range = CellRange(min_row=first_row, min_col=first_col,
                           max_row=first_row, max_col=first_col + col_count - 1)
 
-        apply_xlrange(ws, range, set_font,
-                bold=self.heading.value.bold, size=self.heading.value.font_size)
-        apply_xlrange(ws, range, set_alignment,
-                horizontal=self.heading.value.horz_align, vertical=self.heading.value.vert_align)
+        apply_xlrange(ws, range, set_style,
+                font=style_font(bold=self.heading.value.bold, size=self.heading.value.font_size),
+                alignment=style_alignment(horizontal=self.heading.value.horz_align,
+                                          vertical=self.heading.value.vert_align))
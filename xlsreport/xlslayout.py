@@ -0,0 +1,187 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Отложенная раскладка листа: объединения ячеек, уровни группировки строк и высоты строк
+собираются при выводе таблицы и применяются к листу одним проходом
+"""
+
+from copy import copy
+from collections import Counter
+
+from openpyxl.worksheet.cell_range import CellRange
+from openpyxl.styles.cell_style import StyleArray
+
+try:
+    from openpyxl.cell.cell import MergedCell
+    from openpyxl.worksheet.merge import MergedCellRange
+except ImportError:
+    MergedCell = None # openpyxl < 2.6, объединение через Worksheet.merge_cells
+
+from .xlsstyle import outline_border_id
+from .xlsutils_apply import set_borders
+from .xlsstream import XLSStreamSheet
+
+def merge_ranges(ws, ranges):
+    """Объединяет ячейки сразу для списка диапазонов (start_row, start_col, end_row, end_col).
+    В отличие от Worksheet.merge_cells не проверяет пересечение с уже объединенными диапазонами листа
+    перебором (квадратичное время на больших листах) и сохраняет стили объединяемых ячеек,
+    а границы левой верхней ячейки, как и в openpyxl, переносит на края диапазона
+    """
+    if isinstance(ws, XLSStreamSheet) or (MergedCell is None):
+        for r1, c1, r2, c2 in ranges:
+            ws.merge_cells(start_row=r1, start_column=c1, end_row=r2, end_column=c2)
+        return
+
+    wb = ws.parent
+    cells = ws._cells
+    merged = ws.merged_cells.ranges
+    add_range = merged.add if isinstance(merged, set) else merged.append
+
+    for r1, c1, r2, c2 in ranges:
+        add_range(MergedCellRange(ws, CellRange(min_row=r1, min_col=c1, max_row=r2, max_col=c2).coord))
+
+        for r in range(r1, r2 + 1):
+            for c in range(c1, c2 + 1):
+                if (r == r1) and (c == c1): continue
+                old = cells.get((r, c))
+                mc = MergedCell(ws, row=r, column=c)
+                if (old is not None) and old.has_style:
+                    mc._style = copy(old._style)
+                cells[(r, c)] = mc
+
+        anchor = cells.get((r1, c1))
+        if (anchor is None) or (not anchor.has_style) or (anchor._style.borderId == 0):
+            continue
+
+        border = wb._borders[anchor._style.borderId]
+        edges = dict(top=[(r1, c) for c in range(c1, c2 + 1)],
+                     bottom=[(r2, c) for c in range(c1, c2 + 1)],
+                     left=[(r, c1) for r in range(r1, r2 + 1)],
+                     right=[(r, c2) for r in range(r1, r2 + 1)])
+        for side_name, coords in edges.items():
+            side = getattr(border, side_name)
+            if (side is None) or (side.style is None): continue
+            for coord in coords:
+                if coord == (r1, c1): continue
+                cl = cells[coord]
+                if cl._style is None:
+                    cl._style = StyleArray()
+                cl._style.borderId = outline_border_id(wb, cl._style.borderId, side_name, side.style)
+
+class XLSLayout:
+    """План раскладки области листа. Объединения, группировка и высоты строк записываются в план
+    при выводе и применяются методом apply: в конце вывода или, при потоковой записи, перед
+    записью на лист готовых строк
+    """
+    def __init__(self):
+        self._merges = []          # (start_row, start_col, end_row, end_col, border_style)
+        self._outline = Counter()  # изменение уровня группировки, начиная со строки
+        self._outline_row = None   # первая строка, уровень которой еще не применен
+        self._applied_row = None   # строки до этой (не включая) уже применены к листу
+        self._outline_level = 0
+        self._heights = []         # (start_row, end_row, height), соседние строки одной высоты - одним отрезком
+
+    def merge(self, start_row, start_col, end_row, end_col, border_style=None):
+        """Объединение ячеек; border_style - рамка всех ячеек диапазона после объединения.
+        Диапазон из одной ячейки не объединяется
+        """
+        self._merges.append((start_row, start_col, end_row, end_col, border_style))
+
+    def outline(self, start_row, end_row):
+        """Увеличивает на 1 уровень группировки строк start_row..end_row
+        """
+        if end_row < start_row: return
+        assert (self._applied_row is None) or (start_row >= self._applied_row), \
+                "уровень группировки строки {0:d} уже применен".format(start_row)
+        self._outline[start_row] += 1
+        self._outline[end_row + 1] -= 1
+        if (self._outline_row is None) or (start_row < self._outline_row):
+            self._outline_row = start_row
+
+    def height(self, row, height):
+        if self._heights:
+            start, end, h = self._heights[-1]
+            if (h == height) and (end + 1 == row):
+                self._heights[-1] = (start, row, h)
+                return
+        self._heights.append((row, row, height))
+
+    def apply(self, ws, upto_row=None):
+        """Применяет к листу все записи плана для строк до upto_row (не включая), по умолчанию - весь план
+        """
+        if upto_row is None:
+            merges, self._merges = self._merges, []
+        else:
+            merges = [m for m in self._merges if m[2] < upto_row]
+            self._merges = [m for m in self._merges if m[2] >= upto_row]
+
+        merge_ranges(ws, [m[:4] for m in merges if (m[0], m[1]) != (m[2], m[3])])
+        for r1, c1, r2, c2, border_style in merges:
+            if border_style is not None:
+                set_borders(ws, r1, c1, r2, c2, border_style)
+
+        heights = []
+        for start, end, h in self._heights:
+            if (upto_row is not None) and (end >= upto_row):
+                if start < upto_row:
+                    heights.append((upto_row, end, h))
+                    end = upto_row - 1
+                else:
+                    heights.append((start, end, h))
+                    continue
+            for r in range(start, end + 1):
+                ws.row_dimensions[r].height = h
+        self._heights = heights
+
+        if self._outline_row is not None:
+            last_row = max(self._outline) + 1 if upto_row is None else upto_row
+            for r in range(self._outline_row, last_row):
+                self._outline_level += self._outline.pop(r, 0)
+                if self._outline_level:
+                    ws.row_dimensions[r].outlineLevel += self._outline_level
+            self._outline_row = last_row if self._outline else None
+        if upto_row is not None:
+            self._applied_row = upto_row
+
+def coalesce_row_heights(ws, max_row=None, min_row=1):
+    """Самая частая высота строк листа становится высотой строки по умолчанию (sheetFormatPr),
+    а размеры сохраняются только для строк другой высоты. Если строки до min_row не разобраны
+    (отчет открыт для дозаписи), высота по умолчанию не меняется: у строк с min_row убирается
+    только высота, равная ей
+    """
+    dims = ws.row_dimensions
+    if max_row is None:
+        max_row = max([ws.max_row] + list(dims.keys()))
+
+    if min_row > 1:
+        default = ws.sheet_format.defaultRowHeight
+        for r in range(min_row, max_row + 1):
+            d = dims.get(r)
+            if (d is not None) and (d.ht == default):
+                d.ht = None
+                if not dict(d):
+                    del dims[r]
+        return
+
+    default = ws.sheet_format.defaultRowHeight
+    heights = Counter()
+    for r in range(1, max_row + 1):
+        d = dims.get(r)
+        heights[d.ht if (d is not None) and (d.ht is not None) else default] += 1
+    if not heights:
+        return
+
+    new_default = heights.most_common(1)[0][0]
+    for r in range(1, max_row + 1):
+        d = dims.get(r)
+        if (d is None) or (d.ht is None):
+            if new_default != default:
+                dims[r].height = default
+        elif d.ht == new_default:
+            d.ht = None
+            if not dict(d):
+                del dims[r]
+
+    if new_default != default:
+        ws.sheet_format.defaultRowHeight = new_default
+        ws.sheet_format.customHeight = True
@@ -0,0 +1,233 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Вывод независимых листов отчета в пуле процессов. Каждый процесс строит свой лист в отдельной
+книге и сохраняет ее во временный файл (часть), затем части собираются в одну книгу: таблицы
+стилей частей объединяются в общую, номера стилей ячеек, строк и колонок в XML листов
+переназначаются, строки из общей таблицы строк части записываются в ячейки непосредственно.
+Параметры печати и защита листа хранятся в XML листа и переносятся как есть
+"""
+
+import io
+import os
+import re
+import shutil
+import tempfile
+from copy import copy
+from zipfile import ZipFile
+from xml.sax.saxutils import escape
+from concurrent.futures import ProcessPoolExecutor
+
+from openpyxl.xml.functions import fromstring
+from openpyxl.xml.constants import ARC_STYLE, ARC_WORKBOOK, ARC_SHARED_STRINGS, SHEET_MAIN_NS
+from openpyxl.styles.stylesheet import Stylesheet
+from openpyxl.styles.numbers import BUILTIN_FORMATS_MAX_SIZE
+from openpyxl.packaging.relationship import RelationshipList
+from openpyxl.writer.excel import ExcelWriter
+from openpyxl.reader.strings import read_string_table
+
+from .xlsreport import *
+
+_CHUNK_SIZE = 2**20 # символов XML листа в порции
+
+# ссылки на стили в XML листа: <c s="">, <row s="">, <col style="">
+_STYLE_REF = re.compile(r'(<(?:c|row)\b[^>]*?\ss=")(\d+)(")|(<col\b[^>]*?\sstyle=")(\d+)(")')
+# ячейка со строкой из общей таблицы строк
+_SHARED_STRING_CELL = re.compile(r'<c\b([^>]*?)\st="s"([^>]*)>\s*<v>(\d+)</v>\s*</c>')
+# выбранный лист; если выбранными оставить листы всех частей, Excel откроет их сгруппированными
+_TAB_SELECTED = re.compile(r'\stabSelected="(?:1|true)"')
+_SHEET_PART = re.compile(r'^xl/worksheets/sheet\d+\.xml$')
+
+class XLSSheetTask:
+    """Задание на вывод одного листа в отдельном процессе: build_fn(rep, *args, **kwargs) выводит
+    содержимое листа в переданный XLSReport с одним листом sheet_name. build_fn и аргументы
+    передаются в процесс через pickle, поэтому build_fn - функция уровня модуля, а данные
+    лучше загружать внутри нее, а не передавать аргументами
+    """
+    def __init__(self, sheet_name, build_fn, args=(), kwargs=None,
+                 print_setup=PrintSetup.LandscapeW1, protection=False, streaming=False, direct=False):
+        self.sheet_name = sheet_name
+        self.build_fn = build_fn
+        self.args = args
+        self.kwargs = kwargs or dict()
+        self.print_setup = print_setup
+        self.protection = protection
+        self.streaming = streaming
+        self.direct = direct
+
+def render_sheet_part(task, filename):
+    """Выводит лист задания в отдельную книгу filename (выполняется в процессе пула)
+    """
+    rep = XLSReport(task.sheet_name, task.print_setup, task.protection, task.streaming,
+                    instrumentation=XLSInstrumentation(), direct=task.direct)
+    task.build_fn(rep, *task.args, **task.kwargs)
+    # часть читается при сборке один раз, сжимать ее незачем
+    rep.save(filename, compression='stored')
+    return filename
+
+def _remap_styles(wb, stylesheet):
+    """Добавляет стили ячеек части в таблицы стилей книги wb, возвращает список: номер стиля
+    в части -> номер стиля в книге
+    """
+    named_styles = {style.name: i for i, style in enumerate(wb._named_styles)}
+    xf_names = [style.name for style in stylesheet.named_styles]
+    for style in stylesheet.named_styles:
+        if style.name not in named_styles:
+            wb.add_named_style(style)
+            named_styles[style.name] = len(wb._named_styles) - 1
+
+    style_map = []
+    for sa in stylesheet.cell_styles:
+        new_sa = copy(sa)
+        new_sa.fontId = wb._fonts.add(stylesheet.fonts[sa.fontId])
+        new_sa.fillId = wb._fills.add(stylesheet.fills[sa.fillId])
+        new_sa.borderId = wb._borders.add(stylesheet.borders[sa.borderId])
+        new_sa.alignmentId = wb._alignments.add(stylesheet.alignments[sa.alignmentId])
+        new_sa.protectionId = wb._protections.add(stylesheet.protections[sa.protectionId])
+        if sa.numFmtId >= BUILTIN_FORMATS_MAX_SIZE:
+            fmt = stylesheet.number_formats[sa.numFmtId - BUILTIN_FORMATS_MAX_SIZE]
+            new_sa.numFmtId = wb._number_formats.add(fmt) + BUILTIN_FORMATS_MAX_SIZE
+        if sa.xfId < len(xf_names):
+            new_sa.xfId = named_styles[xf_names[sa.xfId]]
+        style_map.append(wb._cell_styles.add(new_sa))
+    return style_map
+
+def _print_names(archive, ws):
+    """Переносит на лист ws области печати и сквозные строки/колонки из имен книги части
+    """
+    root = fromstring(archive.read(ARC_WORKBOOK))
+    for dn in root.iter('{{{0:s}}}definedName'.format(SHEET_MAIN_NS)):
+        refs = [ref.split('!')[-1].replace('$', '') for ref in (dn.text or '').split(',')]
+        if dn.get('name') == '_xlnm.Print_Area':
+            ws.print_area = refs
+        elif dn.get('name') == '_xlnm.Print_Titles':
+            for ref in refs:
+                if ref.split(':')[0].isdigit():
+                    ws.print_title_rows = ref
+                else:
+                    ws.print_title_cols = ref
+
+class _SheetPart:
+    """Лист одной части: путь к XML листа в архиве части и переназначение стилей
+    """
+    def __init__(self, wb, source, selected=False):
+        self.selected = selected
+        self.archive = ZipFile(source)
+        names = self.archive.namelist()
+        sheets = [name for name in names if _SHEET_PART.match(name)]
+        assert len(sheets) == 1, "в части отчета должен быть ровно один лист"
+        self.sheet_path = sheets[0]
+        rels_path = 'xl/worksheets/_rels/' + self.sheet_path.split('/')[-1] + '.rels'
+        assert rels_path not in names, \
+                "листы с рисунками, комментариями и гиперссылками не собираются из частей"
+
+        stylesheet = Stylesheet.from_tree(fromstring(self.archive.read(ARC_STYLE)))
+        self.style_map = _remap_styles(wb, stylesheet)
+        self.shared_strings = read_string_table(self.archive.open(ARC_SHARED_STRINGS)) \
+                if ARC_SHARED_STRINGS in names else []
+
+    def _rewrite(self, text):
+        def _inline(m):
+            value = self.shared_strings[int(m.group(3))]
+            space = ' xml:space="preserve"' if value != value.strip() else ''
+            return '<c{0:s} t="inlineStr"{1:s}><is><t{2:s}>{3:s}</t></is></c>'.format(
+                    m.group(1), m.group(2), space, escape(value))
+
+        def _style(m):
+            if m.group(1) is not None:
+                return m.group(1) + str(self.style_map[int(m.group(2))]) + m.group(3)
+            return m.group(4) + str(self.style_map[int(m.group(5))]) + m.group(6)
+
+        if self.shared_strings:
+            text = _SHARED_STRING_CELL.sub(_inline, text)
+        if not self.selected:
+            text = _TAB_SELECTED.sub('', text)
+        return _STYLE_REF.sub(_style, text)
+
+    def copy_sheet(self, out):
+        """Переписывает XML листа в out порциями по границам строк листа
+        """
+        tail = ''
+        with io.TextIOWrapper(self.archive.open(self.sheet_path), encoding='utf-8') as src:
+            while True:
+                chunk = src.read(_CHUNK_SIZE)
+                if not chunk:
+                    break
+                text = tail + chunk
+                cut = text.rfind('</row>')
+                if cut < 0:
+                    tail = text
+                    continue
+                cut += len('</row>')
+                out.write(self._rewrite(text[:cut]).encode('utf-8'))
+                tail = text[cut:]
+        out.write(self._rewrite(tail).encode('utf-8'))
+
+    def close(self):
+        self.archive.close()
+
+class _PartsWriter(ExcelWriter):
+    """Запись книги, в которой XML листов берется из частей, а не строится по ячейкам листов
+    """
+    def __init__(self, workbook, archive, parts):
+        super().__init__(workbook, archive)
+        self._parts = parts
+
+    def write_worksheet(self, ws):
+        ws._drawing = None
+        ws._rels = RelationshipList()
+        with self._archive.open(ws.path[1:], 'w', force_zip64=True) as out:
+            self._parts[ws].copy_sheet(out)
+        self.manifest.append(ws)
+
+def merge_sheet_parts(sources, filename, compression='default'):
+    """Собирает книги-части с одним листом каждая (пути к файлам или потоки) в одну книгу
+    filename (путь, дескриптор или поток, как в workbook_save). Листы идут в порядке частей
+    """
+    wb = workbook_create()
+    parts = dict()
+    try:
+        for i, source in enumerate(sources):
+            part = _SheetPart(wb, source, selected=(i == 0))
+            title = fromstring(part.archive.read(ARC_WORKBOOK)) \
+                    .find('{{{0:s}}}sheets/{{{0:s}}}sheet'.format(SHEET_MAIN_NS)).get('name')
+            ws = wb.create_sheet(title)
+            _print_names(part.archive, ws)
+            parts[ws] = part
+        wb.active = 0
+
+        workbook_save(wb, filename, compression,
+                      writer=lambda wb, archive: _PartsWriter(wb, archive, parts))
+    finally:
+        for part in parts.values():
+            part.close()
+    return filename
+
+def render_workbook_parallel(tasks, filename, max_workers=None, executor=None, compression='default'):
+    """Выводит листы заданий XLSSheetTask в пуле процессов (max_workers процессов либо готовый
+    executor) и собирает их в одну книгу filename в порядке заданий
+    """
+    tmpdir = tempfile.mkdtemp(prefix='xlsreport')
+    try:
+        own_executor = executor is None
+        if own_executor:
+            executor = ProcessPoolExecutor(max_workers=max_workers)
+        try:
+            futures = [executor.submit(render_sheet_part, task,
+                                       os.path.join(tmpdir, 'part{0:d}.xlsx'.format(i)))
+                       for i, task in enumerate(tasks)]
+            sources = [future.result() for future in futures]
+        finally:
+            if own_executor:
+                executor.shutdown()
+        return merge_sheet_parts(sources, filename, compression)
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+
+def launch_excel_parallel(tasks, templatename='sample', max_workers=None, compression='default'):
+    """Как XLSReport.launch_excel: выводит листы в пуле процессов во временный файл и открывает его
+    """
+    newfilename = temporary_file(templatename)
+    render_workbook_parallel(tasks, newfilename, max_workers, compression=compression)
+    default_instrumentation().message("Открытие файла '{0:s}'...".format(newfilename))
+    open_file(newfilename)
@@ -0,0 +1,120 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Конвейер чтения данных и вывода таблицы: порции строк читаются из источника (например,
+курсора БД) в фоновом потоке и передаются через ограниченную очередь основному потоку, который
+в это время выводит уже полученные строки. Ожидание БД и форматирование листа перекрываются,
+а размер очереди ограничивает память: пока очередь заполнена, чтение приостанавливается
+"""
+
+import time
+import queue
+import threading
+
+from .xlsinstrument import default_instrumentation
+
+_POLL_INTERVAL = 0.1 # секунд между проверками остановки, пока очередь заполнена
+
+# виды элементов очереди
+_BATCH, _ERROR, _END = range(3)
+
+class XLSPrefetchRows:
+    """Итератор строк из batches - итерируемого объекта порций (списков строк), который читается
+    в фоновом потоке не больше чем на max_batches порций вперед. Передается в XLSTable вместо
+    списка строк. Ошибка чтения передается в основной поток и возбуждается при получении
+    следующей строки. close() или выход из блока with останавливает чтение и дожидается потока
+    (генератор batches закрывается в нем же, например возвращая соединение в пул), поэтому при
+    ошибке вывода чтение не продолжается впустую:
+
+        with executor.prefetch_table_data(sqlquery, table_info) as rows:
+            rep.print_table(XLSTable(table_info, rows), cur_row)
+
+    Время, которое основной поток ждал данных, учитывается в instrumentation как 'pipeline:wait'
+    """
+    def __init__(self, batches, max_batches=4, instrumentation=None):
+        assert max_batches >= 1, "в очереди должна помещаться хотя бы одна порция"
+        self._batches = batches
+        self._queue = queue.Queue(max_batches)
+        self._stop = threading.Event()
+        self._thread = None
+        self._iterated = False
+        self.instrumentation = instrumentation if instrumentation is not None else default_instrumentation()
+
+    def start(self):
+        """Запускает чтение в фоновом потоке (при первом обращении к строкам - автоматически)
+        """
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._produce, name='xlsreport-prefetch', daemon=True)
+            self._thread.start()
+        return self
+
+    def _put(self, kind, item):
+        """Кладет элемент в очередь, ожидая места; False - чтение остановлено
+        """
+        while not self._stop.is_set():
+            try:
+                self._queue.put((kind, item), timeout=_POLL_INTERVAL)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _produce(self):
+        batches = None
+        try:
+            batches = iter(self._batches)
+            for batch in batches:
+                if not self._put(_BATCH, batch):
+                    break
+            else:
+                self._put(_END, None)
+        except BaseException as e:
+            self._put(_ERROR, e)
+        finally:
+            close = getattr(batches, 'close', None)
+            if close is not None:
+                try:
+                    close()
+                except Exception as e:
+                    self._put(_ERROR, e)
+
+    def __iter__(self):
+        assert not self._iterated, "строки конвейера читаются только один раз"
+        self._iterated = True
+        self.start()
+
+        waited = 0.0
+        try:
+            while True:
+                start = time.perf_counter()
+                kind, item = self._queue.get()
+                waited += time.perf_counter() - start
+                if kind == _END:
+                    return
+                if kind == _ERROR:
+                    raise item
+                yield from item
+        finally:
+            self.instrumentation.add_time('pipeline:wait', waited)
+            self.close()
+
+    def close(self):
+        """Останавливает чтение и дожидается завершения фонового потока
+        """
+        self._stop.set()
+        thread = self._thread
+        if (thread is None) or (thread is threading.current_thread()):
+            return
+        while thread.is_alive():
+            # освобождаем место в очереди, чтобы поток не ждал его до следующей проверки
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                pass
+            thread.join(_POLL_INTERVAL)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.close()
@@ -16,6 +16,13 @@ from .xlstable import *
 from .xlsutils import *
 from .systemutils import *
 from .xlsutils_apply import *
+from .xlsstream import *
+from .xlsdirect import *
+from .xlslayout import *
+from .xlsinstrument import *
+from .xlspipeline import *
+from .xlstemplate import *
+from .xlsappend import *
 
 PrintSetupStruct = namedtuple('PrintSetupStruct', 'orientation pages_width')
 
@@ -26,37 +33,152 @@ class PrintSetup(Enum):
     LandscapeW1 = PrintSetupStruct('landscape', 1)
     LandscapeW2 = PrintSetupStruct('landscape', 2)
 
+def _sheet_print_setup(ws):
+    """Параметры печати PrintSetup, соответствующие листу ws (по умолчанию LandscapeW1)
+    """
+    for setup in PrintSetup:
+        if (ws.page_setup.orientation == setup.value.orientation) and \
+           (ws.page_setup.fitToWidth == setup.value.pages_width):
+            return setup
+    return PrintSetup.LandscapeW1
+
 class XLSReport():
     """Класс, инкапсулирующий в себе методы для создания отчета в Excel
     """
 
-    def __init__(self, sheet_name='Новый лист', print_setup=PrintSetup.LandscapeW1, protection=False):
+    def __init__(self, sheet_name='Новый лист', print_setup=PrintSetup.LandscapeW1, protection=False,
+                 streaming=False, instrumentation=None, direct=False, template=None):
         """Конструктор, создает книгу с одним именованным листом, устанавливает параметры для печати
+
+        streaming=True - книга создается в режиме write-only: строки листа записываются по мере
+        готовности и не хранятся в памяти. В этом режиме ширины и скрытие колонок нужно задать
+        до вывода первой таблицы, а уже записанные строки изменить нельзя
+
+        direct=True - строки листов записываются прямо в XML (XLSDirectSheet), минуя объекты
+        ячеек openpyxl; ограничения те же, что у streaming, но книгу можно сохранять несколько раз
+
+        instrumentation - XLSInstrumentation для хода выполнения, сообщений и замеров времени
+        (например XLSMetrics), по умолчанию default_instrumentation()
+
+        template - шаблон: путь к .xlsx (разбирается один раз на процесс, см. load_template) или
+        XLSTemplate. Книга отчета - копия шаблона, вывод идет на его активный лист, переименованный
+        в sheet_name, с параметрами печати, ширинами колонок и стилями шаблона (print_setup не
+        применяется); start_row - первая строка после содержимого листа шаблона. Шаблон
+        поддерживается в обычном режиме и в режиме direct
         """
-        self._wb = workbook_create()
-        self._ws = sheet_create(self._wb, sheet_name)
-        sheet_print_setup(self._ws, print_setup.value.orientation, print_setup.value.pages_width)
+        assert (template is None) or direct or not streaming, \
+                "режим streaming не поддерживает шаблоны, используйте direct=True"
+        self.streaming = streaming or direct
+        self.direct = direct
+        self.instrumentation = instrumentation if instrumentation is not None else default_instrumentation()
         self.protection = protection
-        self._ws.protection.sheet = protection
+        if template is None:
+            self._wb = XLSDirectWorkbook() if direct else workbook_create(write_only=streaming)
+            self._create_sheet(sheet_name, print_setup)
+        else:
+            if not isinstance(template, XLSTemplate):
+                template = load_template(template)
+            self._wb = template.clone()
+            if direct:
+                XLSDirectWorkbook.from_workbook(self._wb)
+            self._open_template_sheet(sheet_name, print_setup)
+
+    @classmethod
+    def open(cls, filename, instrumentation=None):
+        """Открывает сохраненный отчет для дозаписи строк в его таблицы (append_table). Книга
+        открывается в памяти, как в обычном режиме; следующие объекты выводятся на активный лист
+        с первой свободной строки (start_row)
+        """
+        rep = cls.__new__(cls)
+        rep.streaming = rep.direct = False
+        rep.instrumentation = instrumentation if instrumentation is not None else default_instrumentation()
+        with rep.instrumentation.phase('load'):
+            rep._wb = load_report(filename)
+        ws = rep._wb.active
+        rep.protection = bool(ws.protection.sheet)
+        rep._use_sheet(ws.title, ws.title, _sheet_print_setup(ws), 1)
+        rep.start_row = ws.max_row + 1 if ws._cells else 1
+        return rep
+
+    def _use_sheet(self, title, sheet_name, print_setup, continuation_count):
+        """(дозапись) делает текущим существующий лист книги
+        """
+        if self._wb[title] is not getattr(self, '_ws', None):
+            if hasattr(self, '_ws'):
+                self._flush_sheet()
+            self._ws = self._wb[title]
+        self._sheet_name = sheet_name
+        self._print_setup = print_setup
+        self._continuation_count = continuation_count
+
+    def _create_sheet(self, sheet_name, print_setup):
+        self._sheet_name = sheet_name
+        self._print_setup = print_setup
+        self._continuation_count = 1
+        ws = sheet_create(self._wb, sheet_name)
+        sheet_print_setup(ws, print_setup.value.orientation, print_setup.value.pages_width)
+        ws.protection.sheet = self.protection
+        self.start_row = 1
+        if self.direct:
+            self._ws = XLSDirectSheet(ws)
+        else:
+            self._ws = XLSStreamSheet(ws) if self.streaming else ws
+
+    def _open_template_sheet(self, sheet_name, print_setup):
+        self._sheet_name = sheet_name
+        self._print_setup = print_setup
+        self._continuation_count = 1
+        ws = self._wb.active
+        ws.title = sheet_name
+        if self.protection:
+            ws.protection.sheet = True
+        self.start_row = ws.max_row + 1 if ws._cells else 1
+        self._ws = XLSDirectSheet(ws) if self.direct else ws
+
+    def _flush_sheet(self):
+        """Завершает вывод листа: дописывает на лист все строки, оставшиеся в буфере (в режиме
+        streaming), либо делает самую частую высоту строк высотой листа по умолчанию
+        """
+        if self.streaming:
+            self._ws.flush()
+        else:
+            coalesce_row_heights(self._ws, min_row=frozen_row(self._ws))
 
     def append_sheet(self, sheet_name='Новый лист', print_setup=PrintSetup.LandscapeW1):
         """создает в конце книги еще один лист, устанавливает его параметры для печати
         """
-        self._ws = sheet_create(self._wb, sheet_name)
-        sheet_print_setup(self._ws, print_setup.value.orientation, print_setup.value.pages_width)
-        self._ws.protection.sheet = self.protection
+        self._flush_sheet()
+        self._create_sheet(sheet_name, print_setup)
 
-    def launch_excel(self, templatename='sample'):
+    def save(self, target, compression='default'):
+        """Сохраняет книгу в target: путь к файлу, дескриптор открытого файла или поток записи
+        (в том числе без произвольного доступа: канал, ответ HTTP), архив пишется по мере создания.
+        compression - сжатие ZIP: 'stored' (без сжатия), 'fast', 'default', 'best' или уровень 0-9.
+        Возвращает SaveResult (записано байт, секунд)
+        """
+        with self.instrumentation.phase('save'):
+            self._flush_sheet()
+            result = workbook_save(self._wb, target, compression)
+
+        self.instrumentation.message("Книга сохранена: {0:d} байт за {1:.2f} с".format(
+                result.bytes_written, result.seconds))
+        return result
+
+    def launch_excel(self, templatename='sample', compression='default'):
         """Запускает программу по умолчанию для xls-файлов и открывает в ней workbook
         """
         newfilename = temporary_file(templatename)
-        self._wb.save(newfilename)
+        self.save(newfilename, compression)
 
-        print("Открытие файла '{0:s}'...".format(newfilename))
+        self.instrumentation.message("Открытие файла '{0:s}'...".format(newfilename))
         open_file(newfilename)
 
-    def apply_column_widths(self, tableheader, first_col=1):
-        tableheader.apply_widths(self._wb.active, first_col)
+    def apply_column_widths(self, tableheader, first_col=1, table=None):
+        """Ширины колонок из шапки таблицы; если передана table, колонки шапки без заданной
+        ширины получают ширину по самому длинному значению соответствующего поля таблицы
+        """
+        tableheader.apply_widths(self._ws, first_col,
+                                 table.column_widths() if table is not None else None)
 
     def get_column_letter(self, col):
         return get_column_letter(col)
@@ -72,17 +194,82 @@ class XLSReport():
                              end_row=1,   end_column=max_col)
 
         self._ws.cell(row=1, column=1).value = "Пользователь: {0:s}. Дата и время: {1:s}"\
-                .format(os.getlogin(), datetime.datetime.now().strftime("%A %d %B %Y %H:%M"))
-        apply_range(self._ws, 1, 1, 1, max_col, set_font, size=9, italic=True)
-        apply_range(self._ws, 1, 1, 1, max_col, set_alignment, horizontal='right', vertical='top')
+                .format(current_user(), datetime.datetime.now().strftime("%A %d %B %Y %H:%M"))
+        apply_range(self._ws, 1, 1, 1, max_col, set_style, font=style_font(size=9, italic=True),
+                    alignment=style_alignment(horizontal='right', vertical='top'))
         return 2
 
     def print_label(self, label, first_row, first_col=1, col_count=1):
-        label.apply(self._wb.active, first_row, first_col, col_count)
+        label.apply(self._ws, first_row, first_col, col_count)
         return first_row + 1
 
     def print_tableheader(self, tableheader, first_row, first_col=1):
-        return tableheader.apply(self._wb.active, first_row, first_col)
+        return tableheader.apply(self._ws, first_row, first_col)
+
+    def _continue_sheet(self, first_col, tableheader):
+        """Лист продолжения таблицы: '<имя листа> (N)' с теми же параметрами печати и ширинами
+        колонок, с шапкой таблицы tableheader в первых строках
+        """
+        prev_ws, sheet_name, print_setup = self._ws, self._sheet_name, self._print_setup
+        count = self._continuation_count + 1
+        suffix = " ({0:d})".format(count)
+        self.append_sheet(sheet_name[:31 - len(suffix)] + suffix, print_setup)
+        self._sheet_name, self._continuation_count = sheet_name, count
+
+        for key, dim in prev_ws.column_dimensions.items():
+            new_dim = self._ws.column_dimensions[key]
+            new_dim.min, new_dim.max = dim.min, dim.max
+            new_dim.width, new_dim.hidden, new_dim.outline_level = dim.width, dim.hidden, dim.outline_level
+
+        first_row = 1
+        if tableheader is not None:
+            first_row = tableheader.apply(self._ws, first_row, first_col)
+        return self._ws, first_row
+
+    def print_table(self, table, first_row, first_col=1, tableheader=None, max_rows=EXCEL_MAX_ROWS,
+                    name=None):
+        """Выводит таблицу. Если таблица не помещается на лист (не больше max_rows строк на листе,
+        по умолчанию - предел Excel), она продолжается на новых листах, созданных append_sheet,
+        с шапкой tableheader. Перенос делается на границах групп иерархии, чтобы не разрывать
+        объединения и подитоги. Следующие объекты выводятся на последний лист таблицы.
+        name - имя таблицы в книге: ее состояние сохраняется в книге, и в сохраненный отчет
+        можно дописать строки (XLSReport.open, append_table)
+        """
+        def _continuation():
+            return self._continue_sheet(first_col, tableheader)
+
+        with self.instrumentation.phase('table'):
+            cur_row = table.apply(self._ws, first_row, first_col, self.instrumentation, max_rows, _continuation,
+                                  appendable=(name is not None))
+        if name is not None:
+            self._save_table_state(name, table)
+        return cur_row
+
+    def append_table(self, table, name, tableheader=None, max_rows=EXCEL_MAX_ROWS):
+        """Дописывает строки table в таблицу name отчета, открытого XLSReport.open: продолжает
+        открытые группы иерархии (объединения, группировку строк, диапазоны формул подитогов) и
+        заново выводит только строки подитогов открытых групп и общего итога в конце таблицы,
+        поэтому время вывода зависит от числа новых строк, а не от размера таблицы. Поля и
+        иерархия table - те же, что при выводе; таблица должна быть последней на своем листе.
+        Не поместившиеся строки переносятся на листы продолжения с шапкой tableheader.
+        Возвращает следующую строку последнего листа таблицы
+        """
+        assert not self.streaming, "дозапись таблицы возможна только в книгу, открытую в памяти"
+        state = load_table_state(self._wb, name)
+        self._use_sheet(state['sheet'], state['sheet_name'], PrintSetup[state['print_setup']],
+                        state['continuation_count'])
+        first_col = state['first_col']
+
+        def _continuation():
+            return self._continue_sheet(first_col, tableheader)
+
+        with self.instrumentation.phase('table'):
+            cur_row = table.apply(self._ws, state['first_row'], first_col, self.instrumentation, max_rows,
+                                  _continuation, resume=state)
+        self._save_table_state(name, table)
+        return cur_row
 
-    def print_table(self, table, first_row, first_col=1):
-        return table.apply(self._wb.active, first_row, first_col)
+    def _save_table_state(self, name, table):
+        state = dict(table.end_state, sheet_name=self._sheet_name, print_setup=self._print_setup.name,
+                     continuation_count=self._continuation_count)
+        save_table_state(self._wb, name, state)
@@ -0,0 +1,66 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Доступ к строке данных таблицы по именам полей без копирования строки в словарь
+"""
+
+from collections.abc import MutableMapping
+
+class XLSRowView(MutableMapping):
+    """Строка данных как словарь {имя поля: значение}: чтение и запись идут напрямую в строку
+    по индексу поля. Передается в функции расчета, раскраски и подзаголовков таблицы
+    """
+    __slots__ = ('_index', '_row')
+
+    def __init__(self, index, row):
+        """index - словарь {имя поля: индекс в строке}, общий для всех строк таблицы
+        """
+        self._index = index
+        self._row = row
+
+    def __getitem__(self, fieldname):
+        return self._row[self._index[fieldname]]
+
+    def __setitem__(self, fieldname, value):
+        self._row[self._index[fieldname]] = value
+
+    def __delitem__(self, fieldname):
+        raise TypeError("поле строки таблицы нельзя удалить")
+
+    def __contains__(self, fieldname):
+        return fieldname in self._index
+
+    def __iter__(self):
+        return iter(self._index)
+
+    def __len__(self):
+        return len(self._index)
+
+    def __repr__(self):
+        return "XLSRowView({0!r})".format(dict(self.items()))
+
+class XLSRowChunk:
+    """Порция строк таблицы для пакетных функций расчета и раскраски: последовательность
+    XLSRowView и доступ к значениям поля по всей порции сразу
+    """
+    __slots__ = ('_index', 'rows', 'views')
+
+    def __init__(self, index, rows):
+        self._index = index
+        self.rows = rows
+        self.views = [XLSRowView(index, row) for row in rows]
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __iter__(self):
+        return iter(self.views)
+
+    def __getitem__(self, i):
+        return self.views[i]
+
+    def column(self, fieldname):
+        """Значения поля fieldname во всех строках порции
+        """
+        findex = self._index[fieldname]
+        return [row[findex] for row in self.rows]
@@ -0,0 +1,124 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Статистика по колонкам данных таблицы: пустые и нулевые значения, минимум и максимум,
+максимальная длина значения в том виде, в котором оно выводится на лист
+"""
+
+import datetime
+from numbers import Number
+
+try:
+    import numpy as np
+except ImportError:
+    np = None # module numpy doesn't exists
+
+_NUMBER_TEXT = {
+    'int':      '{0:,.0f}',
+    '1digit':   '{0:,.1f}',
+    'currency': '{0:,.2f}',
+    '3digit':   '{0:,.3f}',
+}
+
+def rendered_length(value, format='string'):
+    """Длина значения в символах так, как его покажет Excel в формате поля (для многострочного
+    текста - длина самой длинной строки)
+    """
+    if value is None:
+        return 0
+    if (format in _NUMBER_TEXT) and isinstance(value, Number):
+        return len(_NUMBER_TEXT[format].format(value))
+    if isinstance(value, (datetime.date, datetime.datetime)):
+        return 10
+    return max(len(line) for line in str(value).split('\n'))
+
+def is_null(value):
+    """Пустое значение: None или NaN (только NaN не равно самому себе)
+    """
+    return (value is None) or (value != value)
+
+class XLSColumnStats:
+    """Статистика одной колонки: количество значений, пустых (None, NaN) и нулевых значений,
+    минимум, максимум (None, если значения несравнимы) и максимальная длина выводимого текста
+    """
+    __slots__ = ('count', 'null_count', 'zero_count', 'min', 'max', 'max_len')
+
+    def __init__(self, count=0, null_count=0, zero_count=0, min=None, max=None, max_len=0):
+        self.count = count
+        self.null_count = null_count
+        self.zero_count = zero_count
+        self.min = min
+        self.max = max
+        self.max_len = max_len
+
+    @property
+    def all_null(self):
+        return self.null_count == self.count
+
+    @property
+    def all_zero(self):
+        return self.zero_count == self.count
+
+    @property
+    def all_empty(self):
+        """Все значения пустые или нулевые - в числовых форматах такие ячейки не выводятся
+        """
+        return self.null_count + self.zero_count == self.count
+
+    def update(self, other):
+        """Добавляет статистику следующей порции строк
+        """
+        self.count += other.count
+        self.null_count += other.null_count
+        self.zero_count += other.zero_count
+        self.max_len = max(self.max_len, other.max_len)
+        try:
+            if other.min is not None:
+                self.min = other.min if self.min is None else min(self.min, other.min)
+            if other.max is not None:
+                self.max = other.max if self.max is None else max(self.max, other.max)
+        except TypeError:
+            self.min = self.max = None
+
+    def __repr__(self):
+        return "XLSColumnStats({0:s})".format(
+                ", ".join("{0:s}={1!r}".format(k, getattr(self, k)) for k in self.__slots__))
+
+def _numpy_stats(values, format):
+    count = len(values)
+    if values.dtype.kind == 'f':
+        valid = values[~np.isnan(values)]
+    else:
+        valid = values
+    stats = XLSColumnStats(count=count, null_count=count - len(valid),
+                           zero_count=int(np.count_nonzero(valid == 0)))
+    if len(valid):
+        stats.min, stats.max = valid.min().item(), valid.max().item()
+        stats.max_len = max(rendered_length(stats.min, format), rendered_length(stats.max, format))
+    return stats
+
+def column_stats(values, format='string'):
+    """Статистика колонки values (список значений или массив numpy); для числовых массивов
+    расчет векторный
+    """
+    if (np is not None) and isinstance(values, np.ndarray) and (values.dtype.kind in 'iufb'):
+        return _numpy_stats(values, format)
+
+    present = [v for v in values if not is_null(v)]
+    stats = XLSColumnStats(count=len(values), null_count=len(values) - len(present),
+                           zero_count=sum(1 for v in present if v == 0))
+    if not present:
+        return stats
+
+    try:
+        stats.min, stats.max = min(present), max(present)
+    except TypeError:
+        pass
+
+    if (format in _NUMBER_TEXT) and (stats.min is not None) and \
+            isinstance(stats.min, Number) and isinstance(stats.max, Number):
+        # длина числа в формате поля растет с модулем, поэтому достаточно крайних значений
+        stats.max_len = max(rendered_length(stats.min, format), rendered_length(stats.max, format))
+    else:
+        stats.max_len = max(rendered_length(v, format) for v in present)
+    return stats
@@ -0,0 +1,74 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.worksheet.cell_range import CellRange
+
+from .xlsformula import stream_sheet_writer
+
+class XLSStreamSheet:
+    """Обертка над листом write-only книги openpyxl, повторяющая ту часть интерфейса Worksheet,
+    которой пользуются метки, шапки и таблицы. Строки копятся в буфере, пока их можно изменить,
+    и записываются на лист по порядку вызовом flush(). После записи строка уже не изменяется.
+    """
+    def __init__(self, ws):
+        self._ws = ws
+        self._rows = dict()
+        self._next_row = 1
+
+    def __getattr__(self, name):
+        return getattr(self._ws, name)
+
+    @property
+    def flushed_row(self):
+        """Номер первой строки, которая еще не записана на лист
+        """
+        return self._next_row
+
+    def cell(self, row, column, value=None):
+        assert row >= self._next_row, "строка {0:d} уже записана на лист".format(row)
+
+        cells = self._rows.setdefault(row, dict())
+        cl = cells.get(column)
+        if cl is None:
+            cl = cells[column] = WriteOnlyCell(self._ws)
+        if value is not None:
+            cl.value = value
+        return cl
+
+    def merge_cells(self, range_string=None, start_row=None, start_column=None, end_row=None, end_column=None):
+        cr = CellRange(range_string=range_string, min_col=start_column, min_row=start_row,
+                       max_col=end_column, max_row=end_row)
+        assert cr.min_row >= self._next_row, "строка {0:d} уже записана на лист".format(cr.min_row)
+
+        # MultiCellRange.add проверяет вхождение перебором всех диапазонов листа, что на больших
+        # листах дает квадратичное время; объединяемые строки еще в буфере, поэтому добавляем напрямую
+        self._ws.merged_cells.ranges.add(cr)
+
+        # как и в Worksheet, значение остается только у левой верхней ячейки
+        cells = cr.cells
+        next(cells)
+        for row, col in cells:
+            cl = self._rows.get(row, {}).get(col)
+            if cl is not None:
+                cl.value = None
+
+    def flush(self, upto_row=None):
+        """Записывает на лист все строки до upto_row (не включая), по умолчанию - весь буфер
+        """
+        if upto_row is None:
+            upto_row = max(self._rows.keys(), default=self._next_row - 1) + 1
+            upto_row = max(upto_row, max(self._ws.row_dimensions.keys(), default=0) + 1)
+
+        if upto_row > self._next_row:
+            stream_sheet_writer(self._ws)
+        for r in range(self._next_row, upto_row):
+            cells = self._rows.pop(r, {})
+            row = [None] * max(cells.keys(), default=0)
+            for c, cl in cells.items():
+                row[c - 1] = cl
+            self._ws.append(row)
+            # размеры строки уже записаны, держать их в памяти незачем
+            self._ws.row_dimensions.pop(r, None)
+
+        self._next_row = max(self._next_row, upto_row)
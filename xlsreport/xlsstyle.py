@@ -0,0 +1,141 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Реестр стилей
+
+Объекты стилей openpyxl создаются один раз на процесс для каждой комбинации параметров
+(style_* функции), а их индексы в таблицах стилей книги вычисляются один раз на книгу
+(style_ids). Ячейке затем присваиваются готовые индексы, без создания объектов и без
+хеширования их в таблицах стилей openpyxl.
+"""
+
+from copy import copy
+from functools import lru_cache
+from weakref import WeakKeyDictionary
+
+from openpyxl.styles.borders import Border, Side
+from openpyxl.styles import Font, Alignment, PatternFill
+from openpyxl.styles.cell_style import StyleArray
+from openpyxl.styles.numbers import BUILTIN_FORMATS_REVERSE
+try:
+    from openpyxl.styles.numbers import BUILTIN_FORMATS_MAX_SIZE
+except ImportError:
+    BUILTIN_FORMATS_MAX_SIZE = 164 # openpyxl < 2.6
+
+NUMBER_FORMATS = {
+    'int':      '# ### ### ###',
+    '1digit':   '#,#0.0',
+    'currency': '#,##0.00',
+    '3digit':   '#,###0.000',
+    'date':     'DD.MM.YYYY',
+}
+
+# позиции индексов в StyleArray
+_STYLE_KEYS = (('font', 0), ('fill', 1), ('border', 2), ('number_format', 3), ('alignment', 5))
+_STYLE_COLLECTIONS = {'font': '_fonts', 'fill': '_fills', 'border': '_borders', 'alignment': '_alignments'}
+
+@lru_cache(maxsize=None)
+def style_border(border_style='thin'):
+    side = Side(style=border_style)
+    return Border(left=side, right=side, top=side, bottom=side)
+
+@lru_cache(maxsize=None)
+def style_font(name='Calibri', size=11, bold=False, italic=False, underline='none',
+               vertAlign='baseline', strike=False, color='FF000000'):
+    return Font(name=name, size=size, bold=bold, italic=italic, underline=underline,
+                vertAlign=vertAlign, strike=strike, color=color)
+
+@lru_cache(maxsize=None)
+def style_alignment(horizontal='center', vertical='center', textRotation=None, wrapText=True,
+                    shrinkToFit=True):
+    # textRotation=None openpyxl записывает в styles.xml как repr дескриптора и файл не читается
+    return Alignment(horizontal=horizontal, vertical=vertical, textRotation=textRotation or 0,
+                     wrapText=wrapText, shrinkToFit=shrinkToFit)
+
+@lru_cache(maxsize=None)
+def style_fill(color='FFFFFF', fill_type='solid'):
+    return PatternFill(start_color=color, end_color=color, fill_type=fill_type)
+
+@lru_cache(maxsize=None)
+def style_pattern_fill(bg_color='FFFFFF', fg_color='000000', pattern_type='none'):
+    # Цвет фона - bg, а штрихов на нем - fg, но при заливке 'solid' - цвет фона fg.
+    if pattern_type == 'solid':
+        return PatternFill(bgColor=fg_color, fgColor=bg_color, patternType=pattern_type)
+    return PatternFill(bgColor=bg_color, fgColor=fg_color, patternType=pattern_type)
+
+def style_number_format(format=''):
+    """Возвращает строку числового формата по названию формата поля, None - формат не задается
+    """
+    return NUMBER_FORMATS.get(format)
+
+
+_workbook_styles = WeakKeyDictionary()
+
+def _workbook_cache(wb):
+    cache = _workbook_styles.get(wb)
+    if cache is None:
+        cache = _workbook_styles[wb] = dict()
+    return cache
+
+def _style_index(wb, cache, name, obj):
+    key = (name, obj if name == 'number_format' else id(obj))
+    idx = cache.get(key)
+    if idx is None:
+        if name == 'number_format':
+            if obj in BUILTIN_FORMATS_REVERSE:
+                idx = BUILTIN_FORMATS_REVERSE[obj]
+            else:
+                idx = wb._number_formats.add(obj) + BUILTIN_FORMATS_MAX_SIZE
+        else:
+            idx = getattr(wb, _STYLE_COLLECTIONS[name]).add(obj)
+        # ссылка на объект не дает переиспользовать его id() для другого стиля
+        cache[key] = idx = (idx, obj)
+    return idx[0]
+
+def style_ids(wb, font=None, fill=None, border=None, number_format=None, alignment=None):
+    """Возвращает индексы заданных компонентов стиля в книге wb: кортеж пар (позиция в StyleArray, индекс)
+    """
+    cache = _workbook_cache(wb)
+    key = ('ids', id(font), id(fill), id(border), number_format, id(alignment))
+    ids = cache.get(key)
+    if ids is None:
+        components = dict(font=font, fill=fill, border=border,
+                          number_format=number_format, alignment=alignment)
+        ids = tuple((pos, _style_index(wb, cache, name, components[name]))
+                    for name, pos in _STYLE_KEYS if components[name] is not None)
+        cache[key] = ids = (ids, (font, fill, border, alignment))
+    return ids[0]
+
+def style_array(wb, font, fill, border, number_format, alignment):
+    """Возвращает готовый StyleArray для полностью заданного стиля ячейки
+    """
+    cache = _workbook_cache(wb)
+    key = ('array', id(font), id(fill), id(border), number_format, id(alignment))
+    sa = cache.get(key)
+    if sa is None:
+        sa = StyleArray()
+        for pos, idx in style_ids(wb, font, fill, border, number_format, alignment):
+            sa[pos] = idx
+        cache[key] = sa = (sa, (font, fill, border, alignment))
+    return sa[0]
+
+def outline_border_id(wb, border_id, side_name, border_style):
+    """Индекс рамки, полученной из рамки border_id заменой стиля одной стороны
+    """
+    cache = _workbook_cache(wb)
+    key = ('outline', border_id, side_name, border_style)
+    idx = cache.get(key)
+    if idx is None:
+        new_border = copy(wb._borders[border_id])
+        getattr(new_border, side_name).border_style = border_style
+        idx = cache[key] = wb._borders.add(new_border)
+    return idx
+
+def cell_set_style(cl, ids):
+    """Присваивает ячейке индексы стилей, полученные из style_ids
+    """
+    sa = cl._style
+    if sa is None:
+        sa = cl._style = StyleArray()
+    for pos, idx in ids:
+        sa[pos] = idx
@@ -1,12 +1,17 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
 
-import sys
-import itertools
-
-from openpyxl.utils import get_column_letter
 from .xlsutils_apply import *
 from .xlscolor import *
+from .xlsstream import *
+from .xlscolumnar import *
+from .xlsaggregate import *
+from .xlsformula import *
+from .xlslayout import *
+from .xlsrow import *
+from .xlsstats import *
+from .xlsinstrument import *
+from .xlstablerender import *
 
 from recordclass import recordclass
 
@@ -25,13 +30,42 @@ FieldStruct = recordclass('FieldStruct', 'findex xls_start xls_end format hidden
                                          'last_value last_value_row changed '
                                          'hide_condition hide_flag '
                                          'merging subtitle subtitle_rowcount subtotal '
-                                         'color_fn pattern_fn')
+                                         'color_fn pattern_fn color_batch_fn pattern_batch_fn '
+                                         'color_depends pattern_depends')
+
+SUBTOTAL_MODES = ('formula', 'cached', 'static')
+
+EXCEL_MAX_ROWS = 1048576 # строк на листе Excel
+
+def _is_zero(value): return value == 0
+def _is_null(value): return is_null(value)
+def _is_empty(value): return is_null(value) or (value == 0)
+
+# условия скрытия колонок, которые проверяются по статистике колонки, без перебора значений
+HIDE_CONDITIONS = {'zero': _is_zero, 'null': _is_null, 'empty': _is_empty}
+_HIDE_STATS = {_is_zero: 'all_zero', _is_null: 'all_null', _is_empty: 'all_empty'}
 
 class XLSTable:
     """Класс, инкапсулирующий информацию и методы отображения данных таблицы
     """
-    def __init__(self, colinfo, data, row_height=30):
-        if len(data) > 0:
+    def __init__(self, colinfo, data, row_height=30, subtotal_mode='cached'):
+        """data - список строк (списков значений в порядке полей colinfo), любой итератор таких строк
+        (генератор по курсору БД, csv.reader и т.п., количество строк заранее неизвестно) либо
+        колоночные данные: словарь массивов NumPy, таблица pyarrow, XLSColumnarData или путь к
+        файлу .npy/Arrow IPC.
+        subtotal_mode - как выводить подитоги и общий итог: 'formula' - только формулы SUBTOTAL
+        (значения рассчитает Excel при открытии), 'cached' - формулы вместе с рассчитанными
+        при выводе значениями, 'static' - только рассчитанные значения, без формул
+        """
+        assert subtotal_mode in SUBTOTAL_MODES, "неизвестный режим подитогов '{0:s}'".format(subtotal_mode)
+        if is_columnar_data(data):
+            if not isinstance(data, XLSColumnarData):
+                data = XLSColumnarData(data)
+            data = data.rows(colinfo)
+        elif not (hasattr(data, '__len__') and hasattr(data, '__getitem__')):
+            # итератор читается один раз, структура проверяется по первой строке при выводе
+            data = self._checked_rows(data, len(colinfo))
+        elif len(data) > 0:
             assert len(colinfo) == len(data[0]), "количество полей в структуре таблицы не совпадает с фактическим количеством"
 
         self._fields = dict()
@@ -45,7 +79,8 @@ class XLSTable:
                         last_value=None, last_value_row=None, changed=False,
                         hide_condition=None, hide_flag=None,
                         merging=False, subtitle=None, subtitle_rowcount=0, subtotal=None,
-                        color_fn=None, pattern_fn=None)
+                        color_fn=None, pattern_fn=None, color_batch_fn=None, pattern_batch_fn=None,
+                        color_depends=None, pattern_depends=None)
             findex += 1
             if not ci.hidden:
                 cindex += ci.ccount
@@ -54,22 +89,92 @@ class XLSTable:
         self._hierarchy = []
         self._row_height = row_height
         self._col_count = sum([ci.ccount for ci in colinfo if not ci.hidden])
-        self._row_count = len(data)
+        self._row_count = len(data) if hasattr(data, '__len__') else None
         self._calculate_fn = None
+        self._calculate_batch_fn = None
+        self._subtotal_mode = subtotal_mode
+        self._grand_total = None
+        self._grand_total_label = None
+
+    @staticmethod
+    def _checked_rows(rows, field_count):
+        """Проверяет количество полей в первой строке итератора при первом обращении к ней
+        """
+        rows = iter(rows)
+        for row in rows:
+            assert field_count == len(row), "количество полей в структуре таблицы не совпадает с фактическим количеством"
+            yield row
+            break
+        yield from rows
+
+    def _materialize(self):
+        """Читает строки итератора в список, если нужно больше одного прохода по данным
+        """
+        if self._row_count is None:
+            self._data = list(self._data)
+            self._row_count = len(self._data)
 
     def add_hide_column_condition(self, fieldname, cond_func):
+        """Колонка поля скрывается, если cond_func(value) истинно для всех значений поля.
+        cond_func может быть и именем условия из HIDE_CONDITIONS: 'zero' - все значения нулевые,
+        'null' - все пустые, 'empty' - все пустые или нулевые
+        """
+        if isinstance(cond_func, str):
+            assert cond_func in HIDE_CONDITIONS, "неизвестное условие скрытия '{0:s}'".format(cond_func)
+            cond_func = HIDE_CONDITIONS[cond_func]
         self._fields[fieldname].hide_condition = cond_func
         self._fields[fieldname].hide_flag = True
 
-    def add_coloring(self, fieldname, color_fn):
+    def _check_depends(self, depends_on):
+        """Поля depends_on, по значениям которых запоминаются результаты функции (memoized)
+        """
+        for fname in depends_on or ():
+            assert fname in self._fields, "в данных нет поля '{0:s}'".format(fname)
+        return None if depends_on is None else tuple(depends_on)
+
+    def add_coloring(self, fieldname, color_fn, depends_on=None):
+        """color_fn(row) возвращает цвет заливки ячейки поля по строке данных (XLSRowView).
+        depends_on - список полей, от которых зависит цвет: для повторяющихся значений этих
+        полей color_fn не вызывается, а используется уже рассчитанный цвет (в пределах одного
+        вывода таблицы)
+        """
+        self._fields[fieldname].color_depends = self._check_depends(depends_on)
         self._fields[fieldname].color_fn = color_fn
 
-    def add_pattern(self, fieldname, pattern_fn):
+    def add_pattern(self, fieldname, pattern_fn, depends_on=None):
+        """pattern_fn(row) возвращает (узор, цвет фона, цвет узора), depends_on - как в add_coloring
+        """
+        self._fields[fieldname].pattern_depends = self._check_depends(depends_on)
         self._fields[fieldname].pattern_fn = pattern_fn
 
+    def add_coloring_batch(self, fieldname, color_batch_fn):
+        """color_batch_fn(rows) получает порцию строк XLSRowChunk и возвращает список цветов заливки
+        для каждой строки порции
+        """
+        self._fields[fieldname].color_batch_fn = color_batch_fn
+
+    def add_pattern_batch(self, fieldname, pattern_batch_fn):
+        """pattern_batch_fn(rows) возвращает для каждой строки порции (узор, цвет фона, цвет узора)
+        """
+        self._fields[fieldname].pattern_batch_fn = pattern_batch_fn
+
     def set_calculating(self, calc_func):
+        """calc_func(row) рассчитывает значения полей строки, изменяя XLSRowView
+        """
         self._calculate_fn = calc_func
 
+    def set_calculating_batch(self, calc_batch_func):
+        """calc_batch_func(rows) рассчитывает значения полей сразу для порции строк XLSRowChunk
+        (например, по колонкам rows.column(...)), изменяя строки порции. Вызывается до set_calculating
+        """
+        self._calculate_batch_fn = calc_batch_func
+
+    def set_grand_total(self, fields, label='Итого'):
+        """Строка общего итога по полям fields в конце таблицы
+        """
+        self._grand_total = fields
+        self._grand_total_label = label
+
     def hierarchy_append(self, fieldname, merging=False, subtitle=None, subtotal=None, subtitle_rowcount=0):
         self._hierarchy.append(fieldname)
         self._fields[fieldname].merging = merging
@@ -77,244 +182,162 @@ class XLSTable:
         self._fields[fieldname].subtotal = subtotal
         self._fields[fieldname].subtitle_rowcount = subtitle_rowcount
 
-    def group_by_data(self, colinfo, hierarchy, sums):
-        # TODO: asserts
-        hier_indexes = [self._fields[fname].findex for fname in hierarchy]
-        key_func = lambda d: tuple([(d[i] is None, d[i]) for i in hier_indexes])
-
-        table_data = copy(self._data)
-        table_data.sort(key=key_func)
-
-        table_total_data=[]
-        for key, rows in itertools.groupby(table_data, key_func):
-            stored_rows = list(rows)
-            data_row = []
-            for ci in colinfo:
-                if ci.fname in hierarchy:
-                    data_row.append(key[hierarchy.index(ci.fname)][1])
-                elif ci.fname in sums:
-                    cindex = self._fields[ci.fname].findex
-                    # TODO: refactor to zip
-                    data_row.append(sum(r[cindex] for r in stored_rows))
-            table_total_data.append(tuple(data_row))
+    def group_by_data(self, colinfo, hierarchy, sums=(), aggregates=None, vectorized=None):
+        """Таблица итогов по данным: группировка по полям hierarchy и агрегаты по остальным полям colinfo.
+        sums - поля, по которым считаются суммы. aggregates - словарь {поле colinfo: агрегат}, где
+        агрегат - одно из 'sum', 'count', 'min', 'max', 'mean', 'distinct' или пара (агрегат, поле
+        данных), если поле итогов называется иначе, чем поле данных (например, 'Sum1_max': ('max', 'Sum1')).
+        Пустые значения (None и NaN) в агрегатах не учитываются. Группировка выполняется за один проход
+        по хеш-таблице групп, упорядочиваются только итоговые строки. vectorized - считать агрегаты
+        числовых колонок через numpy (по умолчанию - только для колоночных данных)
+        """
+        specs = {fname: ('sum', fname) for fname in sums}
+        for fname, agg in (aggregates or dict()).items():
+            specs[fname] = (agg, fname) if isinstance(agg, str) else tuple(agg)
+
+        for fname in hierarchy:
+            assert fname in self._fields, "в данных нет поля группировки '{0:s}'".format(fname)
+        for fname, (func, source) in specs.items():
+            assert func in AGGREGATES, "неизвестный агрегат '{0:s}' для поля '{1:s}'".format(func, fname)
+            assert source in self._fields, "в данных нет поля '{0:s}'".format(source)
+
+        # порядок вывода: для каждого поля colinfo - индекс в ключе группы или в списке агрегатов
+        out_fields = [ci.fname for ci in colinfo if (ci.fname in hierarchy) or (ci.fname in specs)]
+        agg_fields = [fname for fname in out_fields if fname not in hierarchy]
+        agg_specs = [(specs[fname][0], self._fields[specs[fname][1]].findex) for fname in agg_fields]
+        key_indexes = [self._fields[fname].findex for fname in hierarchy]
+
+        columnar = isinstance(self._data, XLSColumnarRows)
+        if vectorized is None: vectorized = columnar
+
+        self._materialize()
+        if columnar:
+            groups = aggregate_columns([self._data.values(i) for i in key_indexes],
+                                       self._data.column, agg_specs, vectorized)
+        elif vectorized:
+            groups = aggregate_columns([[r[i] for r in self._data] for i in key_indexes],
+                                       lambda i: [r[i] for r in self._data], agg_specs, vectorized)
+        else:
+            groups = aggregate_rows(self._data, key_indexes, agg_specs)
+
+        positions = [(True, hierarchy.index(fname)) if fname in hierarchy else (False, agg_fields.index(fname))
+                     for fname in out_fields]
+        table_total_data = []
+        for key in sorted(groups, key=group_sort_key):
+            values = groups[key]
+            table_total_data.append(tuple(key[i] if is_key else values[i] for is_key, i in positions))
         return table_total_data
 
+    def column_stats(self, fieldnames=None):
+        """Статистика по значениям полей за один проход по данным: {имя поля: XLSColumnStats}.
+        Колоночные данные обрабатываются целыми колонками (числовые - через numpy), строки - порциями
+        """
+        if fieldnames is None:
+            fieldnames = list(self._fields.keys())
+        fields = [(fname, self._fields[fname]) for fname in fieldnames]
+
+        self._materialize()
+        if isinstance(self._data, XLSColumnarRows):
+            return {fname: column_stats(self._data.column(f.findex), f.format) for fname, f in fields}
+
+        stats = {fname: XLSColumnStats() for fname, _ in fields}
+        for start in range(0, len(self._data), ROW_CHUNK_SIZE):
+            columns = list(zip(*self._data[start:start + ROW_CHUNK_SIZE]))
+            for fname, f in fields:
+                stats[fname].update(column_stats(columns[f.findex], f.format))
+        return stats
+
+    def column_widths(self, min_width=6, max_width=60, padding=2):
+        """Ширины колонок листа по самому длинному выводимому значению поля:
+        {номер колонки от начала таблицы (с 0): ширина}. Для XLSTableHeader.apply_widths
+        """
+        stats = self.column_stats([fname for fname, f in self._fields.items() if not f.hidden])
+        widths = dict()
+        for fname, st in stats.items():
+            f = self._fields[fname]
+            ncols = f.xls_end - f.xls_start + 1
+            width = min(max((st.max_len + padding) / ncols, min_width), max_width)
+            for i in range(f.xls_start, f.xls_end + 1):
+                widths[i] = round(width, 1)
+        return widths
+
+    def _resolve_hide_conditions(self, fields):
+        """Проверяет условия скрытия колонок до вывода таблицы: условия из HIDE_CONDITIONS -
+        по статистике колонок, остальные - перебором значений поля до первого несовпадения
+        """
+        by_stats = [f for f in fields if f.hide_condition in _HIDE_STATS]
+        names = {f.findex: fname for fname, f in self._fields.items()}
+        stats = self.column_stats([names[f.findex] for f in by_stats])
+        for f in by_stats:
+            f.hide_flag = getattr(stats[names[f.findex]], _HIDE_STATS[f.hide_condition])
+
+        for f in fields:
+            if f.hide_condition in _HIDE_STATS: continue
+            if isinstance(self._data, XLSColumnarRows):
+                values = self._data.values(f.findex)
+            else:
+                values = (r[f.findex] for r in self._data)
+            f.hide_flag = all(f.hide_condition(v) for v in values)
+
+    def compile_row_plan(self, wb, first_col, pruned=()):
+        """Компилирует раскладку полей в план вывода строки данных: для каждой видимой колонки листа
+        (номер колонки, индекс поля или None, пропускать ли нулевое значение, итоговый стиль ячейки).
+        Стиль - StyleArray с выравниванием, форматом, рамкой и шрифтом, и те же индексы парами
+        для ячеек, у которых уже есть заливка. Колонки полей из pruned (уже известно, что они
+        будут скрыты) выводятся без стиля
+        """
+        plan = []
+        for f in self._fields.values():
+            if f.hidden: continue
+
+            findex = f.findex if f.format != 'empty' else None
+            skip_zero = f.format in ['int', '1digit', 'currency', '3digit']
+            if f.findex in pruned:
+                for col in range(first_col + f.xls_start, first_col + f.xls_end + 1):
+                    plan.append((col, findex, skip_zero, None, ()))
+                    findex = None
+                continue
+
+            if f.format in ['int', 'currency', '1digit', '3digit']:
+                alignment = style_alignment(horizontal='right')
+            else:
+                alignment = style_alignment()
+            number_format = style_number_format(f.format)
+
+            # ячейки без формата сохраняют General, как и при пошаговом применении стилей
+            sa = style_array(wb, style_font(), None, style_border(),
+                             number_format or 'General', alignment)
+            ids = style_ids(wb, font=style_font(), border=style_border(),
+                            number_format=number_format, alignment=alignment)
+
+            for col in range(first_col + f.xls_start, first_col + f.xls_end + 1):
+                plan.append((col, findex, skip_zero, sa, ids))
+                findex = None
+
+        return tuple(plan)
+
     def get_column_xls_index_pair(self, fieldname):
         return (self._fields[fieldname].xls_start, self._fields[fieldname].xls_end)
 
-    def apply(self, ws, first_row, first_col):
-        """Отображает непосредственно в XLS данные таблицы
+    def apply(self, ws, first_row, first_col, instrumentation=None, max_row=EXCEL_MAX_ROWS, continuation=None,
+              resume=None, appendable=False):
+        """Отображает непосредственно в XLS данные таблицы. instrumentation - XLSInstrumentation
+        для хода выполнения и замеров времени этапов (по умолчанию default_instrumentation()).
+        max_row - последняя строка листа, которую может занять таблица. continuation() создает
+        лист продолжения и возвращает (лист, первая строка таблицы на нем): таблица, которая не
+        помещается до max_row, переносится на него перед группой первого уровня иерархии, а если
+        группа не помещается и на пустой лист - перед ее подгруппой. Общий итог выводится на
+        последнем листе по строкам всех листов. Без continuation таблица, не поместившаяся
+        до max_row, вызывает ошибку. Возвращает следующую строку последнего листа.
+        После вывода end_state - состояние таблицы для дозаписи: открытые группы иерархии, суммы
+        их подитогов и общего итога, строки данных и итогов последнего листа. resume - такое
+        состояние (см. xlsappend): строки таблицы дописываются к уже выведенным на лист ws, начиная
+        со строки first_row; итоги открытых групп и общий итог выводятся заново (XLSTableRender).
+        appendable=True - таблица выводится для дозаписи: колонки, скрытые по условиям, выводятся
+        со стилями, чтобы их можно было показать, если дописанные строки не выполнят условие
         """
-        def _before_line_processing(row):
-            """ставим флаг changed если значение поля в структуре hierarchy поменяло свое значение
-            """
-            was_changed = False
-            # ordering sensitive
-            fieldlist = [fn for fn in self._hierarchy]
-            for fieldname in fieldlist:
-                f = self._fields[fieldname]
-                if (row is None) or (row[f.findex] != f.last_value):
-                    was_changed = True
-                if was_changed:
-                   self._fields[fieldname].changed = True
-
-        def _after_line_processing(row, cur_row):
-            """сохраняем инфо о последних значениях для всех полей в структуре _hierarchy
-            """
-            fieldlist = [fn for fn in self._hierarchy if self._fields[fn].changed]
-            for fieldname in fieldlist:
-                f = self._fields[fieldname]
-                self._fields[fieldname].last_value = row[f.findex] if row else None
-                self._fields[fieldname].last_value_row = cur_row
-                self._fields[fieldname].changed = False
-
-        def _merge_previous_row(cur_row):
-            """объединяем ячейки с одинаковыми значениями, и те, что шириной более 1 столбца
-            """
-            #TODO: refactor
-            fields = [f for _, f in self._fields.items()
-                        if (not f.merging) and (f.xls_end - f.xls_start != 0)]
-            for f in fields:
-                apply_range(ws, cur_row - 1, first_col + f.xls_start,
-                                cur_row - 1, first_col + f.xls_end, set_merge)
-                apply_range(ws, cur_row - 1, first_col + f.xls_start,
-                                cur_row - 1, first_col + f.xls_end, set_borders)
-
-            fields = [self._fields[fn] for fn in self._hierarchy if self._fields[fn].merging]
-            for f in fields:
-                if (f.changed) and (f.last_value_row is not None) and (f.last_value_row != cur_row - 1):
-                    apply_range(ws, f.last_value_row, first_col + f.xls_start,
-                                    cur_row - 1,      first_col + f.xls_end, set_merge)
-                    apply_range(ws, f.last_value_row, first_col + f.xls_start,
-                                    cur_row - 1,      first_col + f.xls_end, set_borders)
-                elif (f.changed) and (f.xls_end - f.xls_start != 0):
-                    apply_range(ws, cur_row - 1, first_col + f.xls_start,
-                                    cur_row - 1, first_col + f.xls_end, set_merge)
-                    apply_range(ws, cur_row - 1, first_col + f.xls_start,
-                                    cur_row - 1, first_col + f.xls_end, set_borders)
-
-        def _make_subtotals(cur_row):
-            """делаем подитоги
-            """
-            stlines = 0
-            # ordering sensitive
-            fields = [self._fields[fn] for fn in reversed(self._hierarchy) if self._fields[fn].subtotal and self._fields[fn].changed]
-            for fch in fields:
-                if (fch.last_value_row is not None) and (fch.last_value_row != cur_row - 1):
-                    _row, fchcol = cur_row + stlines, first_col + fch.xls_start
-
-                    ws.row_dimensions[_row].height = 18
-
-                    # если подитоги по невидимому столбцу, печатаем заголовок в первом столбце
-                    # TODO: refactor
-                    _label_col = fchcol if not fch.hidden else first_col
-                    if not fch.hidden and fch.xls_start != fch.xls_end:
-                        apply_range(ws, _row, first_col + fch.xls_start,
-                                        _row, first_col + fch.xls_end, set_merge)
-                    ws.cell(row=_row, column=_label_col).value = "Σ '{0:s}'".format(str(fch.last_value))
-                    apply_cell(ws, _row, _label_col, set_alignment)
-                    apply_cell(ws, _row, _label_col, set_font, bold=True)
-
-                    for st in fch.subtotal:
-                        f = self._fields[st]
-                        fcol1, fcol2 = first_col + f.xls_start, first_col + f.xls_end
-                        if (fcol1 - fcol2 > 1):
-                            apply_range(ws, _row, fcol1, _row, fcol2, set_merge)
-
-                        formulae = "=SUBTOTAL(9,{0:s}{1:d}:{0:s}{2:d})".format(
-                                get_column_letter(fcol1), fch.last_value_row, cur_row - 1)
-                        ws.cell(row=_row, column=fcol1).value = formulae
-                        apply_range(ws, _row, fcol1, _row, fcol2, set_merge)
-
-                        apply_range(ws, _row, fcol1, _row, fcol2, set_alignment, horizontal='right')
-                        apply_range(ws, _row, fcol1, _row, fcol2, set_format, format=f.format)
-                        apply_range(ws, _row, fcol1, _row, fcol2, set_borders)
-                        apply_range(ws, _row, fcol1, _row, fcol2, set_fill, color=Color.LT_GRAY.value)
-
-                    for i in range(fch.last_value_row - fch.subtitle_rowcount, cur_row + stlines):
-                        ws.row_dimensions[i].outlineLevel += 1
-                    stlines += 1
-
-            return cur_row + stlines
-
-        def _make_headers(cur_row, data_row):
-            # ordering sensitive
-            fields = [self._fields[fn] for fn in self._hierarchy if self._fields[fn].subtitle and self._fields[fn].changed]
-
-            #TODO: change base container type???
-            if fields:
-                data_dict_row = dict()
-                for fn, f in self._fields.items():
-                    data_dict_row[fn] = data_row[f.findex]
-
-                for fch in fields:
-                    cur_row = fch.subtitle(ws, data_dict_row, cur_row, first_col)
-
-            return cur_row
-
-        def _calculate_fields(data_row):
-            #TODO: change base container type???
-            if self._calculate_fn:
-                data_dict_row = dict()
-                for fn, f in self._fields.items():
-                    data_dict_row[fn] = data_row[f.findex]
-
-                if self._calculate_fn:
-                    self._calculate_fn(data_dict_row)
-
-                    for fn, f in data_dict_row.items():
-                        data_row[self._fields[fn].findex] = data_dict_row[fn]
-
-        def _coloring(cur_row, data_row):
-            #TODO: change base container type???
-            data_dict_row = dict()
-            for fn, f in self._fields.items():
-                data_dict_row[fn] = data_row[f.findex]
-
-            fields = [f for f in self._fields.values() if f.color_fn]
-            for f in fields:
-                col = f.color_fn(data_dict_row)
-                apply_range(ws, cur_row, first_col + f.xls_start,
-                                cur_row, first_col + f.xls_end,
-                                set_fill, color=col.value)
-
-            fields = [f for f in self._fields.values() if f.pattern_fn]
-            for f in fields:
-                (pattern, colbg, colfg) = f.pattern_fn(data_dict_row)
-                apply_range(ws, cur_row, first_col + f.xls_start,
-                                cur_row, first_col + f.xls_end,
-                                set_pattern_fill, bg_color=colbg.value, fg_color=colfg.value, pattern_type=pattern)
-
-        cur_row = first_row
-        data_row_number = 0
-        for data_row in self._data:
-            sys.stdout.write("\rИдёт форматирование таблицы {0:0=2d}%".format(data_row_number * 100 // self._row_count ))
-            sys.stdout.flush()
-
-            _calculate_fields(data_row)
-            _before_line_processing(data_row)
-            if cur_row > first_row:
-                _merge_previous_row(cur_row)
-            cur_row = _make_subtotals(cur_row)
-            cur_row = _make_headers(cur_row, data_row)
-            _coloring(cur_row, data_row)
-
-            ws.row_dimensions[cur_row].height = self._row_height
-
-            for fieldname, f in self._fields.items():
-                if f.hidden: continue
-
-                #  if (f.xls_end != f.xls_start):
-                #      apply_range(ws, cur_row, first_col + f.xls_start,
-                #                      cur_row, first_col + f.xls_end, set_merge)
-
-                # если печатаю числа, не выводить нулевые значения
-                if (f.format != 'empty'):
-                    if (f.format not in ['int', '1digit', 'currency', '3digit']) or (data_row[f.findex] != 0):
-                        ws.cell(row=cur_row, column=first_col + f.xls_start).value = data_row[f.findex]
-
-                # обновляем флаг hide_flag чтобы скрыть в конце неиспользуемые колонки
-                if (f.hide_condition is not None) and (not f.hide_condition(data_row[f.findex])):
-                    self._fields[fieldname].hide_flag = False
-
-            _after_line_processing(data_row, cur_row)
-
-            # apply format and alignment
-            for f in self._fields.values():
-                if f.hidden: continue
-
-                xlr = get_xlrange(cur_row, first_col + f.xls_start, cur_row, first_col + f.xls_end)
-                if f.format in ['int', 'currency', '1digit', '3digit']:
-                    apply_xlrange(ws, xlr, set_alignment, horizontal='right')
-                    apply_xlrange(ws, xlr, set_format, format=f.format)
-                elif f.format in ['date']:
-                    apply_xlrange(ws, xlr, set_alignment)
-                    apply_xlrange(ws, xlr, set_format, format=f.format)
-                else:
-                    apply_xlrange(ws, xlr, set_alignment)
-
-            # apply borders, outline, font
-            cr = get_xlrange(cur_row, first_col, cur_row, first_col + self._col_count - 1)
-            apply_xlrange(ws, cr, set_borders)
-            apply_xlrange(ws, cr, set_font)
-
-            cur_row += 1
-            data_row_number += 1
-
-        sys.stdout.write("\n")
-
-        _before_line_processing(None)
-        _merge_previous_row(cur_row)
-        cur_row = _make_subtotals(cur_row)
-
-        # скрываем все колонки, для которых не выполнились условия
-        fields = [[f.xls_start, f.xls_end] for f in self._fields.values() if f.hide_flag and not f.hidden]
-        for fstart, fend in fields:
-            for i in range(fstart, fend + 1):
-                ws.column_dimensions[get_column_letter(first_col + i)].hidden = True
-
-        # apply borders, outline, font
-        cr = get_xlrange(first_row, first_col, cur_row - 1, first_col + self._col_count - 1)
-        apply_xlrange(ws, cr, set_outline, border_style='medium')
-
+        instr = instrumentation if instrumentation is not None else default_instrumentation()
+        render = XLSTableRender(self, ws, first_row, first_col, instr, max_row, continuation, resume, appendable)
+        cur_row = render.render()
+        self.end_state = render.end_state
         return cur_row
@@ -1,9 +1,12 @@
 #!/usr/bin/python
 # -*- coding: utf-8 -*-
 
+from weakref import WeakKeyDictionary
+
 from .xlsutils import *
 from .xlsutils_apply import *
 from .xlscolor import *
+from .xlslayout import merge_ranges
 from openpyxl.utils import get_column_letter
 
 class XLSTableHeaderColumn:
@@ -30,8 +33,35 @@ class XLSTableHeaderColumn:
         return 1 + max([s.tree_height for s in self.struct], default=0)
 
 
+class XLSHeaderStamp:
+    """Шапка таблицы, откомпилированная для одной книги: высоты строк, объединения, значения и
+    индексы стилей ячеек относительно левого верхнего угла шапки. place() выводит ее в любое
+    место листа без обхода дерева столбцов и расчета стилей и рамок
+    """
+    def __init__(self, row_count, heights, merges, values, styles):
+        self.row_count = row_count
+        self.heights = heights    # высоты строк шапки по порядку
+        self.merges = merges      # (строка, колонка, последняя строка, последняя колонка) от угла
+        self.values = values      # (строка, колонка, значение)
+        self.styles = styles      # (строка, колонка, индексы стилей style_ids)
+
+    def place(self, ws, first_row, first_col):
+        for i, height in enumerate(self.heights):
+            ws.row_dimensions[first_row + i].height = height
+
+        merge_ranges(ws, [(first_row + r1, first_col + c1, first_row + r2, first_col + c2)
+                          for r1, c1, r2, c2 in self.merges])
+        for r, c, value in self.values:
+            ws.cell(row=first_row + r, column=first_col + c).value = value
+        for r, c, ids in self.styles:
+            cell_set_style(ws.cell(row=first_row + r, column=first_col + c), ids)
+
+        return first_row + self.row_count
+
 class XLSTableHeader:
-    """Класс, инкапсулирующий информацию и методы отображения шапки таблицы
+    """Класс, инкапсулирующий информацию и методы отображения шапки таблицы. При первом выводе
+    в книгу шапка компилируется в XLSHeaderStamp, который запоминается в объекте шапки, поэтому
+    шапку, выводимую много раз (например, в функции подзаголовка), лучше создать один раз
     """
     def __init__(self, columns, bgcolor=Color.LT_GRAY.value, row_height=32, first_row_height=50):
         self._columns = columns
@@ -41,58 +71,91 @@ class XLSTableHeader:
         self.row_count = max([cl.tree_height for cl in columns], default = 0)
         self.default_row_height = row_height
         self.first_row_height = row_height
-
-    def apply_widths(self, ws, first_col):
-        """Применяет информацию о ширине столбцов из заголовка таблицы непосредственно к листу
+        self._stamps = WeakKeyDictionary() # книга -> XLSHeaderStamp
+
+    def __getstate__(self):
+        # шапка передается в другие процессы (пул листов, пакетный вывод) без откомпилированных
+        # оттисков: они привязаны к книгам этого процесса
+        state = self.__dict__.copy()
+        del state['_stamps']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._stamps = WeakKeyDictionary()
+
+    def apply_widths(self, ws, first_col, auto_widths=None):
+        """Применяет информацию о ширине столбцов из заголовка таблицы непосредственно к листу.
+        auto_widths - ширины колонок {номер колонки от начала таблицы (с 0): ширина}, например
+        из XLSTable.column_widths(), для столбцов шапки без заданных widths
         """
         def _traverse_leaves_and_set_width(col, cur_col):
             if col.struct:
                 for icol in col.struct:
                     _traverse_leaves_and_set_width(icol, cur_col)
                     cur_col += icol.column_count
-            else:
+            elif col.widths:
                 for iwidth in col.widths:
                     ws.column_dimensions[get_column_letter(cur_col)].width = iwidth
                     cur_col += 1
+            elif auto_widths and (cur_col - first_col in auto_widths):
+                ws.column_dimensions[get_column_letter(cur_col)].width = auto_widths[cur_col - first_col]
 
         cur_col = first_col
         for col in self._columns:
             _traverse_leaves_and_set_width(col, cur_col)
             cur_col += col.column_count
 
-    def apply(self, ws, first_row, first_col):
-        """Отображает непосредственно в XLS шапку таблицы
+    def compile(self, wb):
+        """Шапка, откомпилированная для книги wb (XLSHeaderStamp), вычисляется один раз на книгу
         """
-        def _traverse_tree_and_print_title(colinfo, cur_col, cur_height):
-            start_row = first_row + cur_height
-            end_row = start_row if colinfo.tree_height > 1 else first_row + self.row_count - 1
-            end_col = cur_col + colinfo.column_count - 1
+        stamp = self._stamps.get(wb)
+        if stamp is None:
+            stamp = self._stamps[wb] = self._compile(wb)
+        return stamp
 
-            apply_range(ws, start_row, cur_col, end_row, end_col, set_merge)
-            ws.cell(row=start_row, column=cur_col).value = colinfo.title
+    def _compile(self, wb):
+        merges, values = [], []
+
+        def _traverse_tree(colinfo, cur_col, cur_height):
+            end_row = cur_height if colinfo.tree_height > 1 else self.row_count - 1
+            merges.append((cur_height, cur_col, end_row, cur_col + colinfo.column_count - 1))
+            values.append((cur_height, cur_col, colinfo.title))
 
             for coli in colinfo.struct:
-                _traverse_tree_and_print_title(coli, cur_col, cur_height + 1)
+                _traverse_tree(coli, cur_col, cur_height + 1)
                 cur_col += coli.column_count
 
-
-        if self.row_count == 1:
-            ws.row_dimensions[first_row].height = self.first_row_height
-        else:
-            for i in range(0, self.row_count):
-                ws.row_dimensions[first_row + i].height = self.default_row_height
-
-        cur_col = first_col
+        cur_col = 0
         for colinfo in self._columns:
-            _traverse_tree_and_print_title(colinfo, cur_col, 0)
+            _traverse_tree(colinfo, cur_col, 0)
             cur_col += colinfo.column_count
 
-        clr = get_xlrange(first_row, first_col,
-                          first_row + self.row_count - 1, cur_col - 1)
-        apply_xlrange(ws, clr, set_borders)
-        apply_xlrange(ws, clr, set_outline, border_style='medium')
-        apply_xlrange(ws, clr, set_font, bold=True)
-        apply_xlrange(ws, clr, set_alignment)
-        apply_xlrange(ws, clr, set_fill, color=self._bgcolor)
+        if self.row_count == 1:
+            heights = [self.first_row_height]
+        else:
+            heights = [self.default_row_height] * self.row_count
+
+        # стиль всех ячеек, как set_style, и рамка по краям шапки, как set_outline
+        ids = dict(style_ids(wb, border=style_border(), font=style_font(bold=True),
+                             alignment=style_alignment(), fill=style_fill(color=self._bgcolor)))
+        border_pos = 2 # позиция индекса рамки в StyleArray
+        last_row, last_col = self.row_count - 1, self.column_count - 1
+        styles = []
+        for r in range(self.row_count):
+            for c in range(self.column_count):
+                border_id = ids[border_pos]
+                for side_name, edge in (('left', c == 0), ('right', c == last_col),
+                                        ('top', r == 0), ('bottom', r == last_row)):
+                    if edge:
+                        border_id = outline_border_id(wb, border_id, side_name, 'medium')
+                cell_ids = dict(ids)
+                cell_ids[border_pos] = border_id
+                styles.append((r, c, tuple(sorted(cell_ids.items()))))
+
+        return XLSHeaderStamp(self.row_count, heights, merges, values, styles)
 
-        return first_row + self.row_count
+    def apply(self, ws, first_row, first_col):
+        """Отображает непосредственно в XLS шапку таблицы
+        """
+        return self.compile(ws.parent).place(ws, first_row, first_col)
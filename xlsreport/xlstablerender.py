@@ -0,0 +1,763 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Вывод таблицы XLSTable на лист (XLSTable.apply): состояние одного вывода и этапы вывода строки,
+суммы подитогов и общего итога, перенос на листы продолжения, продолжение прошлого вывода
+при дозаписи
+"""
+
+import itertools
+
+from openpyxl.utils import get_column_letter
+from openpyxl.utils.units import DEFAULT_COLUMN_WIDTH
+from .xlsutils_apply import *
+from .xlscolor import *
+from .xlsstream import *
+from .xlsformula import *
+from .xlslayout import *
+from .xlsrow import *
+from .xlsstyle import outline_border_id
+
+ROW_CHUNK_SIZE = 1024 # строк в порции для пакетных функций расчета и раскраски
+
+def memoized(fn, depends_on):
+    """Результат fn(row) запоминается по значениям полей depends_on, от которых он зависит.
+    Результаты хранятся, пока жива возвращаемая функция: XLSTableRender создает ее на каждый вывод
+    таблицы, и повторный вывод не получает результатов, рассчитанных по прошлым данным
+    """
+    if depends_on is None:
+        return fn
+
+    cache = dict()
+    def _fn(row):
+        key = tuple([row[fname] for fname in depends_on])
+        try:
+            return cache[key]
+        except KeyError:
+            result = cache[key] = fn(row)
+            return result
+        except TypeError: # значения полей не хешируются
+            return fn(row)
+    return _fn
+
+class XLSTableTotals:
+    """Суммы подитогов открытых групп (по индексу поля иерархии) и общего итога таблицы
+    """
+    def __init__(self, table):
+        self._fields = table._fields
+        self._hierarchy = table._hierarchy
+        self.group_sums = dict()
+        self.grand_sums = dict.fromkeys(table._grand_total or (), 0)
+        self._total_sums = [self.grand_sums]
+        for fn in self._hierarchy:
+            f = self._fields[fn]
+            if f.subtotal:
+                self.group_sums[f.findex] = dict.fromkeys(f.subtotal, 0)
+                self._total_sums.append(self.group_sums[f.findex])
+        self._index()
+
+    def _index(self):
+        total_fields = set(self.grand_sums).union(*self._total_sums)
+        self._total_indexes = [(fname, self._fields[fname].findex) for fname in total_fields]
+
+    def resume(self, state):
+        """(дозапись) суммы открытых групп и общего итога из состояния прошлого вывода
+        """
+        for fn, sums in state['group_sums'].items():
+            self.group_sums[self._fields[fn].findex].update(sums)
+        self.grand_sums.update(state['grand_sums'])
+        self._index()
+
+    def accumulate(self, data_row):
+        """добавляем значения строки к подитогам открытых групп и общему итогу
+        """
+        for sums in self._total_sums:
+            for fname, findex in self._total_indexes:
+                value = data_row[findex]
+                if (fname in sums) and is_number(value):
+                    sums[fname] += value
+
+    def reset(self, f):
+        """значения подитогов начинающейся группы поля f считаются заново
+        """
+        sums = self.group_sums[f.findex]
+        for fname in sums:
+            sums[fname] = 0
+
+    def state(self):
+        """(group_sums по именам полей иерархии, grand_sums) для XLSTable.end_state
+        """
+        group_sums = {fn: dict(self.group_sums[self._fields[fn].findex])
+                      for fn in self._hierarchy if self._fields[fn].subtotal}
+        return group_sums, dict(self.grand_sums)
+
+class XLSTableSplit:
+    """Перенос таблицы на листы продолжения перед группой первого уровня иерархии, а если группа
+    не помещается и на пустой лист - перед ее подгруппой
+    """
+    def __init__(self, render):
+        self._render = render
+        self._fields = render.fields
+        self._hierarchy = render.hierarchy
+        self._key_indexes = [self._fields[fn].findex for fn in self._hierarchy]
+        self._reserve = 1 if render.table._grand_total else 0
+        # уровень иерархии, с которого разрешен перенос (больше 0 внутри группы первого уровня,
+        # не поместившейся на пустой лист); строки, продолжающие открытые группы, переносятся
+        # на лист продолжения по одной
+        self._level = 0 if render.resume_key is None else len(self._key_indexes)
+
+    def rows(self, items):
+        """строки данных items (из XLSTableRender.chunked_rows) вместе с уровнем иерархии,
+        на котором со строки начинается новая группа (len(key_indexes) - не начинается),
+        буфером группы первого уровня, в которую входит строка, и номером строки в буфере
+        """
+        group = []
+        prev_key = self._render.resume_key
+        for item in items:
+            key = [item[0][i] for i in self._key_indexes]
+            level = 0
+            if group:
+                prev_key = group[-1][1]
+            if prev_key is not None:
+                while (level < len(key)) and (key[level] == prev_key[level]):
+                    level += 1
+            if (level == 0) and group:
+                for index, (group_item, _, group_level) in enumerate(group):
+                    yield group_item, group_level, group, index
+                group = []
+            group.append((item, key, level))
+        for index, (group_item, _, group_level) in enumerate(group):
+            yield group_item, group_level, group, index
+
+    def _group_bound(self, group, start, level):
+        """сколько строк листа займет группа уровня level, начинающаяся со строки start буфера
+        группы: строки данных, подитоги и подзаголовки ее подгрупп (подитог - с запасом, даже
+        для группы из одной строки), подитоги внешних групп, закрываемых в конце листа
+        """
+        subtitle_rows = self._render.subtitle_rows
+        extra = [(1 if self._fields[fn].subtotal else 0) +
+                 (subtitle_rows[self._fields[fn].findex] if self._fields[fn].subtitle else 0)
+                 for fn in self._hierarchy]
+        rows = sum(1 for fn in self._hierarchy[:level] if self._fields[fn].subtotal)
+        for j in range(start, len(group)):
+            change = group[j][2] if j > start else level
+            if (j > start) and (change <= level):
+                break
+            rows += 1 + sum(extra[change:])
+        return rows
+
+    def check(self, cur_row, level, group, index):
+        """переносим таблицу на лист продолжения, если группа, начинающаяся со строки, не помещается
+        на текущий лист; возвращает строку, в которую выводится строка данных
+        """
+        render = self._render
+        if level == 0:
+            self._level = 0
+        if level <= self._level:
+            need = self._group_bound(group, index, level) + self._reserve
+            if (cur_row > render.first_row) and (cur_row + need - 1 > render.max_row):
+                cur_row = render.next_sheet(cur_row)
+            if cur_row + need - 1 > render.max_row:
+                self._level = level + 1
+        return cur_row
+
+class XLSTableRender:
+    """Один вывод таблицы на лист: текущий лист и его раскладка, открытые группы иерархии, суммы
+    итогов и листы продолжения. Этапы вывода строки при включенном замере времени заменяются
+    в объекте обертками с замером (XLSInstrumentation.timed)
+    """
+    def __init__(self, table, ws, first_row, first_col, instrumentation, max_row, continuation=None,
+                 resume=None, appendable=False):
+        self.table = table
+        self.fields = table._fields
+        self.hierarchy = table._hierarchy
+        self.ws = ws
+        self.first_row = first_row
+        self.first_col = first_col
+        self.last_col = first_col + table._col_count - 1
+        self.max_row = max_row
+        self.continuation = continuation
+        self.resume = resume
+        self.appendable = appendable or (resume is not None)
+        self.instr = instrumentation
+        self.streaming = isinstance(ws, XLSStreamSheet)
+        self.layout = XLSLayout()
+        self.sheets = [ws]
+        self.field_names = {f.findex: fn for fn, f in self.fields.items()}
+        self.subtitle_rows = {f.findex: max(f.subtitle_rowcount, 1) for f in self.fields.values()}
+        self.totals = XLSTableTotals(table)
+
+        # поля этапов вывода строки в порядке обработки
+        hierarchy = [self.fields[fn] for fn in self.hierarchy]
+        self._wide_fields = [f for f in self.fields.values() if (not f.merging) and (f.xls_end - f.xls_start != 0)]
+        self._merging_fields = [f for f in hierarchy if f.merging]
+        self._subtotal_fields = [f for f in reversed(hierarchy) if f.subtotal]
+        self._subtitle_fields = [f for f in hierarchy if f.subtitle]
+
+        # дозапись: строки прошлого вывода таблицы до data_start остаются на листе, открытые группы
+        # и суммы их подитогов продолжаются; outlined - группы, строки которых уже сгруппированы
+        # на листе (индекс поля иерархии -> первая строка группы)
+        self.data_start = first_row
+        self.outlined = dict()
+        self.remerged = []
+        self.resume_key = None
+        self.resume_hidden = None
+        self.total_ranges = []
+
+        self._init_callbacks()
+
+    def _init_callbacks(self):
+        """пользовательские функции и этапы вывода строки (при включенном замере времени - с замером каждой)
+        """
+        timed = self.instr.timed
+        fields = self.fields.items()
+        self.field_index = {fn: f.findex for fn, f in fields}
+        self.calculate_fn = timed('calculation', self.table._calculate_fn)
+        self.calculate_batch_fn = timed('calculation', self.table._calculate_batch_fn)
+        self.color_fns = [(f, timed('callback:color:' + fn, memoized(f.color_fn, f.color_depends)))
+                          for fn, f in fields if f.color_fn]
+        self.pattern_fns = [(f, timed('callback:pattern:' + fn, memoized(f.pattern_fn, f.pattern_depends)))
+                            for fn, f in fields if f.pattern_fn]
+        self.color_batch_fns = [(f, timed('callback:color_batch:' + fn, f.color_batch_fn))
+                                for fn, f in fields if f.color_batch_fn]
+        self.pattern_batch_fns = [(f, timed('callback:pattern_batch:' + fn, f.pattern_batch_fn))
+                                  for fn, f in fields if f.pattern_batch_fn]
+        self.subtitle_fns = {f.findex: timed('callback:subtitle:' + fn, f.subtitle) for fn, f in fields if f.subtitle}
+
+        self.before_line = timed('change_detection', self.before_line)
+        self.after_line = timed('change_detection', self.after_line)
+        self.merge_previous_row = timed('merges', self.merge_previous_row)
+        self.make_subtotals = timed('subtotals', self.make_subtotals)
+        self.accumulate_totals = timed('subtotals', self.totals.accumulate)
+        self.make_headers = timed('subtitles', self.make_headers)
+        self.coloring = timed('coloring', self.coloring)
+        self.flush_rows = timed('flush', self.flush_rows)
+        if self.instr.timing:
+            # значения и стили в режиме замера пишутся отдельными проходами по строке
+            self.write_values = timed('values', self.write_values)
+            self.write_styles = timed('styles', self.write_styles)
+            self.check_hide_conditions = timed('callback:hide', self.check_hide_conditions)
+            self.render_row = self._render_row_timed
+
+    def render(self):
+        """Выводит строки данных таблицы; возвращает следующую строку последнего листа.
+        Состояние для дозаписи - в end_state
+        """
+        if self.resume is not None:
+            self._resume(self.resume)
+        self._prepare_hide_conditions()
+        self.row_plan = self.table.compile_row_plan(self.ws.parent, self.first_col, self.pruned)
+
+        if self.continuation is not None:
+            split = XLSTableSplit(self)
+            rows = split.rows(self.chunked_rows())
+        else:
+            split = None
+            rows = ((item, None, None, None) for item in self.chunked_rows())
+
+        cur_row = self.data_start
+        data_row_number = 0
+        progress = self.instr.progress('table', self.table._row_count)
+        for (data_row, row_view, batch_colors, batch_patterns), level, group, index in rows:
+            progress.update(data_row_number)
+
+            if level is not None:
+                cur_row = split.check(cur_row, level, group, index)
+
+            if self.calculate_fn:
+                self.calculate_fn(row_view)
+            self.before_line(data_row)
+            if cur_row > self.first_row:
+                self.merge_previous_row(cur_row)
+            cur_row = self.make_subtotals(cur_row)
+            cur_row = self.make_headers(cur_row, row_view)
+            self.coloring(cur_row, row_view, batch_colors, batch_patterns)
+
+            self.layout.height(cur_row, self.table._row_height)
+            assert cur_row <= self.max_row, \
+                    "таблица не помещается на лист до строки {0:d}, нужен лист продолжения".format(self.max_row)
+
+            self.render_row(cur_row, data_row)
+            self.accumulate_totals(data_row)
+            self.after_line(data_row, cur_row)
+
+            cur_row += 1
+            data_row_number += 1
+
+            if self.streaming:
+                self.flush_rows(self.stable_row(cur_row))
+
+        progress.finish(data_row_number)
+
+        self.end_state = self._end_state(cur_row, data_row_number)
+        cur_row = self.finish_sheet(cur_row, last=True)
+        self.end_state['next_row'] = cur_row
+        if not self.streaming:
+            for sheet in self.sheets:
+                self.hide_columns(sheet)
+        if self.resume_hidden is not None:
+            self._show_resumed_columns()
+        return cur_row
+
+    # --- изменения значений полей иерархии
+
+    def before_line(self, row):
+        """ставим флаг changed если значение поля в структуре hierarchy поменяло свое значение
+        """
+        was_changed = False
+        # ordering sensitive
+        for fieldname in self.hierarchy:
+            f = self.fields[fieldname]
+            if (row is None) or (row[f.findex] != f.last_value):
+                was_changed = True
+            if was_changed:
+                f.changed = True
+
+    def after_line(self, row, cur_row):
+        """сохраняем инфо о последних значениях для всех полей в структуре hierarchy
+        """
+        for fieldname in self.hierarchy:
+            f = self.fields[fieldname]
+            if not f.changed: continue
+            f.last_value = row[f.findex] if row else None
+            f.last_value_row = cur_row
+            f.changed = False
+
+    # --- объединения, подитоги, общий итог и подзаголовки
+
+    def merge_previous_row(self, cur_row):
+        """объединяем ячейки с одинаковыми значениями, и те, что шириной более 1 столбца
+        """
+        layout, first_col = self.layout, self.first_col
+        # ячейки полей шириной более 1 столбца; строка, выведенная прошлым выводом таблицы, уже объединена
+        if cur_row > self.data_start:
+            for f in self._wide_fields:
+                layout.merge(cur_row - 1, first_col + f.xls_start,
+                             cur_row - 1, first_col + f.xls_end, border_style='thin')
+
+        # ячейки закончившейся группы поля иерархии с объединением
+        for f in self._merging_fields:
+            if not f.changed: continue
+            if (f.last_value_row is not None) and (f.last_value_row != cur_row - 1):
+                layout.merge(f.last_value_row, first_col + f.xls_start,
+                             cur_row - 1,      first_col + f.xls_end, border_style='thin')
+            elif f.xls_end - f.xls_start != 0:
+                layout.merge(cur_row - 1, first_col + f.xls_start,
+                             cur_row - 1, first_col + f.xls_end, border_style='thin')
+
+    def make_subtotals(self, cur_row):
+        """делаем подитоги
+        """
+        stlines = 0
+        # ordering sensitive
+        fields = [f for f in self._subtotal_fields if f.changed]
+        for fch in fields:
+            if (fch.last_value_row is not None) and (fch.last_value_row != cur_row - 1):
+                self._subtotal_row(cur_row + stlines, fch, cur_row - 1)
+                stlines += 1
+
+        for fch in fields:
+            self.totals.reset(fch)
+
+        return cur_row + stlines
+
+    def _subtotal_row(self, _row, fch, last_row):
+        """строка _row подитога закончившейся на строке last_row группы поля fch
+        """
+        ws, layout, first_col = self.ws, self.layout, self.first_col
+        layout.height(_row, 18)
+
+        # если подитоги по невидимому столбцу, печатаем заголовок в первом столбце
+        if fch.hidden:
+            _label_col = first_col
+        else:
+            _label_col = first_col + fch.xls_start
+            if fch.xls_start != fch.xls_end:
+                layout.merge(_row, first_col + fch.xls_start, _row, first_col + fch.xls_end)
+        ws.cell(row=_row, column=_label_col).value = "Σ '{0:s}'".format(str(fch.last_value))
+        apply_cell(ws, _row, _label_col, set_alignment)
+        apply_cell(ws, _row, _label_col, set_font, bold=True)
+
+        sums = self.totals.group_sums[fch.findex]
+        for st in fch.subtotal:
+            self.total_cell(_row, self.fields[st], [(None, fch.last_value_row, last_row)], sums[st])
+
+        # строки группы, сгруппированные прошлым выводом таблицы, уже на своем уровне
+        outline_row = fch.last_value_row - fch.subtitle_rowcount
+        if self.outlined.get(fch.findex) == fch.last_value_row:
+            outline_row = self.data_start
+        layout.outline(outline_row, _row - 1)
+
+    def total_cell(self, _row, f, ranges, value):
+        """ячейка подитога (общего итога) по полю f для строк данных ranges: [(лист, from_row, to_row)],
+        где лист None - текущий лист
+        """
+        ws, subtotal_mode = self.ws, self.table._subtotal_mode
+        fcol1, fcol2 = self.first_col + f.xls_start, self.first_col + f.xls_end
+        letter = get_column_letter(fcol1)
+        formulae = "=SUBTOTAL(9,{0:s})".format(",".join(
+                "{0:s}{1:s}{2:d}:{1:s}{3:d}".format(
+                    "" if title is None else "'{0:s}'!".format(title.replace("'", "''")),
+                    letter, from_row, to_row)
+                for title, from_row, to_row in ranges))
+        cl = ws.cell(row=_row, column=fcol1)
+        # функция Excel принимает не больше 255 аргументов, а формула - не длиннее 8192 символов:
+        # общий итог по большему числу листов выводится только значением
+        if (subtotal_mode == 'static') or (len(ranges) > 254) or (len(formulae) > 8192):
+            cl.value = value
+        elif subtotal_mode == 'formula':
+            cl.value = formulae
+        else:
+            set_formula(cl, formulae, value)
+        self.layout.merge(_row, fcol1, _row, fcol2)
+
+        apply_range(ws, _row, fcol1, _row, fcol2, set_style,
+                    alignment=style_alignment(horizontal='right'),
+                    number_format=style_number_format(f.format),
+                    border=style_border(), fill=style_fill(color=Color.LT_GRAY.value))
+
+    def make_grand_total(self, cur_row):
+        """строка общего итога по всем строкам данных таблицы
+        """
+        table, ws, first_col = self.table, self.ws, self.first_col
+        if not table._grand_total or (cur_row == self.first_row):
+            return cur_row
+
+        self.layout.height(cur_row, 18)
+        ws.cell(row=cur_row, column=first_col).value = table._grand_total_label
+        apply_cell(ws, cur_row, first_col, set_alignment)
+        apply_cell(ws, cur_row, first_col, set_font, bold=True)
+        ranges = self.total_ranges + [(None, self.first_row, cur_row - 1)]
+        for fname in table._grand_total:
+            f = self.fields[fname]
+            self.total_cell(cur_row, f, ranges, self.totals.grand_sums[fname])
+            apply_range(ws, cur_row, first_col + f.xls_start,
+                            cur_row, first_col + f.xls_end, set_font, bold=True)
+        return cur_row + 1
+
+    def make_headers(self, cur_row, row_view):
+        # ordering sensitive
+        for fch in self._subtitle_fields:
+            if not fch.changed: continue
+            next_row = self.subtitle_fns[fch.findex](self.ws, row_view, cur_row, self.first_col)
+            self.subtitle_rows[fch.findex] = max(self.subtitle_rows[fch.findex], next_row - cur_row)
+            cur_row = next_row
+
+        return cur_row
+
+    # --- строки данных, раскраска и скрытие колонок
+
+    def chunked_rows(self):
+        """строки данных порциями по ROW_CHUNK_SIZE: пакетные функции расчета и раскраски
+        вызываются один раз на порцию, для каждой строки возвращаются (строка, XLSRowView,
+        заливки от пакетных функций [(поле, цвет)], узоры от пакетных функций [(поле, узор)])
+        """
+        rows = iter(self.table._data)
+        while True:
+            chunk = list(itertools.islice(rows, ROW_CHUNK_SIZE))
+            if not chunk:
+                break
+
+            row_chunk = XLSRowChunk(self.field_index, chunk)
+            if self.calculate_batch_fn:
+                self.calculate_batch_fn(row_chunk)
+            colors = [(f, fn(row_chunk)) for f, fn in self.color_batch_fns]
+            patterns = [(f, fn(row_chunk)) for f, fn in self.pattern_batch_fns]
+
+            for i, (data_row, row_view) in enumerate(zip(chunk, row_chunk.views)):
+                yield (data_row, row_view,
+                       [(f, res[i]) for f, res in colors], [(f, res[i]) for f, res in patterns])
+
+    def coloring(self, cur_row, row_view, batch_colors, batch_patterns):
+        ws, first_col = self.ws, self.first_col
+        colors = [(f, fn(row_view)) for f, fn in self.color_fns] + batch_colors
+        for f, col in colors:
+            apply_range(ws, cur_row, first_col + f.xls_start,
+                            cur_row, first_col + f.xls_end,
+                            set_fill, color=col.value)
+
+        patterns = [(f, fn(row_view)) for f, fn in self.pattern_fns] + batch_patterns
+        for f, (pattern, colbg, colfg) in patterns:
+            apply_range(ws, cur_row, first_col + f.xls_start,
+                            cur_row, first_col + f.xls_end,
+                            set_pattern_fill, bg_color=colbg.value, fg_color=colfg.value, pattern_type=pattern)
+
+    def render_row(self, cur_row, data_row):
+        """выводим значения и итоговые стили всех ячеек строки за один проход
+        """
+        ws = self.ws
+        for col, findex, skip_zero, sa, ids in self.row_plan:
+            cl = ws.cell(row=cur_row, column=col)
+
+            # если печатаю числа, не выводить нулевые значения
+            if findex is not None:
+                value = data_row[findex]
+                if not skip_zero or value != 0:
+                    cl.value = value
+
+            if sa is None:
+                continue
+            old_sa = cl._style
+            if (old_sa is None) or (not any(old_sa)):
+                cl._style = copy(sa)
+            else:
+                for pos, idx in ids:
+                    old_sa[pos] = idx
+
+        self.check_hide_conditions(data_row)
+
+    def _render_row_timed(self, cur_row, data_row):
+        """(замер времени) значения, стили и условия скрытия строки отдельными этапами
+        """
+        self.write_values(cur_row, data_row)
+        self.write_styles(cur_row)
+        self.check_hide_conditions(data_row)
+
+    def write_values(self, cur_row, data_row):
+        """(замер времени) только значения ячеек строки
+        """
+        ws = self.ws
+        for col, findex, skip_zero, sa, ids in self.row_plan:
+            if findex is not None:
+                value = data_row[findex]
+                if not skip_zero or value != 0:
+                    ws.cell(row=cur_row, column=col).value = value
+
+    def write_styles(self, cur_row):
+        """(замер времени) только стили ячеек строки
+        """
+        ws = self.ws
+        for col, findex, skip_zero, sa, ids in self.row_plan:
+            if sa is None:
+                continue
+            cl = ws.cell(row=cur_row, column=col)
+            old_sa = cl._style
+            if (old_sa is None) or (not any(old_sa)):
+                cl._style = copy(sa)
+            else:
+                for pos, idx in ids:
+                    old_sa[pos] = idx
+
+    def _prepare_hide_conditions(self):
+        """условия скрытия проверяются до вывода данных, и скрываемые колонки выводятся без стилей.
+        Функции расчета могут изменить значения при выводе, а итератор строк пришлось бы прочитать
+        в список, поэтому с ними условия проверяются по ходу вывода, а колонки скрываются в конце.
+        В режиме streaming колонки записываются на лист вместе с первой строкой, и условия всегда
+        проверяются заранее (строки итератора читаются в список)
+        """
+        table = self.table
+        hide_fields = [f for f in self.fields.values() if (f.hide_condition is not None) and not f.hidden]
+        self.pruned = set()
+        self.pre_resolved = bool(hide_fields) and \
+            (self.streaming or ((table._row_count is not None) and not (table._calculate_fn or table._calculate_batch_fn)))
+        if self.pre_resolved:
+            with self.instr.phase('hide_conditions'):
+                table._resolve_hide_conditions(hide_fields)
+            if self.resume_hidden is not None:
+                for f in hide_fields:
+                    f.hide_flag = f.hide_flag and (self.field_names[f.findex] in self.resume_hidden)
+            self.hide_columns()
+            if not self.appendable:
+                self.pruned = {f.findex for f in hide_fields if f.hide_flag}
+            hide_fields = []
+        for f in hide_fields:
+            f.hide_flag = (self.resume_hidden is None) or (self.field_names[f.findex] in self.resume_hidden)
+        self.hide_fns = [(f, f.hide_condition) for f in hide_fields]
+
+    def check_hide_conditions(self, data_row):
+        """обновляем флаг hide_flag чтобы скрыть в конце неиспользуемые колонки
+        """
+        for f, cond in self.hide_fns:
+            if f.hide_flag and not cond(data_row[f.findex]):
+                f.hide_flag = False
+
+    def hide_columns(self, sheet=None):
+        """скрываем все колонки, для которых выполнились условия
+        """
+        sheet = self.ws if sheet is None else sheet
+        fields = [[f.xls_start, f.xls_end] for f in self.fields.values() if f.hide_flag and not f.hidden]
+        for fstart, fend in fields:
+            for i in range(fstart, fend + 1):
+                sheet.column_dimensions[get_column_letter(self.first_col + i)].hidden = True
+
+    # --- оформление листа и листы продолжения
+
+    def finish_sheet(self, cur_row, last):
+        """закрываем открытые группы и оформляем часть таблицы на текущем листе
+        """
+        ws, first_row, first_col, last_col = self.ws, self.first_row, self.first_col, self.last_col
+        self.before_line(None)
+        if cur_row > first_row:
+            self.merge_previous_row(cur_row)
+        cur_row = self.make_subtotals(cur_row)
+        if last:
+            cur_row = self.make_grand_total(cur_row)
+
+        if self.streaming:
+            self.flush_rows(cur_row, last=True)
+        else:
+            with self.instr.phase('layout'):
+                self.layout.apply(ws)
+
+            # apply borders, outline, font
+            if cur_row == first_row:
+                pass # пустая таблица
+            elif self.data_start == first_row:
+                cr = get_xlrange(first_row, first_col, cur_row - 1, last_col)
+                apply_xlrange(ws, cr, set_outline, border_style='medium')
+            else:
+                # рамка дописанных строк и строк открытых групп, объединенных заново
+                border_row = min([self.data_start] + self.remerged)
+                sides = ('left', 'right', 'bottom') + (('top',) if border_row == first_row else ())
+                if cur_row > border_row:
+                    apply_range(ws, border_row, first_col, cur_row - 1, last_col,
+                                set_outline, border_style='medium', sides=sides)
+                else:
+                    apply_range(ws, cur_row - 1, first_col, cur_row - 1, last_col,
+                                set_outline, border_style='medium', sides=('bottom',))
+        return cur_row
+
+    def next_sheet(self, cur_row):
+        """переносим таблицу на лист продолжения
+        """
+        cur_row = self.finish_sheet(cur_row, last=False)
+        self.total_ranges.append((self.ws.title, self.first_row, cur_row - 1))
+
+        self.ws, self.first_row = self.continuation()
+        self.data_start = self.first_row
+        self.outlined.clear()
+        self.remerged.clear()
+        self.sheets.append(self.ws)
+        self.layout = XLSLayout()
+        for fn in self.hierarchy:
+            self.fields[fn].last_value_row = None
+        if self.pre_resolved:
+            self.hide_columns()
+        return self.first_row
+
+    def stable_row(self, cur_row):
+        """первая строка, которую еще могут изменить объединения и подитоги открытых групп
+        """
+        rows = [f.last_value_row - f.subtitle_rowcount
+                for f in (self.fields[fn] for fn in self.hierarchy)
+                if (f.merging or f.subtotal) and (f.last_value_row is not None)]
+        return min(rows + [cur_row - 1])
+
+    def flush_rows(self, upto_row, last=False):
+        """(streaming) рисуем внешнюю границу таблицы на готовых строках и записываем их на лист
+        """
+        ws, first_row = self.ws, self.first_row
+        self.layout.apply(ws, upto_row)
+        start_row = max(ws.flushed_row, first_row)
+        if upto_row > start_row:
+            sides = ('left', 'right')
+            if start_row == first_row: sides += ('top',)
+            if last: sides += ('bottom',)
+            apply_range(ws, start_row, self.first_col, upto_row - 1, self.last_col,
+                        set_outline, border_style='medium', sides=sides)
+        ws.flush(upto_row)
+
+    # --- дозапись
+
+    def _resume(self, state):
+        """продолжаем прошлый вывод таблицы по его состоянию state (XLSTable.end_state)
+        """
+        assert not self.streaming, "дозапись таблицы возможна только в книгу, открытую в памяти"
+        self.data_start = data_start = self._strip_tail(state)
+        for fn, value, value_row in state['open']:
+            f = self.fields[fn]
+            f.last_value, f.last_value_row, f.changed = value, value_row, False
+            if f.subtotal and (value_row is not None) and (value_row != data_start - 1):
+                self.outlined[f.findex] = value_row
+            if f.merging and (value_row is not None):
+                self.remerged.append(value_row)
+        self.totals.resume(state)
+        if data_start > self.first_row:
+            self.resume_key = [value for _, value, _ in state['open']]
+        self.resume_hidden = set(state['hidden'])
+        self.total_ranges = [tuple(r) for r in state['total_ranges']]
+
+    def _strip_tail(self, state):
+        """(дозапись) убирает с листа то, что выводится заново: строки подитогов открытых групп и
+        общего итога в конце таблицы, объединения открытых групп и внешнюю рамку под последней
+        строкой. Возвращает строку, с которой продолжается вывод
+        """
+        ws, first_col, last_col = self.ws, self.first_col, self.last_col
+        data_end, next_row = state['data_end'], state['next_row']
+        assert (ws.max_row < next_row) or \
+               all(cl.value is None for (r, _), cl in ws._cells.items() if r >= next_row), \
+                "после таблицы на листе '{0:s}' есть другие строки, дозапись невозможна".format(ws.title)
+
+        anchors = {(value_row, first_col + self.fields[fn].xls_start)
+                   for fn, _, value_row in state['open']
+                   if self.fields[fn].merging and (value_row is not None)}
+        merged = ws.merged_cells.ranges
+        stale = [m for m in merged
+                 if (m.min_row >= data_end) or
+                    ((m.min_row, m.min_col) in anchors and (m.max_row == data_end - 1))]
+        for m in stale:
+            merged.remove(m)
+
+        for r in range(data_end, next_row):
+            for c in range(first_col, last_col + 1):
+                ws._cells.pop((r, c), None)
+            ws.row_dimensions.pop(r, None)
+
+        # без итогов внешняя рамка таблицы - нижняя граница последней строки данных: у ячеек
+        # строки данных остается тонкая граница, у ячеек без стиля (скрытые колонки) - никакой
+        if (next_row == data_end) and (data_end > state['first_row']):
+            wb = ws.parent
+            for c in range(first_col, last_col + 1):
+                cl = ws._cells.get((data_end - 1, c))
+                if (cl is None) or (not cl.has_style):
+                    continue
+                border = wb._borders[cl._style.borderId]
+                thin = any((side is not None) and (side.style == 'thin')
+                           for side in (border.left, border.right, border.top))
+                cl._style.borderId = outline_border_id(wb, cl._style.borderId, 'bottom',
+                                                       'thin' if thin else None)
+        return data_end
+
+    def _end_state(self, cur_row, data_row_number):
+        """состояние таблицы для дозаписи (XLSTable.end_state) без next_row
+        """
+        # первая строка, которую изменит дозапись: строки открытых групп, которые объединяются
+        # заново или впервые получат уровень группировки (с подзаголовками), и последняя строка данных
+        edit_rows = [cur_row - 1 if cur_row > self.first_row else self.first_row]
+        for fn in self.hierarchy:
+            f = self.fields[fn]
+            if f.last_value_row is None: continue
+            if f.merging:
+                edit_rows.append(f.last_value_row)
+            if f.subtotal and (f.last_value_row == cur_row - 1):
+                edit_rows.append(f.last_value_row - f.subtitle_rowcount)
+
+        group_sums, grand_sums = self.totals.state()
+        return dict(
+                sheet=self.ws.title, first_row=self.first_row, first_col=self.first_col, data_end=cur_row,
+                edit_row=min(edit_rows),
+                open=[(fn, self.fields[fn].last_value, self.fields[fn].last_value_row)
+                      for fn in self.hierarchy],
+                group_sums=group_sums, grand_sums=grand_sums, total_ranges=list(self.total_ranges),
+                hidden=[fn for fn, f in self.fields.items()
+                        if (f.hide_condition is not None) and not f.hidden and f.hide_flag],
+                rows=data_row_number + (self.resume['rows'] if self.resume is not None else 0))
+
+    def _show_resumed_columns(self):
+        """(дозапись) показывает колонки, скрытые прошлым выводом таблицы, если дописанные строки
+        не выполнили условие скрытия (таблица, выводимая для дозаписи, выводит скрываемые колонки
+        со стилями). Листы таблицы из прошлых выводов - в диапазонах общего итога
+        """
+        wb = self.ws.parent
+        sheets = [wb[title] for title, _, _ in self.total_ranges if wb[title] not in self.sheets] + self.sheets
+        fields = [f for f in self.fields.values()
+                  if (self.field_names[f.findex] in self.resume_hidden) and not f.hide_flag]
+        for f in fields:
+            for col in range(self.first_col + f.xls_start, self.first_col + f.xls_end + 1):
+                letter = get_column_letter(col)
+                for sheet in sheets:
+                    dim = sheet.column_dimensions[letter]
+                    dim.hidden = False
+                    # размер, созданный только для скрытия, не оставляет колонке ширину openpyxl
+                    if (dim.width == DEFAULT_COLUMN_WIDTH) and not dim.outline_level:
+                        del sheet.column_dimensions[letter]
@@ -0,0 +1,59 @@
+#!/usr/bin/python
+# -*- coding: utf-8 -*-
+
+"""Шаблоны отчетов: книга .xlsx с готовыми параметрами печати, ширинами колонок, блоком шапки
+и именованными стилями. Шаблон разбирается один раз и хранится в памяти снимком книги openpyxl
+(pickle), каждый отчет получает из снимка свою независимую копию - это в десятки раз быстрее,
+чем читать файл заново
+"""
+
+import os
+import pickle
+import threading
+
+from openpyxl import load_workbook
+
+class XLSTemplate:
+    """Разобранный шаблон: source - путь к файлу .xlsx или поток, clone() - новая копия книги
+    """
+    def __init__(self, source):
+        wb = load_workbook(source)
+        self.sheet_names = wb.sheetnames
+        self._snapshot = pickle.dumps(wb, pickle.HIGHEST_PROTOCOL)
+
+    def clone(self):
+        wb = pickle.loads(self._snapshot)
+        for ws in wb.worksheets:
+            _restore_dimensions(ws)
+        return wb
+
+def _restore_dimensions(ws):
+    """Размеры строк и колонок листа (DimensionHolder, наследник defaultdict) pickle восстанавливает
+    только с фабрикой, переданной на место листа: новые строки и колонки не создаются
+    """
+    for holder, factory in ((ws.row_dimensions, ws._add_row), (ws.column_dimensions, ws._add_column)):
+        holder.worksheet = ws
+        holder.default_factory = factory
+
+_templates = dict() # абсолютный путь -> ((время изменения, размер файла), XLSTemplate)
+_templates_lock = threading.Lock()
+
+def load_template(path):
+    """XLSTemplate для файла path из кэша процесса; измененный файл разбирается заново
+    """
+    path = os.path.abspath(path)
+    st = os.stat(path)
+    key = (st.st_mtime_ns, st.st_size)
+    with _templates_lock:
+        entry = _templates.get(path)
+    if (entry is not None) and (entry[0] == key):
+        return entry[1]
+
+    template = XLSTemplate(path)
+    with _templates_lock:
+        _templates[path] = (key, template)
+    return template
+
+def clear_template_cache():
+    with _templates_lock:
+        _templates.clear()
@@ -2,15 +2,103 @@
 # -*- coding: utf-8 -*-
 
 import os
+import time
+import datetime
+from collections import namedtuple
+from zipfile import ZipFile, ZIP_STORED, ZIP_DEFLATED
 
-from openpyxl import Workbook, worksheet
+from openpyxl import Workbook
+from openpyxl.worksheet.worksheet import Worksheet
 
-def workbook_create():
-    wb = Workbook()
+from .xlsformula import XLSExcelWriter
+
+# сжатие ZIP при сохранении книги: (метод, уровень deflate; None - уровень zlib по умолчанию)
+ZIP_COMPRESSION = {
+    'stored':  (ZIP_STORED, None),   # без сжатия: быстрее всего, файл в несколько раз больше
+    'fast':    (ZIP_DEFLATED, 1),
+    'default': (ZIP_DEFLATED, None), # как в openpyxl
+    'best':    (ZIP_DEFLATED, 9),
+}
+
+SaveResult = namedtuple('SaveResult', 'bytes_written seconds')
+
+def workbook_create(write_only=False):
+    wb = Workbook(write_only=write_only)
     for i in wb.worksheets:
         wb.remove(i)
     return wb
 
+class _CountingWriter:
+    """Поток записи без произвольного доступа (канал, ответ HTTP) со счетчиком записанных байт
+    """
+    def __init__(self, stream):
+        self._stream = stream
+        self.bytes_written = 0
+
+    def write(self, data):
+        self._stream.write(data)
+        self.bytes_written += len(data)
+        return len(data)
+
+    def flush(self):
+        flush = getattr(self._stream, 'flush', None)
+        if flush is not None:
+            flush()
+
+def _zip_compression(compression):
+    """Метод и уровень сжатия по названию из ZIP_COMPRESSION или уровню deflate 0-9 (0 - без сжатия)
+    """
+    if isinstance(compression, int) and not isinstance(compression, bool):
+        assert 0 <= compression <= 9, "уровень сжатия должен быть от 0 до 9"
+        return (ZIP_STORED, None) if compression == 0 else (ZIP_DEFLATED, compression)
+    assert compression in ZIP_COMPRESSION, "неизвестное сжатие '{0!s}'".format(compression)
+    return ZIP_COMPRESSION[compression]
+
+def _seekable(stream):
+    try:
+        return stream.seekable()
+    except (AttributeError, OSError, ValueError):
+        return False
+
+def workbook_save(wb, target, compression='default', writer=None):
+    """Сохраняет книгу в target: путь к файлу, дескриптор открытого файла (int, не закрывается)
+    или поток записи, в том числе без произвольного доступа (канал, ответ HTTP). Архив пишется
+    в target по мере создания, без сборки в памяти. compression - название из ZIP_COMPRESSION
+    или уровень deflate 0-9. writer(wb, archive) - своя запись книги в открытый ZipFile (по
+    умолчанию класс writer_class книги либо XLSExcelWriter). Возвращает SaveResult: записано байт, секунд
+    """
+    start = time.perf_counter()
+    method, level = _zip_compression(compression)
+
+    if isinstance(target, int):
+        stream, own = os.fdopen(target, 'wb', closefd=False), True
+    elif isinstance(target, (str, bytes, os.PathLike)):
+        stream, own = open(target, 'wb'), True
+    else:
+        stream, own = target, False
+
+    try:
+        seekable = _seekable(stream)
+        out = stream if seekable else _CountingWriter(stream)
+        begin = stream.tell() if seekable else 0
+
+        if wb.write_only and not wb.worksheets:
+            wb.create_sheet()
+        wb.properties.modified = datetime.datetime.now(tz=datetime.timezone.utc).replace(tzinfo=None)
+
+        # книги с собственной записью листов (XLSDirectWorkbook) задают ее классом writer_class
+        if writer is None:
+            writer = getattr(wb, 'writer_class', XLSExcelWriter)
+        with ZipFile(out, 'w', method, allowZip64=True, compresslevel=level) as archive:
+            writer(wb, archive).write_data()
+
+        bytes_written = stream.tell() - begin if seekable else out.bytes_written
+        out.flush()
+    finally:
+        if own:
+            stream.close()
+    return SaveResult(bytes_written, time.perf_counter() - start)
+
 def sheet_create(wb, main_sheet_name):
     ws = wb.create_sheet( main_sheet_name )
     for i in range(len(wb.sheetnames)):
@@ -38,7 +126,7 @@ def sheet_print_setup(ws, porientation, pwidth):
     ws.sheet_properties.pageSetUpPr.fitToPage = True
     ws.page_setup.fitToHeight = False
 
-    worksheet.Worksheet.set_printer_settings(ws, paper_size = 1, orientation=porientation)
+    Worksheet.set_printer_settings(ws, paper_size = 1, orientation=porientation)
     ws.page_setup.fitToWidth = pwidth
     if pwidth == 2:
         ws.print_options.horizontalCentered = False
@@ -6,6 +6,9 @@ from copy import copy
 from openpyxl.worksheet.cell_range import CellRange
 from openpyxl.styles.borders import Border, Side
 from openpyxl.styles import Font, Color, Alignment, PatternFill
+from openpyxl.styles.cell_style import StyleArray
+
+from .xlsstyle import *
 
 def apply_cell(ws, start_row, start_col, f, **kwargs):
     f(ws, start_row, start_col, start_row, start_col, **kwargs)
@@ -37,91 +40,93 @@ def set_merge(ws, start_row, start_col, end_row, end_col):
                    end_row=end_row,     end_column=end_col)
     #  print("({0:d},{1:d}) - ({2:d},{3:d})".format(start_row, start_col, end_row, end_col))
 
+def _set_style_ids(ws, start_row, start_col, end_row, end_col, ids):
+    for r in range(start_row, end_row + 1):
+        for c in range(start_col, end_col + 1):
+            cell_set_style(ws.cell(row=r, column=c), ids)
+
+def set_style(ws, start_row, start_col, end_row, end_col,
+              font=None, fill=None, border=None, number_format=None, alignment=None):
+    """Назначает ячейкам сразу несколько компонентов стиля (объекты из style_* функций xlsstyle),
+    незаданные компоненты у ячеек не меняются
+    """
+    wb = ws.parent
+    if None in (font, fill, border, number_format, alignment):
+        _set_style_ids(ws, start_row, start_col, end_row, end_col,
+                       style_ids(wb, font, fill, border, number_format, alignment))
+        return
+
+    sa = style_array(wb, font, fill, border, number_format, alignment)
+    for r in range(start_row, end_row + 1):
+        for c in range(start_col, end_col + 1):
+            ws.cell(row=r, column=c)._style = copy(sa)
+
 def set_borders(ws, start_row, start_col, end_row, end_col, border_style='thin'):
     """
     """
-    side = Side(style=border_style)
-    new_border = Border(left=side, right=side, top=side, bottom=side)
-
-    for r in range( start_row, end_row + 1 ):
-        for c in range( start_col, end_col + 1 ):
-            ws.cell( row=r, column=c ).border = new_border
+    _set_style_ids(ws, start_row, start_col, end_row, end_col,
+                   style_ids(ws.parent, border=style_border(border_style)))
 
-def set_outline(ws, start_row, start_col, end_row, end_col, border_style='thin'):
+def set_outline(ws, start_row, start_col, end_row, end_col, border_style='thin',
+                sides=('left', 'right', 'top', 'bottom')):
     """
     """
+    wb = ws.parent
+
     def _apply_border(cl, side_name):
-        new_border = copy(cl.border)
-        getattr(new_border, side_name).border_style = border_style
-        cl.border = new_border
+        if cl._style is None:
+            cl._style = StyleArray()
+        cl._style.borderId = outline_border_id(wb, cl._style.borderId, side_name, border_style)
 
     for r in range(start_row, end_row + 1):
-        _apply_border(ws.cell(row=r, column=start_col), 'left')
-        _apply_border(ws.cell(row=r, column=end_col), 'right')
+        if 'left' in sides:
+            _apply_border(ws.cell(row=r, column=start_col), 'left')
+        if 'right' in sides:
+            _apply_border(ws.cell(row=r, column=end_col), 'right')
 
     for c in range(start_col, end_col + 1):
-        _apply_border(ws.cell(row=start_row, column=c), 'top')
-        _apply_border(ws.cell(row=end_row, column=c), 'bottom')
+        if 'top' in sides:
+            _apply_border(ws.cell(row=start_row, column=c), 'top')
+        if 'bottom' in sides:
+            _apply_border(ws.cell(row=end_row, column=c), 'bottom')
 
 def set_font(ws, start_row, start_col, end_row, end_col,
              name='Calibri', size=11, bold=False, italic=False, underline='none',
              vertAlign='baseline', strike=False, color='FF000000'):
     """https://openpyxl.readthedocs.io/en/2.5/styles.html
     """
-    new_font = Font(name=name, size=size, bold=bold, italic=italic, underline=underline,
-                    vertAlign=vertAlign, strike=strike, color=color)
-
-    for r in range(start_row, end_row + 1):
-        for c in range(start_col, end_col + 1):
-            ws.cell(row=r, column=c).font = new_font
+    new_font = style_font(name=name, size=size, bold=bold, italic=italic, underline=underline,
+                          vertAlign=vertAlign, strike=strike, color=color)
+    _set_style_ids(ws, start_row, start_col, end_row, end_col, style_ids(ws.parent, font=new_font))
 
 def set_alignment(ws, start_row, start_col, end_row, end_col,
                   horizontal='center', vertical='center', textRotation=None, wrapText=True,
                   shrinkToFit=True):
     """https://openpyxl.readthedocs.io/en/2.5/_modules/openpyxl/styles/alignment.html
     """
-    new_align = Alignment(horizontal=horizontal, vertical=vertical, textRotation=textRotation,
-                    wrapText=wrapText, shrinkToFit=shrinkToFit)
-
-    for r in range(start_row, end_row + 1):
-        for c in range(start_col, end_col + 1):
-            ws.cell(row=r, column=c).alignment = new_align
+    new_align = style_alignment(horizontal=horizontal, vertical=vertical, textRotation=textRotation,
+                                wrapText=wrapText, shrinkToFit=shrinkToFit)
+    _set_style_ids(ws, start_row, start_col, end_row, end_col, style_ids(ws.parent, alignment=new_align))
 
 def set_fill(ws, start_row, start_col, end_row, end_col,
             color='FFFFFF', fill_type='solid'):
     """Fills the cell background with color
     """
-    new_fill = PatternFill(start_color=color, end_color=color, fill_type=fill_type)
-
-    for r in range(start_row, end_row + 1):
-        for c in range(start_col, end_col + 1):
-            ws.cell(row=r, column=c).fill = new_fill
+    new_fill = style_fill(color=color, fill_type=fill_type)
+    _set_style_ids(ws, start_row, start_col, end_row, end_col, style_ids(ws.parent, fill=new_fill))
 
 def set_pattern_fill(ws, start_row, start_col, end_row, end_col,
             bg_color='FFFFFF', fg_color='000000', pattern_type='none'):
     """Fills the cell background with color
     """
-    # Цвет фона - bg, а штрихов на нем - fg, но при заливке 'solid' - цвет фона fg.
-    if pattern_type == 'solid':
-        new_fill = PatternFill(bgColor=fg_color, fgColor=bg_color, patternType=pattern_type)
-    else:
-        new_fill = PatternFill(bgColor=bg_color, fgColor=fg_color, patternType=pattern_type)
-
-    for r in range(start_row, end_row + 1):
-        for c in range(start_col, end_col + 1):
-            ws.cell(row=r, column=c).fill = new_fill
+    new_fill = style_pattern_fill(bg_color=bg_color, fg_color=fg_color, pattern_type=pattern_type)
+    _set_style_ids(ws, start_row, start_col, end_row, end_col, style_ids(ws.parent, fill=new_fill))
 
 def set_format(ws, start_row, start_col, end_row, end_col,
             format=''):
     """
     """
-    if format == 'int':         new_format = '# ### ### ###'
-    elif format == '1digit':    new_format = '#,#0.0'
-    elif format == 'currency':  new_format = '#,##0.00'
-    elif format == '3digit':    new_format = '#,###0.000'
-    elif format == 'date':      new_format = 'DD.MM.YYYY'
-    else: return
+    new_format = style_number_format(format)
+    if new_format is None: return
 
-    for r in range(start_row, end_row + 1):
-        for c in range(start_col, end_col + 1):
-            ws.cell(row=r, column=c).number_format = new_format
+    _set_style_ids(ws, start_row, start_col, end_row, end_col, style_ids(ws.parent, number_format=new_format))